@@ -1,12 +1,22 @@
 import streamlit as st
 
-from utils.image_io import cv2_to_pil, pil_to_bytes, load_image_from_upload
+from processing.cache import get_result_cache
+from utils.image_io import DOWNLOAD_FORMATS, load_image_to_store
 from utils.state_manager import (
+    can_redo,
+    can_undo,
+    get_cached_download,
+    get_memory_report,
     get_original_image,
+    get_preview,
     get_processed_image,
     init_state,
+    is_current_upload,
+    prepare_download,
+    redo,
     reset_to_original,
     set_original_image,
+    undo,
 )
 
 
@@ -40,12 +50,12 @@ def main() -> None:
         if uploaded_file.type == "video/mp4":
             st.warning("Video processing is not supported yet.")
             return
-        else:
-            image = load_image_from_upload(uploaded_file)
+        elif not is_current_upload(uploaded_file.file_id):
+            image = load_image_to_store(uploaded_file)
             if image is None:
                 st.error("Failed to read image. The file might be corrupted.")
             else:
-                set_original_image(image)
+                set_original_image(image, upload_id=uploaded_file.file_id)
 
     original = get_original_image()
     processed = get_processed_image()
@@ -61,19 +71,29 @@ def main() -> None:
 
     with col1:
         st.markdown("**Before (Original Image)**")
-        st.image(original, width='stretch')
+        st.image(get_preview(original), width='stretch')
 
     with col2:
         st.markdown("**After (Latest Processed Result)**")
         if processed is not None:
-            st.image(processed, width='stretch')
+            st.image(get_preview(processed), width='stretch')
         else:
             st.info("No processing operation has been applied yet from the sidebar pages.")
 
     st.markdown("---")
     st.subheader("General Tools")
 
-    col_reset, col_download = st.columns(2)
+    col_undo, col_redo, col_reset, col_download = st.columns(4)
+
+    with col_undo:
+        if st.button("Undo", disabled=not can_undo()):
+            undo()
+            st.rerun()
+
+    with col_redo:
+        if st.button("Redo", disabled=not can_redo()):
+            redo()
+            st.rerun()
 
     with col_reset:
         if st.button("Reset to Original Image"):
@@ -82,17 +102,46 @@ def main() -> None:
 
     with col_download:
         if processed is not None:
-            pil_img = cv2_to_pil(processed)
-            img_bytes = pil_to_bytes(pil_img, format="PNG")
-            st.download_button(
-                label="Download Processed Image",
-                data=img_bytes,
-                file_name="processed_image.png",
-                mime="image/png",
-            )
+            with st.expander("Download options"):
+                download_format = st.selectbox("Format", list(DOWNLOAD_FORMATS))
+                if download_format == "PNG":
+                    options = {"compress_level": st.slider("PNG compression (0 = fastest)", 0, 9, 6)}
+                elif download_format == "JPEG":
+                    options = {"quality": st.slider("JPEG quality", 1, 100, 90)}
+                else:
+                    lossless = st.checkbox("Lossless WebP")
+                    options = {"quality": st.slider("WebP quality", 1, 100, 90), "lossless": lossless}
+
+            # Encoding a large image is slow, so it only happens when asked
+            # for, and the bytes are reused until the image or settings change.
+            img_bytes = get_cached_download(download_format, **options)
+            if img_bytes is None and st.button("Prepare Download"):
+                img_bytes = prepare_download(download_format, **options)
+            if img_bytes is not None:
+                extension, mime = DOWNLOAD_FORMATS[download_format]
+                st.download_button(
+                    label="Download Processed Image",
+                    data=img_bytes,
+                    file_name=f"processed_image.{extension}",
+                    mime=mime,
+                )
         else:
             st.caption("Download button will appear after applying at least one processing operation.")
 
+    stats = get_result_cache().stats()
+    st.caption(
+        f"Result cache: {stats['hits']} hits, {stats['misses']} misses, "
+        f"{stats['bytes'] / (1024 * 1024):.1f} MB of {stats['max_bytes'] / (1024 * 1024):.0f} MB used"
+    )
+
+    memory = get_memory_report()
+    st.caption(
+        f"Memory: this session {memory['session_bytes'] / (1024 * 1024):.1f} MB, "
+        f"{memory['sessions']} sessions and result cache {memory['total_bytes'] / (1024 * 1024):.1f} MB "
+        f"of {memory['budget_bytes'] / (1024 * 1024):.0f} MB budget "
+        f"({memory['spilled_sessions']} spilled to disk)"
+    )
+
 
 if __name__ == "__main__":
     main()
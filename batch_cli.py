@@ -0,0 +1,262 @@
+"""
+Headless batch runner for the processing operations.
+
+Applies any function from the processing package to every image in a
+directory tree, without going through the Streamlit pages.
+
+Example:
+    python batch_cli.py photos/ out/ --op filtering.apply_gaussian_blur --param kernel_size=5
+
+A whole chain of operations can be given as a JSON recipe instead
+(see processing.pipeline.Recipe.to_dict for the format):
+    python batch_cli.py photos/ out/ --recipe edges.json
+
+Outputs keep the source file name including its extension, e.g.
+photos/a.jpg becomes out/a.jpg.png, so a.jpg and a.png in the same folder
+do not overwrite each other.
+
+Completed files are recorded in a manifest inside the output directory,
+so running the same command again after an interruption only processes
+the images that are still missing.
+"""
+
+import argparse
+import ast
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from processing.batch import default_worker_count
+from processing.pipeline import Recipe, Step, resolve_operation
+from utils.image_io import cv2_to_pil, load_image_from_upload, pil_to_bytes
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".bmp", ".tif", ".tiff"}
+MANIFEST_NAME = "manifest.jsonl"
+STAGES = ("decode", "process", "encode", "write")
+# Values assumed for manifest fields written by older versions of this tool.
+MANIFEST_DEFAULTS = {"reduce": 1}
+
+
+def parse_params(items: List[str]) -> Dict[str, Any]:
+    """
+    Parse "key=value" strings. Values are read as Python literals when
+    possible (numbers, booleans, tuples) and kept as strings otherwise.
+    """
+    params: Dict[str, Any] = {}
+    for item in items:
+        key, sep, raw = item.partition("=")
+        if not sep:
+            raise ValueError(f"Parameter must look like key=value, got: {item}")
+        try:
+            params[key] = ast.literal_eval(raw)
+        except (ValueError, SyntaxError):
+            params[key] = raw
+    # Parameters are stored in the manifest, so they must be valid JSON.
+    try:
+        json.dumps(params)
+    except (TypeError, ValueError) as exc:
+        raise ValueError(f"Parameters must be JSON values (numbers, strings, lists, ...): {exc}") from exc
+    return params
+
+
+def find_images(input_dir: str, exclude_dir: Optional[str] = None) -> List[str]:
+    """
+    List image files below input_dir as sorted paths relative to it.
+    Files below exclude_dir (e.g. an output directory inside input_dir)
+    are skipped.
+    """
+    excluded = os.path.realpath(exclude_dir) if exclude_dir is not None else None
+    found: List[str] = []
+    for root, dirs, files in os.walk(input_dir):
+        dirs[:] = sorted(name for name in dirs if os.path.realpath(os.path.join(root, name)) != excluded)
+        for filename in sorted(files):
+            if os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS:
+                found.append(os.path.relpath(os.path.join(root, filename), input_dir))
+    return found
+
+
+def open_manifest(path: str):
+    """
+    Open the manifest for appending. If a crash left a partial last line,
+    new entries start on a line of their own so they are not lost with it.
+    """
+    partial_line = False
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        with open(path, "rb") as handle:
+            handle.seek(-1, os.SEEK_END)
+            partial_line = handle.read(1) != b"\n"
+    manifest = open(path, "a", encoding="utf-8")
+    if partial_line:
+        manifest.write("\n")
+        manifest.flush()
+    return manifest
+
+
+def load_manifest(path: str, signature: Dict[str, Any]) -> Set[str]:
+    """
+    Return the source files already completed with the same operation,
+    parameters, output format and decode size. Lines that are not
+    complete entries, such as a partially written last line from a crash,
+    are ignored.
+    """
+    done: Set[str] = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as handle:
+        for line in handle:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if not isinstance(entry, dict) or not isinstance(entry.get("source"), str):
+                continue
+            if all(entry.get(key, MANIFEST_DEFAULTS.get(key)) == value for key, value in signature.items()):
+                done.add(entry["source"])
+    return done
+
+
+class BatchRun:
+    """
+    State shared by the worker threads of one CLI run.
+    """
+
+    def __init__(self, args: argparse.Namespace, recipe: Recipe, signature: Dict[str, Any]):
+        self.args = args
+        self.recipe = recipe
+        # Compare in the form the manifest stores (e.g. tuples become lists).
+        self.signature = json.loads(json.dumps(dict(signature, format=args.format.lower(), reduce=args.reduce)))
+        self.lock = threading.Lock()
+        self.timings = {stage: 0.0 for stage in STAGES}
+        self.step_timings: Dict[str, float] = {}
+        self.completed = 0
+        self.failed: List[Tuple[str, str]] = []
+        self.pil_format = "JPEG" if args.format.lower() == "jpg" else args.format.upper()
+        self.manifest = open_manifest(os.path.join(args.output_dir, MANIFEST_NAME))
+
+    def output_path(self, source: str) -> str:
+        # The source extension stays in the name, so a.jpg and a.png map
+        # to different outputs.
+        return os.path.join(self.args.output_dir, f"{source}.{self.args.format.lower()}")
+
+    def process_file(self, source: str) -> None:
+        timings = {}
+        try:
+            start = time.perf_counter()
+            with open(os.path.join(self.args.input_dir, source), "rb") as handle:
+                image = load_image_from_upload(handle, reduce_factor=self.args.reduce)
+            if image is None:
+                raise ValueError("could not decode image")
+            timings["decode"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            result, step_timings = self.recipe.run_with_timings(image)
+            timings["process"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            data = pil_to_bytes(cv2_to_pil(result), format=self.pil_format)
+            timings["encode"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            target = self.output_path(source)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            # Write to a temporary name first so an interrupted run never
+            # leaves a truncated file that looks finished.
+            temporary = f"{target}.partial"
+            with open(temporary, "wb") as handle:
+                handle.write(data)
+            os.replace(temporary, target)
+            timings["write"] = time.perf_counter() - start
+        except Exception as exc:
+            with self.lock:
+                self.failed.append((source, str(exc)))
+            return
+
+        entry = dict(self.signature, source=source, output=os.path.relpath(target, self.args.output_dir))
+        with self.lock:
+            for stage, seconds in timings.items():
+                self.timings[stage] += seconds
+            for step_name, seconds in step_timings:
+                self.step_timings[step_name] = self.step_timings.get(step_name, 0.0) + seconds
+            self.completed += 1
+            self.manifest.write(json.dumps(entry) + "\n")
+            self.manifest.flush()
+
+    def close(self) -> None:
+        self.manifest.close()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Apply a processing operation to a directory of images.")
+    parser.add_argument("input_dir", help="directory that contains the source images")
+    parser.add_argument("output_dir", help="directory that receives the processed images")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--op", help="operation as module.function, e.g. basic.to_grayscale")
+    source.add_argument("--recipe", help="JSON file describing a chain of operations")
+    parser.add_argument(
+        "--param",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="keyword argument for the operation (repeatable)",
+    )
+    parser.add_argument("--workers", type=int, default=default_worker_count(), help="number of worker threads")
+    parser.add_argument("--format", default="png", help="output image format (png, jpeg, webp, ...)")
+    parser.add_argument(
+        "--reduce",
+        type=int,
+        choices=(1, 2, 4, 8),
+        default=1,
+        help="decode images at 1/N size, e.g. for thumbnails (fast for JPEG)",
+    )
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        if args.recipe:
+            with open(args.recipe, "r", encoding="utf-8") as handle:
+                recipe = Recipe.from_dict(json.load(handle))
+            signature = {"recipe": recipe.to_dict()}
+        else:
+            params = parse_params(args.param)
+            recipe = Recipe([Step(resolve_operation(args.op), params)])
+            signature = {"op": args.op, "params": params}
+    except (ImportError, OSError, TypeError, ValueError, KeyError) as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return 2
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    run = BatchRun(args, recipe, signature)
+    sources = find_images(args.input_dir, exclude_dir=args.output_dir)
+    done = load_manifest(os.path.join(args.output_dir, MANIFEST_NAME), run.signature)
+    pending = [source for source in sources if source not in done]
+    print(f"{len(sources)} images found, {len(sources) - len(pending)} already done, {len(pending)} to process")
+
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+            list(executor.map(run.process_file, pending))
+    finally:
+        run.close()
+    elapsed = time.perf_counter() - start
+
+    print(f"Processed {run.completed} images in {elapsed:.2f}s ({run.completed / max(elapsed, 1e-9):.1f} images/s)")
+    for stage in STAGES:
+        per_image = run.timings[stage] / max(run.completed, 1)
+        print(f"  {stage:<8} {run.timings[stage]:8.2f}s total  {per_image * 1000:8.1f} ms/image")
+    if len(run.step_timings) > 1:
+        print("Processing steps:")
+        for step_name, seconds in run.step_timings.items():
+            print(f"  {step_name:<40} {seconds / max(run.completed, 1) * 1000:8.1f} ms/image")
+    for source, message in run.failed:
+        print(f"failed: {source}: {message}", file=sys.stderr)
+    return 1 if run.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
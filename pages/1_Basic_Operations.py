@@ -1,12 +1,19 @@
 import streamlit as st
 
 from processing.basic import invert_image, to_grayscale
+from processing.cache import run_cached
+from processing.pipeline import Step
 from utils.state_manager import (
+    can_redo,
+    can_undo,
     get_original_image,
+    get_preview,
     get_processed_image,
     init_state,
+    redo,
     reset_to_original,
     set_processed_image,
+    undo,
 )
 
 
@@ -35,21 +42,31 @@ def main() -> None:
 
     with col_buttons1:
         if st.button("Convert to Grayscale"):
-            result = to_grayscale(working_image)
-            set_processed_image(result)
+            result = run_cached(to_grayscale, working_image)
+            set_processed_image(result, step=Step(to_grayscale))
             processed = get_processed_image()
 
     with col_buttons2:
         if st.button("Invert Colors (Negative)"):
-            result = invert_image(working_image)
-            set_processed_image(result)
+            result = run_cached(invert_image, working_image)
+            set_processed_image(result, step=Step(invert_image))
             processed = get_processed_image()
 
     st.markdown("---")
     st.markdown("### Global Tools")
-    if st.button("Reset to Original Image"):
-        reset_to_original()
-        st.rerun()
+    col_undo, col_redo, col_reset = st.columns(3)
+    with col_undo:
+        if st.button("Undo", disabled=not can_undo()):
+            undo()
+            st.rerun()
+    with col_redo:
+        if st.button("Redo", disabled=not can_redo()):
+            redo()
+            st.rerun()
+    with col_reset:
+        if st.button("Reset to Original Image"):
+            reset_to_original()
+            st.rerun()
 
     st.markdown("---")
     st.markdown("### Preview Result")
@@ -57,11 +74,11 @@ def main() -> None:
     col1, col2 = st.columns(2)
     with col1:
         st.markdown("**Before**")
-        st.image(original, width='stretch')
+        st.image(get_preview(original), width='stretch')
     with col2:
         st.markdown("**After**")
         if processed is not None:
-            st.image(processed, width='stretch')
+            st.image(get_preview(processed), width='stretch')
         else:
             st.info("No operation has been applied yet. Choose an operation from above.")
 
@@ -1,16 +1,29 @@
 import streamlit as st
 
+from processing.cache import run_cached
 from processing.filtering import (
     apply_average_blur,
+    apply_bilateral_grid,
     apply_gaussian_blur,
+    apply_guided_filter,
     apply_median_blur,
+    gaussian_blur_strategy,
 )
+from processing.pipeline import Step
+from processing.proxy import scale_kernel_size
+from processing.tiling import parallel_median_blur
 from utils.state_manager import (
+    can_redo,
+    can_undo,
     get_original_image,
+    get_preview,
+    get_preview_image,
     get_processed_image,
     init_state,
+    redo,
     reset_to_original,
     set_processed_image,
+    undo,
 )
 
 
@@ -21,7 +34,7 @@ def main() -> None:
     init_state()
 
     st.title("2 - Filtering (Smoothing and Noise Reduction)")
-    st.write("Apply Gaussian, Median, and Average filters with kernel size control.")
+    st.write("Apply Gaussian, Median, and Average filters with kernel size control, or edge-preserving guided and bilateral filters.")
 
     original = get_original_image()
     processed = get_processed_image()
@@ -36,12 +49,40 @@ def main() -> None:
     kernel_size = st.slider(
         "Kernel Size (odd number)",
         min_value=1,
-        max_value=21,
+        max_value=401,
         step=2,
         value=5,
     )
 
     st.caption("Kernel size must be an odd number for some filters to work correctly.")
+    if gaussian_blur_strategy(kernel_size) != "direct":
+        st.caption(
+            f"Gaussian blur with this kernel uses the fast '{gaussian_blur_strategy(kernel_size)}' "
+            "approximation (within a few gray levels of the exact result)."
+        )
+
+    st.markdown("### Live Preview")
+    # The preview runs on a small proxy of the image, so moving the slider
+    # stays fast even for very large images. The buttons below apply the
+    # filter at full resolution.
+    preview_name = st.selectbox(
+        "Preview a filter while moving the slider",
+        ["Off", "Gaussian Blur", "Median Blur", "Average Blur"],
+    )
+    if preview_name != "Off":
+        preview_filters = {
+            "Gaussian Blur": (apply_gaussian_blur, 1),
+            "Median Blur": (apply_median_blur, 3),
+            "Average Blur": (apply_average_blur, 1),
+        }
+        preview_filter, minimum_size = preview_filters[preview_name]
+        proxy, factor = get_preview_image()
+        proxy_kernel = scale_kernel_size(kernel_size, factor, minimum=minimum_size)
+        st.image(
+            get_preview(run_cached(preview_filter, proxy, proxy_kernel)),
+            caption=f"Preview at 1/{factor} resolution (kernel {proxy_kernel} on the preview)",
+            width='stretch',
+        )
 
     st.markdown("### Choose Filter Type")
 
@@ -49,8 +90,8 @@ def main() -> None:
 
     with col1:
         if st.button("Gaussian Blur"):
-            result = apply_gaussian_blur(working_image, kernel_size)
-            set_processed_image(result)
+            result = run_cached(apply_gaussian_blur, working_image, kernel_size)
+            set_processed_image(result, step=Step(apply_gaussian_blur, {"kernel_size": kernel_size}))
             processed = get_processed_image()
 
     with col2:
@@ -59,21 +100,54 @@ def main() -> None:
             if kernel_size < 3:
                 st.warning("Median filter requires kernel size greater than 1. Choose 3 or larger.")
             else:
-                result = apply_median_blur(working_image, kernel_size)
-                set_processed_image(result)
+                result = run_cached(parallel_median_blur, working_image, kernel_size)
+                set_processed_image(result, step=Step(apply_median_blur, {"kernel_size": kernel_size}))
                 processed = get_processed_image()
 
     with col3:
         if st.button("Average Blur"):
-            result = apply_average_blur(working_image, kernel_size)
-            set_processed_image(result)
+            result = run_cached(apply_average_blur, working_image, kernel_size)
+            set_processed_image(result, step=Step(apply_average_blur, {"kernel_size": kernel_size}))
+            processed = get_processed_image()
+
+    st.markdown("### Edge-Preserving Filters")
+    st.caption("These filters smooth flat regions but keep edges sharp. Their speed does not depend on the radius.")
+
+    col_guided, col_bilateral = st.columns(2)
+
+    with col_guided:
+        radius = st.slider("Guided filter radius", min_value=1, max_value=64, value=8)
+        eps = st.select_slider("Guided filter eps (edge threshold)", options=[0.0001, 0.001, 0.01, 0.05, 0.1], value=0.01)
+        if st.button("Guided Filter"):
+            result = run_cached(apply_guided_filter, working_image, radius, eps)
+            set_processed_image(result, step=Step(apply_guided_filter, {"radius": radius, "eps": eps}))
+            processed = get_processed_image()
+
+    with col_bilateral:
+        sigma_space = st.slider("Bilateral spatial sigma (pixels)", min_value=4, max_value=64, value=8)
+        sigma_color = st.slider("Bilateral color sigma (gray levels)", min_value=10, max_value=100, value=30)
+        if st.button("Bilateral Filter (fast grid)"):
+            result = run_cached(apply_bilateral_grid, working_image, sigma_space, sigma_color)
+            set_processed_image(
+                result, step=Step(apply_bilateral_grid, {"sigma_space": sigma_space, "sigma_color": sigma_color})
+            )
             processed = get_processed_image()
 
     st.markdown("---")
     st.markdown("### Global Tools")
-    if st.button("Reset to Original Image"):
-        reset_to_original()
-        st.rerun()
+    col_undo, col_redo, col_reset = st.columns(3)
+    with col_undo:
+        if st.button("Undo", disabled=not can_undo()):
+            undo()
+            st.rerun()
+    with col_redo:
+        if st.button("Redo", disabled=not can_redo()):
+            redo()
+            st.rerun()
+    with col_reset:
+        if st.button("Reset to Original Image"):
+            reset_to_original()
+            st.rerun()
 
     st.markdown("---")
     st.markdown("### Preview Result")
@@ -81,11 +155,11 @@ def main() -> None:
     col_before, col_after = st.columns(2)
     with col_before:
         st.markdown("**Before**")
-        st.image(original, width='stretch')
+        st.image(get_preview(original), width='stretch')
     with col_after:
         st.markdown("**After**")
         if processed is not None:
-            st.image(processed, width='stretch')
+            st.image(get_preview(processed), width='stretch')
         else:
             st.info("No filter has been applied yet. Choose a filter from above.")
 
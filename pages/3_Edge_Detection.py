@@ -1,12 +1,20 @@
 import streamlit as st
 
+from processing.cache import run_cached
 from processing.edges import canny_edges, laplacian_edges, sobel_edges
+from processing.pipeline import Step
 from utils.state_manager import (
+    can_redo,
+    can_undo,
+    get_derived_plane,
     get_original_image,
+    get_preview,
     get_processed_image,
     init_state,
+    redo,
     reset_to_original,
     set_processed_image,
+    undo,
 )
 
 
@@ -26,8 +34,6 @@ def main() -> None:
         st.warning("Please go back to the main page and upload an image first.")
         return
 
-    working_image = processed if processed is not None else original
-
     st.markdown("### Canny Settings")
     col_t1, col_t2 = st.columns(2)
     with col_t1:
@@ -41,27 +47,38 @@ def main() -> None:
 
     with col1:
         if st.button("Sobel"):
-            result = sobel_edges(working_image)
-            set_processed_image(result)
+            gradients = (get_derived_plane("sobel_x"), get_derived_plane("sobel_y"))
+            result = run_cached(sobel_edges, get_derived_plane("gray"), gradients=gradients)
+            set_processed_image(result, step=Step(sobel_edges))
             processed = get_processed_image()
 
     with col2:
         if st.button("Laplacian"):
-            result = laplacian_edges(working_image)
-            set_processed_image(result)
+            result = run_cached(laplacian_edges, get_derived_plane("gray"))
+            set_processed_image(result, step=Step(laplacian_edges))
             processed = get_processed_image()
 
     with col3:
         if st.button("Canny"):
-            result = canny_edges(working_image, threshold1, threshold2)
-            set_processed_image(result)
+            result = run_cached(canny_edges, get_derived_plane("gray"), threshold1, threshold2)
+            set_processed_image(result, step=Step(canny_edges, {"threshold1": threshold1, "threshold2": threshold2}))
             processed = get_processed_image()
 
     st.markdown("---")
     st.markdown("### Global Tools")
-    if st.button("Reset to Original Image"):
-        reset_to_original()
-        st.rerun()
+    col_undo, col_redo, col_reset = st.columns(3)
+    with col_undo:
+        if st.button("Undo", disabled=not can_undo()):
+            undo()
+            st.rerun()
+    with col_redo:
+        if st.button("Redo", disabled=not can_redo()):
+            redo()
+            st.rerun()
+    with col_reset:
+        if st.button("Reset to Original Image"):
+            reset_to_original()
+            st.rerun()
 
     st.markdown("---")
     st.markdown("### Preview Result")
@@ -69,11 +86,11 @@ def main() -> None:
     col_before, col_after = st.columns(2)
     with col_before:
         st.markdown("**Before**")
-        st.image(original, width='stretch')
+        st.image(get_preview(original), width='stretch')
     with col_after:
         st.markdown("**After**")
         if processed is not None:
-            st.image(processed, width='stretch')
+            st.image(get_preview(processed), width='stretch')
         else:
             st.info("No operation has been applied yet. Choose a filter from above.")
 
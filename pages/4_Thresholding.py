@@ -1,16 +1,26 @@
 import streamlit as st
 
+from processing.cache import run_cached
+from processing.pipeline import Step
+from processing.proxy import scale_kernel_size
 from processing.thresholding import (
     adaptive_gaussian_threshold,
     adaptive_mean_threshold,
     global_threshold,
 )
 from utils.state_manager import (
+    can_redo,
+    can_undo,
+    get_derived_plane,
     get_original_image,
+    get_preview,
+    get_preview_image,
     get_processed_image,
     init_state,
+    redo,
     reset_to_original,
     set_processed_image,
+    undo,
 )
 
 
@@ -30,8 +40,6 @@ def main() -> None:
         st.warning("Please go back to the main page and upload an image first.")
         return
 
-    working_image = processed if processed is not None else original
-
     st.markdown("### Global Threshold Settings")
     global_thresh = st.slider("Threshold Value (Global Threshold)", 0, 255, 127)
 
@@ -45,33 +53,61 @@ def main() -> None:
     )
     c_value = st.slider("C Value (subtracted from mean)", -20, 20, 2)
 
+    st.markdown("### Live Preview")
+    # The preview runs on a small grayscale proxy of the image; the buttons
+    # below apply the threshold at full resolution.
+    preview_name = st.selectbox(
+        "Preview a threshold while moving the sliders",
+        ["Off", "Global Threshold", "Adaptive Mean", "Adaptive Gaussian"],
+    )
+    if preview_name != "Off":
+        proxy, factor = get_preview_image(gray=True)
+        proxy_block = scale_kernel_size(block_size, factor, minimum=3)
+        if preview_name == "Global Threshold":
+            preview = run_cached(global_threshold, proxy, global_thresh)
+        elif preview_name == "Adaptive Mean":
+            preview = run_cached(adaptive_mean_threshold, proxy, proxy_block, c_value)
+        else:
+            preview = run_cached(adaptive_gaussian_threshold, proxy, proxy_block, c_value)
+        st.image(get_preview(preview), caption=f"Preview at 1/{factor} resolution", width='stretch')
+
     st.markdown("### Choose Threshold Type")
 
     col1, col2, col3 = st.columns(3)
 
     with col1:
         if st.button("Global Threshold"):
-            result = global_threshold(working_image, global_thresh)
-            set_processed_image(result)
+            result = run_cached(global_threshold, get_derived_plane("gray"), global_thresh)
+            set_processed_image(result, step=Step(global_threshold, {"thresh_value": global_thresh}))
             processed = get_processed_image()
 
     with col2:
         if st.button("Adaptive Mean"):
-            result = adaptive_mean_threshold(working_image, block_size, c_value)
-            set_processed_image(result)
+            result = run_cached(adaptive_mean_threshold, get_derived_plane("gray"), block_size, c_value)
+            set_processed_image(result, step=Step(adaptive_mean_threshold, {"block_size": block_size, "c": c_value}))
             processed = get_processed_image()
 
     with col3:
         if st.button("Adaptive Gaussian"):
-            result = adaptive_gaussian_threshold(working_image, block_size, c_value)
-            set_processed_image(result)
+            result = run_cached(adaptive_gaussian_threshold, get_derived_plane("gray"), block_size, c_value)
+            set_processed_image(result, step=Step(adaptive_gaussian_threshold, {"block_size": block_size, "c": c_value}))
             processed = get_processed_image()
 
     st.markdown("---")
     st.markdown("### Global Tools")
-    if st.button("Reset to Original Image"):
-        reset_to_original()
-        st.rerun()
+    col_undo, col_redo, col_reset = st.columns(3)
+    with col_undo:
+        if st.button("Undo", disabled=not can_undo()):
+            undo()
+            st.rerun()
+    with col_redo:
+        if st.button("Redo", disabled=not can_redo()):
+            redo()
+            st.rerun()
+    with col_reset:
+        if st.button("Reset to Original Image"):
+            reset_to_original()
+            st.rerun()
 
     st.markdown("---")
     st.markdown("### Preview Result")
@@ -79,11 +115,11 @@ def main() -> None:
     col_before, col_after = st.columns(2)
     with col_before:
         st.markdown("**Before**")
-        st.image(original, width='stretch')
+        st.image(get_preview(original), width='stretch')
     with col_after:
         st.markdown("**After**")
         if processed is not None:
-            st.image(processed, width='stretch')
+            st.image(get_preview(processed), width='stretch')
         else:
             st.info("No operation has been applied yet. Choose a threshold type from above.")
 
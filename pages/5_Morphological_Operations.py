@@ -1,12 +1,21 @@
 import streamlit as st
 
+from processing.cache import run_cached
 from processing.morphology import closing, dilate, erode, opening
+from processing.pipeline import Step
+from processing.proxy import scale_kernel_size
 from utils.state_manager import (
+    can_redo,
+    can_undo,
     get_original_image,
+    get_preview,
+    get_preview_image,
     get_processed_image,
     init_state,
+    redo,
     reset_to_original,
     set_processed_image,
+    undo,
 )
 
 
@@ -17,7 +26,7 @@ def main() -> None:
     init_state()
 
     st.title("5 - Morphological Operations")
-    st.write("Apply Erosion, Dilation, Opening, and Closing using a simple kernel.")
+    st.write("Apply Erosion, Dilation, Opening, and Closing with a structuring element of your choice.")
 
     original = get_original_image()
     processed = get_processed_image()
@@ -30,11 +39,39 @@ def main() -> None:
 
     st.markdown("### Kernel and Iterations Settings")
 
-    col_k, col_it = st.columns(2)
+    shapes = {
+        "Rectangle": "rect",
+        "Ellipse": "ellipse",
+        "Cross": "cross",
+        "Horizontal line": "hline",
+        "Vertical line": "vline",
+    }
+    col_shape, col_k, col_it = st.columns(3)
+    with col_shape:
+        shape = shapes[st.selectbox("Kernel Shape", list(shapes))]
     with col_k:
-        kernel_size = st.slider("Kernel Size", min_value=1, max_value=21, value=3, step=2)
+        # Large elements stay fast, see processing/morphology.py.
+        kernel_size = st.slider("Kernel Size", min_value=1, max_value=151, value=3, step=2)
     with col_it:
         iterations = st.slider("Number of Iterations", min_value=1, max_value=5, value=1)
+    params = {"kernel_size": kernel_size, "iterations": iterations, "shape": shape}
+
+    st.markdown("### Live Preview")
+    # The preview runs on a small proxy of the image with the kernel scaled
+    # down to match; the buttons below apply the operation at full resolution.
+    preview_name = st.selectbox(
+        "Preview an operation while moving the sliders",
+        ["Off", "Erosion", "Dilation", "Opening", "Closing"],
+    )
+    if preview_name != "Off":
+        preview_operations = {"Erosion": erode, "Dilation": dilate, "Opening": opening, "Closing": closing}
+        proxy, factor = get_preview_image()
+        proxy_kernel = scale_kernel_size(kernel_size, factor)
+        st.image(
+            get_preview(run_cached(preview_operations[preview_name], proxy, proxy_kernel, iterations, shape)),
+            caption=f"Preview at 1/{factor} resolution (kernel {proxy_kernel} on the preview)",
+            width='stretch',
+        )
 
     st.markdown("### Choose Operation")
 
@@ -42,33 +79,43 @@ def main() -> None:
 
     with col1:
         if st.button("Erosion"):
-            result = erode(working_image, kernel_size, iterations)
-            set_processed_image(result)
+            result = run_cached(erode, working_image, **params)
+            set_processed_image(result, step=Step(erode, params))
             processed = get_processed_image()
 
     with col2:
         if st.button("Dilation"):
-            result = dilate(working_image, kernel_size, iterations)
-            set_processed_image(result)
+            result = run_cached(dilate, working_image, **params)
+            set_processed_image(result, step=Step(dilate, params))
             processed = get_processed_image()
 
     with col3:
         if st.button("Opening"):
-            result = opening(working_image, kernel_size, iterations)
-            set_processed_image(result)
+            result = run_cached(opening, working_image, **params)
+            set_processed_image(result, step=Step(opening, params))
             processed = get_processed_image()
 
     with col4:
         if st.button("Closing"):
-            result = closing(working_image, kernel_size, iterations)
-            set_processed_image(result)
+            result = run_cached(closing, working_image, **params)
+            set_processed_image(result, step=Step(closing, params))
             processed = get_processed_image()
 
     st.markdown("---")
     st.markdown("### Global Tools")
-    if st.button("Reset to Original Image"):
-        reset_to_original()
-        st.rerun()
+    col_undo, col_redo, col_reset = st.columns(3)
+    with col_undo:
+        if st.button("Undo", disabled=not can_undo()):
+            undo()
+            st.rerun()
+    with col_redo:
+        if st.button("Redo", disabled=not can_redo()):
+            redo()
+            st.rerun()
+    with col_reset:
+        if st.button("Reset to Original Image"):
+            reset_to_original()
+            st.rerun()
 
     st.markdown("---")
     st.markdown("### Preview Result")
@@ -76,11 +123,11 @@ def main() -> None:
     col_before, col_after = st.columns(2)
     with col_before:
         st.markdown("**Before**")
-        st.image(original, width='stretch')
+        st.image(get_preview(original), width='stretch')
     with col_after:
         st.markdown("**After**")
         if processed is not None:
-            st.image(processed, width='stretch')
+            st.image(get_preview(processed), width='stretch')
         else:
             st.info("No operation has been applied yet. Choose an operation from above.")
 
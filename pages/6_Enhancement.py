@@ -1,12 +1,27 @@
 import streamlit as st
 import matplotlib.pyplot as plt
-from processing.enhancement import histogram_equalization, sharpen_image, show_histogram
+from processing.cache import run_cached
+from processing.channels import is_gray
+from processing.convolution import convolution_strategy, parse_kernel
+from processing.enhancement import (
+    histogram_equalization,
+    sharpen_image,
+    show_histogram,
+    unsharp_mask_kernel,
+)
+from processing.pipeline import Step
 from utils.state_manager import (
+    can_redo,
+    can_undo,
+    get_derived_plane,
     get_original_image,
+    get_preview,
     get_processed_image,
     init_state,
+    redo,
     reset_to_original,
     set_processed_image,
+    undo,
 )
 
 
@@ -34,8 +49,9 @@ def main() -> None:
 
     with col1:
         if st.button("Histogram Equalization"):
-            result = histogram_equalization(working_image)
-            set_processed_image(result)
+            ycrcb = None if is_gray(working_image) else get_derived_plane("ycrcb")
+            result = run_cached(histogram_equalization, working_image, ycrcb=ycrcb)
+            set_processed_image(result, step=Step(histogram_equalization))
             processed = get_processed_image()
             
     with col2:
@@ -44,8 +60,12 @@ def main() -> None:
             
             fig, ax = plt.subplots(figsize=(10, 5))
             
-            colors = ('b', 'g', 'r')
-            labels = ('Blue', 'Green', 'Red')
+            if len(histograms) == 1:
+                colors = ('k',)
+                labels = ('Gray',)
+            else:
+                colors = ('b', 'g', 'r')
+                labels = ('Blue', 'Green', 'Red')
             
             for i, hist in enumerate(histograms):
                 ax.plot(hist, color=colors[i], label=labels[i])
@@ -61,15 +81,53 @@ def main() -> None:
 
     with col3:
         if st.button("Sharpening"):
-            result = sharpen_image(working_image)
-            set_processed_image(result)
+            result = run_cached(sharpen_image, working_image)
+            set_processed_image(result, step=Step(sharpen_image))
+            processed = get_processed_image()
+
+    st.markdown("### Sharpening with a Custom Kernel")
+    kernel_source = st.radio("Kernel", ["Unsharp mask", "Custom kernel"], horizontal=True)
+    kernel = None
+    if kernel_source == "Unsharp mask":
+        kernel_size = st.slider("Unsharp mask kernel size (odd)", min_value=3, max_value=101, value=9, step=2)
+        amount = st.slider("Amount", min_value=0.1, max_value=3.0, value=1.0, step=0.1)
+        kernel = unsharp_mask_kernel(kernel_size, amount)
+    else:
+        text = st.text_area(
+            "Kernel values (one row per line, separated by spaces or commas)",
+            value="0 -1 0\n-1 5 -1\n0 -1 0",
+        )
+        try:
+            kernel = parse_kernel(text)
+        except ValueError as exc:
+            st.error(str(exc))
+
+    if kernel is not None:
+        # Large kernels are applied as separable passes or through the DFT.
+        strategy = convolution_strategy(working_image.shape, kernel)
+        st.caption(f"{kernel.shape[0]}x{kernel.shape[1]} kernel, applied with the {strategy} strategy.")
+        if st.button("Apply Kernel"):
+            # Nested lists keep the recorded step JSON-friendly.
+            kernel_list = kernel.tolist()
+            result = run_cached(sharpen_image, working_image, kernel_list)
+            set_processed_image(result, step=Step(sharpen_image, {"kernel": kernel_list}))
             processed = get_processed_image()
 
     st.markdown("---")
     st.markdown("### Global Tools")
-    if st.button("Reset to Original Image"):
-        reset_to_original()
-        st.rerun()
+    col_undo, col_redo, col_reset = st.columns(3)
+    with col_undo:
+        if st.button("Undo", disabled=not can_undo()):
+            undo()
+            st.rerun()
+    with col_redo:
+        if st.button("Redo", disabled=not can_redo()):
+            redo()
+            st.rerun()
+    with col_reset:
+        if st.button("Reset to Original Image"):
+            reset_to_original()
+            st.rerun()
 
     st.markdown("---")
     st.markdown("### Preview Result")
@@ -77,11 +135,11 @@ def main() -> None:
     col_before, col_after = st.columns(2)
     with col_before:
         st.markdown("**Before**")
-        st.image(original, width='stretch')
+        st.image(get_preview(original), width='stretch')
     with col_after:
         st.markdown("**After**")
         if processed is not None:
-            st.image(processed, width='stretch')
+            st.image(get_preview(processed), width='stretch')
         else:
             st.info("No operation has been applied yet. Choose an operation from above.")
 
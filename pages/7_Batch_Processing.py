@@ -1,17 +1,27 @@
+import json
+import tempfile
+import zipfile
+from functools import partial
+
 import streamlit as st
 
 from processing.basic import to_grayscale
-from processing.batch import apply_to_batch, pair_original_and_processed
+from processing.batch import stream_batch
+from processing.edges import canny_edges
 from processing.filtering import apply_gaussian_blur
-from utils.image_io import load_image_from_upload
+from processing.morphology import closing
+from processing.pipeline import Recipe
+from utils.image_io import make_preview
+from utils.state_manager import get_recorded_recipe, init_state
 
 
 def main() -> None:
     """
     Page for simple batch processing on multiple images.
-    This page does not use the global session_state images
-    to keep the logic easy to understand.
+    This page does not use the global session_state images, but it can
+    replay the chain of operations recorded on the other pages.
     """
+    init_state()
     st.title("7 - Batch Processing")
     st.write(
         "Apply the same operation to multiple images at once.\n"
@@ -28,46 +38,86 @@ def main() -> None:
         st.info("No images have been selected yet.")
         return
 
-    operation_name = st.selectbox(
-        "Choose the operation to apply to all images",
-        ["Grayscale", "Gaussian Blur (k=5)"],
-    )
-
-    originals = []
-    for f in uploaded_files:
-        img = load_image_from_upload(f)
-        if img is not None:
-            originals.append(img)
-
-    if len(originals) == 0:
-        st.error("Failed to read any of the uploaded images.")
-        return
-
-    if operation_name == "Grayscale":
-        processed_list = apply_to_batch(originals, to_grayscale)
+    options = ["Grayscale", "Gaussian Blur (k=5)", "Edge Map (Grayscale → Blur → Canny → Closing)"]
+    recorded = get_recorded_recipe()
+    replay_option = None
+    if recorded is not None:
+        # The operations applied on the other pages, in the order they were applied.
+        replay_option = f"Replay recorded chain ({len(recorded)} steps)"
+        options.insert(0, replay_option)
+
+    operation_name = st.selectbox("Choose the operation to apply to all images", options)
+
+    if operation_name == replay_option:
+        operation = recorded
+        st.caption(" → ".join(repr(step) for step in recorded.steps))
+        st.download_button(
+            label="Download recipe (JSON)",
+            data=json.dumps(recorded.to_dict(), indent=2),
+            file_name="recipe.json",
+            mime="application/json",
+            help="Run the same chain headlessly with: python batch_cli.py --recipe recipe.json",
+        )
+    elif operation_name == "Grayscale":
+        operation = to_grayscale
+    elif operation_name == "Gaussian Blur (k=5)":
+        operation = partial(apply_gaussian_blur, kernel_size=5)
     else:
-        processed_list = apply_to_batch(
-            originals,
-            lambda im: apply_gaussian_blur(im, 5),
+        operation = (
+            Recipe()
+            .add(to_grayscale)
+            .add(apply_gaussian_blur, kernel_size=5)
+            .add(canny_edges, threshold1=100, threshold2=200)
+            .add(closing, kernel_size=3, iterations=1)
         )
 
-    pairs = pair_original_and_processed(originals, processed_list)
+    # Smaller sizes decode much faster (JPEGs are scaled inside the decoder),
+    # which is handy for a quick look at a large batch.
+    resolutions = {"Full resolution": 1, "1/2": 2, "1/4": 4, "1/8 (fastest preview)": 8}
+    resolution = st.selectbox("Resolution", list(resolutions))
 
     st.markdown("---")
     st.markdown("### Preview Results for Each Image")
 
-    for idx, (orig, proc) in enumerate(pairs, start=1):
-        st.markdown(f"#### Image {idx}")
-        col1, col2 = st.columns(2)
-        with col1:
-            st.markdown("**Before**")
-            st.image(orig, width='stretch')
-        with col2:
-            st.markdown("**After**")
-            st.image(proc, width='stretch')
-
+    # Images are decoded, processed and encoded one after another as a
+    # stream, so only a few of them are held in memory at the same time.
+    # The encoded results go straight into a zip file on disk instead of
+    # one download button (and one in-memory copy) per image. The file is
+    # closed even if processing fails or Streamlit stops the script.
+    with tempfile.TemporaryFile() as archive_file:
+        succeeded = 0
+        with zipfile.ZipFile(archive_file, "w", compression=zipfile.ZIP_STORED) as archive:
+            for item in stream_batch(uploaded_files, operation, reduce_factor=resolutions[resolution]):
+                st.markdown(f"#### Image {item.index + 1}")
+                if item.error is not None:
+                    st.warning(f"{item.name} could not be processed: {item.error}")
+                    continue
+
+                succeeded += 1
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.markdown("**Before**")
+                    st.image(make_preview(item.original), width='stretch')
+                with col2:
+                    st.markdown("**After**")
+                    st.image(make_preview(item.processed), width='stretch')
+                # PNG data is already compressed, so it is stored as is.
+                archive.writestr(f"processed_{item.index + 1}.png", item.encoded)
+
+        if succeeded == 0:
+            st.error("Failed to read any of the uploaded images.")
+            return
+
+        archive_file.seek(0)
+        st.markdown("---")
+        # Streamlit reads the whole archive into memory to serve the
+        # download, so this holds one copy of the zip (not one per image).
+        st.download_button(
+            label=f"Download all results (ZIP, {succeeded} images)",
+            data=archive_file,
+            file_name="processed_images.zip",
+            mime="application/zip",
+        )
 
 if __name__ == "__main__":
     main()
-
-
@@ -2,21 +2,23 @@
 Basic pixel-level operations.
 
 Each function here performs exactly one simple operation on the input image.
-All images are expected to be NumPy arrays in RGB format.
+Images are NumPy arrays, either RGB (H, W, 3) or single-channel
+grayscale (H, W); see processing/channels.py.
 """
 
 import cv2
 import numpy as np
 
+from processing.channels import as_gray
+
 
 def to_grayscale(image: np.ndarray) -> np.ndarray:
     """
-    Convert an RGB image to grayscale and then back to RGB so that
-    it can be displayed side-by-side with the original.
+    Convert an RGB image to a single-channel grayscale image.
+    Grayscale input is returned unchanged.
     """
-    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-    gray_rgb = cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB)
-    return gray_rgb
+    gray = as_gray(image)
+    return gray
 
 
 def invert_image(image: np.ndarray) -> np.ndarray:
@@ -27,3 +29,33 @@ def invert_image(image: np.ndarray) -> np.ndarray:
     return inverted
 
 
+def to_grayscale_batch(images: np.ndarray) -> np.ndarray:
+    """
+    Batched version of to_grayscale for a stack of same-shaped images with
+    shape (N, H, W, 3) or (N, H, W).
+
+    The stack is viewed as one tall (N * H, W, 3) image so OpenCV converts
+    all images in a single call. The result is identical to calling
+    to_grayscale on every image.
+    """
+    if images.ndim == 3:
+        return images
+    n, h, w = images.shape[:3]
+    tall = np.ascontiguousarray(images).reshape(n * h, w, 3)
+    gray = cv2.cvtColor(tall, cv2.COLOR_RGB2GRAY)
+    return gray.reshape(n, h, w)
+
+
+def invert_batch(images: np.ndarray) -> np.ndarray:
+    """
+    Batched version of invert_image for a stack of same-shaped images.
+    """
+    inverted = 255 - images
+    return inverted
+
+
+def invert_lut() -> np.ndarray:
+    """
+    Lookup table equivalent of invert_image for 8-bit images.
+    """
+    return (255 - np.arange(256)).astype(np.uint8)
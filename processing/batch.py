@@ -1,33 +1,188 @@
 """
-Simple helpers for batch image processing.
+Helpers for batch image processing.
 
-At this stage we only implement a small set of basic batch operations
-to keep the code easy to understand.
+apply_to_batch runs one operation over a list of images (on stacked
+arrays, a thread pool or a process pool), and stream_batch decodes,
+processes and encodes uploaded files as a pipeline with bounded memory.
 """
 
-from typing import Callable, List, Tuple
+import os
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 
 import numpy as np
 
+from processing.basic import invert_batch, invert_image, to_grayscale, to_grayscale_batch
+from processing.shared_batch import get_shared_pool
+from processing.thresholding import global_threshold, global_threshold_batch
+from utils.image_io import cv2_to_pil, load_image_from_upload, pil_to_bytes
+
+# Batches smaller than this are processed sequentially, because starting
+# worker threads costs more than it saves for a handful of images.
+MIN_PARALLEL_BATCH = 4
+
+# Pixel-wise operations that also have a stacked implementation working on
+# an (N, H, W[, C]) array. Each entry maps the per-image function to
+# (stacked function, whether the images must be grayscale or RGB).
+BATCHED_OPERATIONS = {
+    invert_image: (invert_batch, False),
+    to_grayscale: (to_grayscale_batch, True),
+    global_threshold: (global_threshold_batch, True),
+}
+
+# Upper bound for the size of one stacked array.
+STACK_BYTES = 64 * 1024 * 1024
+
+
+def default_worker_count() -> int:
+    """
+    Number of workers used when the caller does not specify one.
+    """
+    return os.cpu_count() or 1
+
+
+def _run_safely(
+    operation: Callable[[np.ndarray], np.ndarray],
+    image: np.ndarray,
+) -> Tuple[Optional[np.ndarray], Optional[Exception]]:
+    """
+    Run the operation on one image and capture any exception instead of
+    letting it abort the whole batch.
+    """
+    try:
+        return operation(image), None
+    except Exception as exc:
+        return None, exc
+
+
+def _find_stacked_operation(
+    operation: Callable[[np.ndarray], np.ndarray],
+) -> Optional[Tuple[Callable[[np.ndarray], np.ndarray], bool]]:
+    """
+    Look up the stacked implementation of an operation, if there is one.
+    functools.partial objects are unwrapped so that e.g.
+    partial(global_threshold, thresh_value=127) is recognized.
+    """
+    func, args, kwargs = operation, (), {}
+    if isinstance(operation, partial):
+        func, args, kwargs = operation.func, operation.args, operation.keywords
+    entry = BATCHED_OPERATIONS.get(func)
+    if entry is None:
+        return None
+    batched, needs_gray_or_rgb = entry
+    return partial(batched, *args, **kwargs), needs_gray_or_rgb
+
+
+def _apply_stacked(
+    images: List[np.ndarray],
+    batched: Callable[[np.ndarray], np.ndarray],
+    needs_gray_or_rgb: bool,
+    results: List[Optional[np.ndarray]],
+) -> List[int]:
+    """
+    Run a stacked operation over every group of same-shaped images.
+
+    Images are grouped by shape and dtype, stacked into contiguous arrays
+    of at most STACK_BYTES and processed in one call per stack. Returns
+    the indices that still have to be processed one by one (singletons,
+    unsupported shapes, or stacks whose batched call failed).
+    """
+    groups: Dict[Tuple, List[int]] = {}
+    leftover: List[int] = []
+    for index, image in enumerate(images):
+        gray_or_rgb = image.ndim == 2 or (image.ndim == 3 and image.shape[2] == 3)
+        if needs_gray_or_rgb and not gray_or_rgb:
+            leftover.append(index)
+        else:
+            groups.setdefault((image.shape, image.dtype.str), []).append(index)
+
+    for indices in groups.values():
+        if len(indices) < 2:
+            leftover.extend(indices)
+            continue
+        per_stack = max(1, STACK_BYTES // max(images[indices[0]].nbytes, 1))
+        for start in range(0, len(indices), per_stack):
+            chunk = indices[start:start + per_stack]
+            try:
+                stacked = batched(np.stack([images[i] for i in chunk]))
+            except Exception:
+                leftover.extend(chunk)
+                continue
+            # Copy each result out of the stack: a view would keep the
+            # whole stack alive while memory accounting only sees the view.
+            for position, index in enumerate(chunk):
+                results[index] = stacked[position].copy()
+            del stacked
+
+    return sorted(leftover)
+
 
 def apply_to_batch(
     images: List[np.ndarray],
     operation: Callable[[np.ndarray], np.ndarray],
-) -> List[np.ndarray]:
+    max_workers: Optional[int] = None,
+    errors: Optional[Dict[int, Exception]] = None,
+    backend: str = "threads",
+) -> List[Optional[np.ndarray]]:
     """
     Apply the same single-argument operation to a list of images.
 
+    Pixel-wise operations listed in BATCHED_OPERATIONS are first applied
+    to stacks of same-shaped images in one call each, which removes the
+    per-call overhead that dominates for small images.
+
+    The remaining images are processed on a thread pool. OpenCV releases
+    the GIL inside its heavy functions, so threads scale well for most
+    operations. Operations that hold the GIL can use backend="processes",
+    which runs them in worker processes and moves the images through
+    shared memory (see processing.shared_batch). Small batches (or
+    max_workers=1) fall back to a plain loop.
+
     Args:
         images: list of RGB images as NumPy arrays.
         operation: function that takes one image and returns a processed image.
+        max_workers: number of worker threads (defaults to the CPU count).
+        errors: optional dict that receives {index: exception} for every
+            image whose operation failed.
+        backend: "threads" or "processes". The processes backend needs a
+            picklable operation (not a lambda).
 
     Returns:
-        List of processed images in the same order.
+        List of processed images in the same order. Images whose operation
+        raised an exception are returned as None.
     """
-    results: List[np.ndarray] = []
-    for img in images:
-        processed = operation(img)
-        results.append(processed)
+    if backend not in ("threads", "processes"):
+        raise ValueError(f"Unknown batch backend: {backend}")
+
+    results: List[Optional[np.ndarray]] = [None] * len(images)
+    pending = list(range(len(images)))
+
+    stacked_operation = _find_stacked_operation(operation)
+    if stacked_operation is not None:
+        pending = _apply_stacked(images, *stacked_operation, results)
+
+    remaining = [images[i] for i in pending]
+    workers = max_workers if max_workers is not None else default_worker_count()
+    workers = max(1, min(workers, len(remaining)))
+    parallel = workers > 1 and len(remaining) >= MIN_PARALLEL_BATCH
+
+    if backend == "processes" and parallel:
+        pool_errors: Dict[int, Exception] = {}
+        processed = get_shared_pool(max_workers).map(remaining, operation, pool_errors)
+        outcomes = [(image, pool_errors.get(position)) for position, image in enumerate(processed)]
+    elif parallel:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            outcomes = list(executor.map(lambda img: _run_safely(operation, img), remaining))
+    else:
+        outcomes = [_run_safely(operation, img) for img in remaining]
+
+    for index, (processed_image, exc) in zip(pending, outcomes):
+        if exc is not None and errors is not None:
+            errors[index] = exc
+        results[index] = processed_image
     return results
 
 
@@ -44,3 +199,171 @@ def pair_original_and_processed(
     return pairs
 
 
+class StreamItem(NamedTuple):
+    """
+    One finished image produced by stream_batch.
+    """
+
+    index: int
+    name: str
+    original: Optional[np.ndarray]
+    processed: Optional[np.ndarray]
+    encoded: Optional[bytes]
+    error: Optional[Exception]
+
+
+# Marks the end of the stream inside the stage queues.
+_END = object()
+
+
+def _put(target: queue.Queue, item, stop: threading.Event) -> bool:
+    """
+    Put an item on a bounded queue, giving up if the pipeline was stopped.
+    """
+    while not stop.is_set():
+        try:
+            target.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _resolve(item):
+    """
+    Wait for an item that may still be running on the worker pool.
+    """
+    return item.result() if isinstance(item, Future) else item
+
+
+def _run_stage(
+    source: queue.Queue,
+    target: queue.Queue,
+    work,
+    stop: threading.Event,
+    executor: Optional[ThreadPoolExecutor] = None,
+) -> None:
+    """
+    Move items from source to target, transforming each one with work.
+
+    With an executor, work is submitted to the pool and its future is
+    passed on, so several items are processed at the same time while the
+    queue keeps them in their original order.
+    """
+    while not stop.is_set():
+        try:
+            item = source.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if item is _END:
+            _put(target, _END, stop)
+            return
+        item = _resolve(item)
+        result = executor.submit(work, item) if executor is not None else work(item)
+        if not _put(target, result, stop):
+            return
+
+
+def stream_batch(
+    uploads: Iterable,
+    operation: Callable[[np.ndarray], np.ndarray],
+    encode_format: str = "PNG",
+    queue_size: int = 4,
+    max_workers: Optional[int] = None,
+    reduce_factor: int = 1,
+) -> Iterator[StreamItem]:
+    """
+    Decode, process and encode uploaded files as a streaming pipeline.
+
+    The three stages are connected by bounded queues, so decoding of the
+    next file overlaps processing and encoding of the previous ones. The
+    work of each stage runs on a shared thread pool, so several images
+    are processed at once, but results are still yielded in upload order.
+    Each of the three queues holds at most max(queue_size, worker count)
+    items (pending or finished), so at most about three times that many
+    images are alive at any time, no matter how many files are submitted.
+
+    Args:
+        uploads: iterable of file-like objects (e.g. Streamlit uploads).
+        operation: function that takes one image and returns a processed
+            image (a plain function, a partial or a Recipe).
+        encode_format: Pillow format used to encode the processed images.
+        queue_size: capacity of each queue between stages; it is raised
+            to the worker count so that every worker can be kept busy.
+        max_workers: size of the thread pool (defaults to the CPU count);
+            1 runs every stage on its own single thread.
+        reduce_factor: decode the images at 1/reduce_factor of their size
+            (1, 2, 4 or 8; see utils.image_io.load_image_from_upload).
+
+    Yields:
+        StreamItem objects in the same order as the uploads.
+    """
+    workers_count = max_workers or default_worker_count()
+    # Each queue must hold enough futures to keep every worker busy.
+    capacity = max(queue_size, workers_count)
+    stop = threading.Event()
+    decoded: queue.Queue = queue.Queue(maxsize=capacity)
+    processed: queue.Queue = queue.Queue(maxsize=capacity)
+    finished: queue.Queue = queue.Queue(maxsize=capacity)
+    executor = ThreadPoolExecutor(max_workers=workers_count) if workers_count > 1 else None
+
+    def decode_one(index: int, upload) -> StreamItem:
+        name = getattr(upload, "name", f"image_{index + 1}")
+        try:
+            image = load_image_from_upload(upload, reduce_factor=reduce_factor)
+        except Exception as exc:
+            return StreamItem(index, name, None, None, None, exc)
+        error = None if image is not None else ValueError(f"Could not decode {name}")
+        return StreamItem(index, name, image, None, None, error)
+
+    def decode_all() -> None:
+        try:
+            for index, upload in enumerate(uploads):
+                if executor is not None:
+                    item = executor.submit(decode_one, index, upload)
+                else:
+                    item = decode_one(index, upload)
+                if not _put(decoded, item, stop):
+                    return
+        finally:
+            _put(decoded, _END, stop)
+
+    def process_one(item: StreamItem) -> StreamItem:
+        if item.error is not None:
+            return item
+        result, exc = _run_safely(operation, item.original)
+        return item._replace(processed=result, error=exc)
+
+    def encode_one(item: StreamItem) -> StreamItem:
+        if item.error is not None:
+            return item
+        try:
+            data = pil_to_bytes(cv2_to_pil(item.processed), format=encode_format)
+        except Exception as exc:
+            return item._replace(error=exc)
+        return item._replace(encoded=data)
+
+    workers = [
+        threading.Thread(target=decode_all, daemon=True),
+        threading.Thread(
+            target=_run_stage, args=(decoded, processed, process_one, stop, executor), daemon=True
+        ),
+        threading.Thread(
+            target=_run_stage, args=(processed, finished, encode_one, stop, executor), daemon=True
+        ),
+    ]
+    for worker in workers:
+        worker.start()
+
+    try:
+        while True:
+            item = finished.get()
+            if item is _END:
+                break
+            yield _resolve(item)
+    finally:
+        stop.set()
+        for worker in workers:
+            worker.join()
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,312 @@
+"""
+In-memory result cache for processing operations.
+
+Results are keyed by a digest of the input image plus the operation name
+and its parameters, so repeating an operation on the same image (for
+example toggling a filter back and forth) returns the stored result instead
+of recomputing it. The cache is bounded by the total number of bytes it
+holds and evicts the least recently used results first.
+
+Cached arrays are shared between callers, so they are stored and returned
+as read-only arrays.
+
+When a disk cache is configured (see utils.image_io.get_disk_cache),
+run_cached also looks results up there and stores new results in it, so
+they survive server restarts and are shared between server processes.
+"""
+
+import hashlib
+import mmap
+import threading
+import types
+import weakref
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.image_io import get_disk_cache
+
+DEFAULT_CACHE_BYTES = 512 * 1024 * 1024
+
+# Helpers from these packages are part of an operation's code fingerprint.
+PROJECT_PACKAGES = ("processing", "utils")
+
+# Digests of immutable arrays (see _is_immutable), keyed by id(). They cannot
+# change, so hashing them once is enough. Entries are dropped when the array dies.
+_digest_memo: Dict[int, Tuple[weakref.ref, str]] = {}
+_digest_lock = threading.Lock()
+
+
+def _hash_array(image: np.ndarray) -> str:
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(f"{image.shape}|{image.dtype.str}|".encode())
+    hasher.update(memoryview(np.ascontiguousarray(image)).cast("B"))
+    return hasher.hexdigest()
+
+
+def _is_immutable(image: np.ndarray) -> bool:
+    """
+    True if the pixels of the array cannot change: it is read-only and so is
+    everything it is a view of. A read-only view of a writable array still
+    changes when the array is written to.
+    """
+    current = image
+    while isinstance(current, np.ndarray):
+        if current.flags.writeable:
+            return False
+        current = current.base
+    if isinstance(current, memoryview):
+        return current.readonly
+    # None (the array owns its data), bytes, or a memory-mapped file from
+    # the content-addressed image store, which is never written again.
+    return current is None or isinstance(current, (bytes, mmap.mmap))
+
+
+def image_digest(image: np.ndarray) -> str:
+    """
+    Return a content digest of the image (pixels, shape and dtype).
+    The digest of an immutable array is computed only once.
+    """
+    if not _is_immutable(image):
+        return _hash_array(image)
+
+    key = id(image)
+    with _digest_lock:
+        memo = _digest_memo.get(key)
+        if memo is not None and memo[0]() is image:
+            return memo[1]
+
+    digest = _hash_array(image)
+
+    def _forget(_ref, key=key):
+        with _digest_lock:
+            if _digest_memo.get(key, (None,))[0] is _ref:
+                del _digest_memo[key]
+
+    with _digest_lock:
+        _digest_memo[key] = (weakref.ref(image, _forget), digest)
+    return digest
+
+
+def _const_text(value) -> str:
+    """
+    Stable text form of a code constant. repr() is not used for nested code
+    objects (it contains their memory address) or for frozensets (their
+    order depends on the hash seed of the process).
+    """
+    if isinstance(value, types.CodeType):
+        return "code(" + _code_text(value) + ")"
+    if isinstance(value, (tuple, list)):
+        return "(" + ",".join(_const_text(item) for item in value) + ")"
+    if isinstance(value, frozenset):
+        return "frozenset(" + ",".join(sorted(_const_text(item) for item in value)) + ")"
+    return repr(value)
+
+
+def _code_text(code: types.CodeType) -> str:
+    return code.co_code.hex() + "|" + ",".join(code.co_names) + "|" + _const_text(code.co_consts)
+
+
+def _global_names(code: types.CodeType):
+    """
+    All global names used by the code, including nested functions,
+    comprehensions and generator expressions.
+    """
+    yield from code.co_names
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            yield from _global_names(const)
+
+
+def _fingerprint_parts(function: Callable, parts: list, seen: set) -> None:
+    """
+    Collect the code of a function and of the helpers it calls that are
+    defined in this project, plus simple module-level constants it reads.
+    """
+    function = getattr(function, "func", function)  # functools.partial
+    code = getattr(function, "__code__", None)
+    if code is None or function in seen:
+        return
+    seen.add(function)
+    parts.append(_code_text(code))
+    namespace = getattr(function, "__globals__", {})
+    for name in sorted(set(_global_names(code))):
+        value = namespace.get(name)
+        value = getattr(value, "__wrapped__", value)  # lru_cache and other decorators
+        if isinstance(value, (bool, int, float, str, tuple)):
+            parts.append(f"{name}={_const_text(value)}")
+        elif isinstance(value, types.FunctionType) and value.__module__.split(".")[0] in PROJECT_PACKAGES:
+            _fingerprint_parts(value, parts, seen)
+
+
+@lru_cache(maxsize=None)
+def _code_fingerprint(operation: Callable) -> str:
+    """
+    Short hash of the operation's bytecode and of the project helpers it
+    calls, so that results cached on disk by an older version of a
+    function are not reused after it (or a helper) changes. The hash is the
+    same in every process, so the disk cache is shared across restarts.
+    """
+    parts: list = []
+    _fingerprint_parts(operation, parts, set())
+    if not parts:
+        return ""
+    hasher = hashlib.blake2b(digest_size=4)
+    for part in parts:
+        hasher.update(part.encode())
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+def _param_repr(value) -> str:
+    """
+    Text form of one parameter for the cache key. Arrays (e.g. precomputed
+    planes) are represented by their digest, since repr() abbreviates them.
+    """
+    if isinstance(value, np.ndarray):
+        return f"array:{image_digest(value)}"
+    if isinstance(value, (tuple, list)):
+        return "(" + ",".join(_param_repr(item) for item in value) + ")"
+    return repr(value)
+
+
+def operation_key(operation: Callable, image: np.ndarray, args: tuple, kwargs: dict) -> str:
+    """
+    Build the cache key for calling operation(image, *args, **kwargs).
+    """
+    name = f"{operation.__module__}.{getattr(operation, '__qualname__', repr(operation))}"
+    params = _param_repr(args) + _param_repr(sorted(kwargs.items()))
+    return f"{image_digest(image)}:{name}@{_code_fingerprint(operation)}:{params}"
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache of result arrays, bounded by total bytes.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """
+        Return the cached result for key, or None on a miss.
+        """
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key: str, result: np.ndarray) -> None:
+        """
+        Store a result, evicting least recently used entries if needed.
+        Results larger than the whole cache are not stored.
+        """
+        if result.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous.nbytes
+            self._entries[key] = result
+            self.current_bytes += result.nbytes
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted.nbytes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def arrays(self) -> List[np.ndarray]:
+        """
+        Snapshot of the cached result arrays.
+        """
+        with self._lock:
+            return list(self._entries.values())
+
+    def discard(self, arrays: List[np.ndarray]) -> None:
+        """
+        Remove every entry whose result is one of the given arrays.
+        """
+        targets = {id(array) for array in arrays}
+        with self._lock:
+            for key in [key for key, result in self._entries.items() if id(result) in targets]:
+                self.current_bytes -= self._entries.pop(key).nbytes
+
+    def evict_oldest(self) -> Optional[np.ndarray]:
+        """
+        Remove and return the least recently used result, or None if empty.
+        """
+        with self._lock:
+            if not self._entries:
+                return None
+            _, result = self._entries.popitem(last=False)
+            self.current_bytes -= result.nbytes
+            return result
+
+    def stats(self) -> dict:
+        """
+        Return hit/miss counters and current usage.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+_result_cache = ResultCache()
+
+
+def get_result_cache() -> ResultCache:
+    """
+    Return the process-wide result cache shared by all sessions.
+    """
+    return _result_cache
+
+
+def run_cached(operation: Callable, image: np.ndarray, *args, **kwargs) -> np.ndarray:
+    """
+    Call operation(image, *args, **kwargs), reusing a cached result when
+    the same image was already processed with the same parameters.
+    The returned array is read-only.
+    """
+    cache = get_result_cache()
+    disk_cache = get_disk_cache()
+    key = operation_key(operation, image, args, kwargs)
+    result = cache.get(key)
+    if result is not None:
+        return result
+
+    if disk_cache is not None:
+        result = disk_cache.get(key)
+        if result is not None:
+            cache.put(key, result)
+            return result
+
+    result = operation(image, *args, **kwargs)
+    if np.may_share_memory(result, image):
+        # The operation returned its input (or a view of it), e.g.
+        # to_grayscale on a gray image. Freeze a view or a copy, never the
+        # caller's own array, and do not cache pixels the caller can change.
+        result = result.view() if _is_immutable(image) else result.copy()
+    result.flags.writeable = False
+    cache.put(key, result)
+    if disk_cache is not None:
+        disk_cache.put(key, result)
+    return result
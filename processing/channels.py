@@ -0,0 +1,109 @@
+"""
+Helpers for channel-aware images.
+
+Images are plain NumPy arrays: a 2-D array (H, W) is a single-channel
+grayscale image and a 3-D array (H, W, 3) is an RGB image. Operations that
+produce grayscale results return them as single-channel arrays, and
+operations that work on intensity accept both layouts. Conversions
+therefore happen only when they are really needed, instead of going
+gray -> RGB -> gray between every two steps.
+"""
+
+import cv2
+import numpy as np
+
+from processing.proxy import build_proxy
+
+
+def is_gray(image: np.ndarray) -> bool:
+    """
+    True for single-channel images, (H, W) or (H, W, 1).
+    """
+    return image.ndim == 2 or (image.ndim == 3 and image.shape[2] == 1)
+
+
+def as_gray(image: np.ndarray) -> np.ndarray:
+    """
+    Return the image as a 2-D grayscale array.
+    Single-channel input is returned as is, without a copy.
+    """
+    if image.ndim == 2:
+        return image
+    if image.shape[2] == 1:
+        return image[:, :, 0]
+    if image.shape[2] == 4:
+        return cv2.cvtColor(image, cv2.COLOR_RGBA2GRAY)
+    return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+
+
+def as_rgb(image: np.ndarray) -> np.ndarray:
+    """
+    Return the image as a 3-channel RGB array, expanding grayscale input.
+    RGB input is returned as is, without a copy.
+    """
+    if is_gray(image):
+        return cv2.cvtColor(as_gray(image), cv2.COLOR_GRAY2RGB)
+    return image
+
+
+def _ycrcb_plane(planes: "DerivedPlanes") -> np.ndarray:
+    return cv2.cvtColor(as_rgb(planes.image), cv2.COLOR_RGB2YCrCb)
+
+
+def _gradient_depth(gray: np.ndarray) -> int:
+    # 16-bit integers hold the exact 3x3 Sobel response of 8-bit input
+    # at a quarter of the memory of float64.
+    return cv2.CV_16S if gray.dtype == np.uint8 else cv2.CV_64F
+
+
+def _sobel_x_plane(planes: "DerivedPlanes") -> np.ndarray:
+    gray = planes.get("gray")
+    return cv2.Sobel(gray, _gradient_depth(gray), 1, 0, ksize=3)
+
+
+def _sobel_y_plane(planes: "DerivedPlanes") -> np.ndarray:
+    gray = planes.get("gray")
+    return cv2.Sobel(gray, _gradient_depth(gray), 0, 1, ksize=3)
+
+
+class DerivedPlanes:
+    """
+    Lazily computed representations derived from one image, such as its
+    grayscale version, YCrCb planes, Sobel gradients or a low-resolution
+    proxy.
+
+    Each plane is computed the first time it is requested and then reused,
+    so trying several operations on the same image pays for each
+    conversion only once. The planes are read-only.
+    """
+
+    FACTORIES = {
+        "gray": lambda planes: as_gray(planes.image),
+        "ycrcb": _ycrcb_plane,
+        "sobel_x": _sobel_x_plane,
+        "sobel_y": _sobel_y_plane,
+        # Downscaled pyramid level used for interactive previews.
+        "proxy": lambda planes: build_proxy(planes.image),
+        "proxy_gray": lambda planes: as_gray(planes.get("proxy")),
+    }
+
+    def __init__(self, image: np.ndarray):
+        self.image = image
+        self._planes = {}
+
+    def get(self, name: str) -> np.ndarray:
+        if name not in self._planes:
+            if name not in self.FACTORIES:
+                raise KeyError(f"Unknown derived plane: {name}")
+            plane = self.FACTORIES[name](self)
+            if plane is not self.image:
+                plane.flags.writeable = False
+            self._planes[name] = plane
+        return self._planes[name]
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Memory held by the computed planes (not counting the image itself).
+        """
+        return sum(plane.nbytes for plane in self._planes.values() if plane is not self.image)
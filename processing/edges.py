@@ -2,41 +2,55 @@
 Edge detection operations.
 """
 
+from typing import Optional, Tuple
+
 import cv2
 import numpy as np
 
+from processing.channels import as_gray
+
 
-def sobel_edges(image: np.ndarray) -> np.ndarray:
+def sobel_edges(
+    image: np.ndarray,
+    gradients: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+) -> np.ndarray:
     """
     Detect edges using the Sobel operator in both x and y directions.
+    The result is a single-channel image.
+
+    Precomputed (x, y) gradients of the image can be passed to skip the
+    Sobel passes (see processing.channels.DerivedPlanes).
     """
-    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-    sobelx = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3)
-    sobely = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3)
+    if gradients is None:
+        gray = as_gray(image)
+        gradients = (
+            cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3),
+            cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3),
+        )
+    sobelx, sobely = (np.asarray(g, dtype=np.float64) for g in gradients)
     magnitude = cv2.magnitude(sobelx, sobely)
     magnitude = cv2.convertScaleAbs(magnitude)
-    edges_rgb = cv2.cvtColor(magnitude, cv2.COLOR_GRAY2RGB)
-    return edges_rgb
+    return magnitude
 
 
 def laplacian_edges(image: np.ndarray) -> np.ndarray:
     """
     Detect edges using the Laplacian operator.
+    The result is a single-channel image.
     """
-    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    gray = as_gray(image)
     lap = cv2.Laplacian(gray, cv2.CV_64F)
     lap = cv2.convertScaleAbs(lap)
-    edges_rgb = cv2.cvtColor(lap, cv2.COLOR_GRAY2RGB)
-    return edges_rgb
+    return lap
 
 
 def canny_edges(image: np.ndarray, threshold1: int, threshold2: int) -> np.ndarray:
     """
     Detect edges using the Canny edge detector.
+    The result is a single-channel image.
     """
-    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    gray = as_gray(image)
     edges = cv2.Canny(gray, threshold1, threshold2)
-    edges_rgb = cv2.cvtColor(edges, cv2.COLOR_GRAY2RGB)
-    return edges_rgb
+    return edges
 
 
@@ -4,14 +4,23 @@ Image enhancement operations such as histogram equalization and sharpening.
 
 import cv2
 import numpy as np
-from typing import List
+from typing import List, Optional
 
-def histogram_equalization(image: np.ndarray) -> np.ndarray:
+from processing.channels import as_gray, is_gray
+from processing.convolution import KernelLike, convolve
+
+def histogram_equalization(image: np.ndarray, ycrcb: Optional[np.ndarray] = None) -> np.ndarray:
     """
     Apply histogram equalization to each channel separately in YCrCb color space.
     This tends to improve global contrast.
+    Grayscale images are equalized directly and stay single-channel.
+    A precomputed YCrCb version of the image can be passed to skip the
+    conversion.
     """
-    ycrcb = cv2.cvtColor(image, cv2.COLOR_RGB2YCrCb)
+    if is_gray(image):
+        return cv2.equalizeHist(as_gray(image))
+    if ycrcb is None:
+        ycrcb = cv2.cvtColor(image, cv2.COLOR_RGB2YCrCb)
     y, cr, cb = cv2.split(ycrcb)
     y_eq = cv2.equalizeHist(y)
     ycrcb_eq = cv2.merge((y_eq, cr, cb))
@@ -21,7 +30,10 @@ def histogram_equalization(image: np.ndarray) -> np.ndarray:
 def show_histogram(image: np.ndarray) -> List[np.ndarray]:
     """
     Show the histogram of a 3-channel image (like RGB) separately.
+    A grayscale image has a single histogram.
     """
+    if is_gray(image):
+        return [cv2.calcHist([as_gray(image)], [0], None, [256], [0, 256])]
     # List of channel colors for plotting
     colors = ('b', 'g', 'r')  # OpenCV uses BGR order by default
     histograms = []
@@ -31,19 +43,33 @@ def show_histogram(image: np.ndarray) -> List[np.ndarray]:
         histograms.append(hist)
     return histograms
     
-def sharpen_image(image: np.ndarray) -> np.ndarray:
-    """
-    Apply a simple sharpening filter using a fixed kernel.
-    """
-    kernel = np.array(
-        [
-            [0, -1, 0],
-            [-1, 5, -1],
-            [0, -1, 0],
-        ],
-        dtype=np.float32,
-    )
-    sharpened = cv2.filter2D(image, -1, kernel)
-    return sharpened
+def unsharp_mask_kernel(kernel_size: int, amount: float = 1.0) -> np.ndarray:
+    """
+    Kernel of an unsharp mask: the image plus amount times the difference
+    between the image and its Gaussian blur (sigma chosen from the kernel
+    size, like cv2.GaussianBlur does).
+    """
+    gaussian = cv2.getGaussianKernel(kernel_size, 0)
+    kernel = -amount * (gaussian @ gaussian.T)
+    kernel[kernel_size // 2, kernel_size // 2] += 1 + amount
+    return kernel.astype(np.float32)
 
 
+def sharpen_image(image: np.ndarray, kernel: Optional[KernelLike] = None) -> np.ndarray:
+    """
+    Apply a sharpening filter. Without a kernel a fixed 3x3 kernel is used;
+    any other kernel (e.g. from unsharp_mask_kernel, or a custom one given
+    as nested lists) can be passed and may have any size.
+    """
+    if kernel is None:
+        kernel = np.array(
+            [
+                [0, -1, 0],
+                [-1, 5, -1],
+                [0, -1, 0],
+            ],
+            dtype=np.float32,
+        )
+        return cv2.filter2D(image, -1, kernel)
+    # Large kernels are applied as separable passes or through the DFT.
+    return convolve(image, kernel)
@@ -1,25 +1,310 @@
 """
 Filtering and smoothing operations using simple OpenCV filters.
+
+Large Gaussian kernels are handled by a small blur engine that picks a
+strategy from the kernel size, so that a radius-200 blur costs about the
+same as a radius-5 one:
+
+- "direct": kernels up to DIRECT_MAX_KERNEL use cv2.GaussianBlur (exact,
+  separable convolution whose cost grows with the kernel size);
+- "box": larger kernels are approximated by four box blurs whose widths
+  are chosen to give the same variance as OpenCV's kernel (which is cut
+  off at the kernel size, so its variance is a little below sigma**2).
+  Box blurs use running sums, so their cost does not depend on the width;
+- "pyramid": for sigmas above PYRAMID_SIGMA the image is first shrunk by a
+  power of two, blurred with an exact Gaussian of the remaining sigma (at
+  most PYRAMID_WORK_SIGMA, so the cost is bounded) and scaled back up.
+  It gets a reflected border as wide as the kernel, like cv2.GaussianBlur,
+  which also keeps the two scales aligned for odd image sizes.
+
+Accuracy: on 8-bit images the approximations stay within 10 gray levels
+of cv2.GaussianBlur with the same kernel size, and the mean difference is
+below 1.5 levels (measured on noise, full-contrast step edges and
+natural-looking images, even and odd sized, for every kernel size up to
+401; the worst case is full-contrast step edges, at about 7 levels max and
+0.9 mean). Results are identical for kernel sizes up to DIRECT_MAX_KERNEL.
+
+Box (average) blur needs no engine: cv2.blur already uses running sums.
+
+The edge-preserving filters at the end of the module (guided filter and
+bilateral grid) are built from box filters and a small downsampled grid,
+so their cost does not depend on the radius either.
 """
 
+import math
+from typing import List, Optional
+
 import cv2
 import numpy as np
 
+from processing.channels import as_gray
+
+# Largest kernel size blurred with an exact Gaussian kernel.
+DIRECT_MAX_KERNEL = 31
+
+# Sigma above which the image is blurred at a reduced resolution.
+PYRAMID_SIGMA = 24.0
+
+# The image is shrunk until the sigma left to apply is at most this, which
+# keeps the exact Gaussian at the reduced resolution cheap.
+PYRAMID_WORK_SIGMA = 12.0
+
+# Box blurs per Gaussian. Three leave the edges of large blurs visibly
+# too sharp; the fourth pass costs one more running sum.
+BOX_PASSES = 4
+
+
+def gaussian_variance(kernel_size: int) -> float:
+    """
+    Variance of the kernel cv2.GaussianBlur uses for this kernel size (with
+    sigma 0). The kernel is cut off at about 3.3 sigma, which leaves its
+    variance roughly 1.5% below sigma**2.
+    """
+    kernel = cv2.getGaussianKernel(kernel_size, 0, cv2.CV_64F).ravel()
+    offsets = np.arange(kernel_size) - kernel_size // 2
+    return float(np.sum(kernel * offsets * offsets))
+
+
+def gaussian_blur_strategy(kernel_size: int) -> str:
+    """
+    Name of the strategy used for this kernel size: "direct", "box" or "pyramid".
+    """
+    if kernel_size <= DIRECT_MAX_KERNEL:
+        return "direct"
+    if math.sqrt(gaussian_variance(kernel_size)) <= PYRAMID_SIGMA:
+        return "box"
+    return "pyramid"
+
+
+def gaussian_blur_reach(kernel_size: int) -> int:
+    """
+    How far (in pixels) the blur looks around a pixel. BOX_PASSES box
+    blurs reach a little further than kernel_size // 2.
+    """
+    if gaussian_blur_strategy(kernel_size) == "box":
+        return sum(width // 2 for width in _box_widths(math.sqrt(gaussian_variance(kernel_size))))
+    return kernel_size // 2
+
+
+def _box_widths(sigma: float, passes: int = BOX_PASSES) -> List[int]:
+    """
+    Odd box widths whose repeated application has (almost exactly) the
+    variance of a Gaussian with this sigma.
+    """
+    ideal = math.sqrt(12 * sigma * sigma / passes + 1)
+    lower = int(math.floor(ideal))
+    if lower % 2 == 0:
+        lower -= 1
+    upper = lower + 2
+    count_lower = round(
+        (12 * sigma * sigma - passes * lower * lower - 4 * passes * lower - 3 * passes) / (-4 * lower - 4)
+    )
+    count_lower = min(max(count_lower, 0), passes)
+    return [lower] * count_lower + [upper] * (passes - count_lower)
+
+
+def _box_gaussian(image: np.ndarray, sigma: float) -> np.ndarray:
+    """
+    Approximate a Gaussian blur with BOX_PASSES running-sum box blurs.
+    """
+    # 8-bit images stay 8-bit (rounding adds at most half a level per pass).
+    work = image if image.dtype == np.uint8 else image.astype(np.float32)
+    for width in _box_widths(sigma):
+        work = cv2.blur(work, (width, width))
+    if work.dtype != image.dtype:
+        if np.issubdtype(image.dtype, np.integer):
+            info = np.iinfo(image.dtype)
+            work = np.clip(np.rint(work), info.min, info.max)
+        work = work.astype(image.dtype)
+    return work
+
+
+def _pyramid_gaussian(image: np.ndarray, kernel_size: int) -> np.ndarray:
+    """
+    Blur at a reduced resolution and scale the result back up.
+    """
+    sigma = math.sqrt(gaussian_variance(kernel_size))
+    factor = 1
+    while sigma / factor > PYRAMID_WORK_SIGMA:
+        factor *= 2
+    height, width = image.shape[:2]
+    # Pad with the border cv2.GaussianBlur would see, rounded up to whole
+    # blocks so every small pixel covers exactly factor x factor pixels.
+    border = -(-(kernel_size // 2) // factor) * factor
+    padded = cv2.copyMakeBorder(
+        image, border, border + (-height) % factor, border, border + (-width) % factor, cv2.BORDER_REFLECT_101
+    )
+    padded_height, padded_width = padded.shape[:2]
+    small = cv2.resize(padded, (padded_width // factor, padded_height // factor), interpolation=cv2.INTER_AREA)
+    # Area downscaling and linear upscaling blur too; only the remaining
+    # variance is applied at the small scale.
+    remaining = sigma * sigma - (factor * factor - 1) / 12 - factor * factor / 6
+    small = cv2.GaussianBlur(small, (0, 0), math.sqrt(remaining) / factor)
+    blurred = cv2.resize(small, (padded_width, padded_height), interpolation=cv2.INTER_LINEAR)
+    # Copy, so the result does not keep the padded frame alive.
+    return blurred[border:border + height, border:border + width].copy()
+
 
 def apply_gaussian_blur(image: np.ndarray, kernel_size: int) -> np.ndarray:
     """
     Apply Gaussian blur with a square kernel of size (kernel_size x kernel_size).
-    The kernel_size should be a positive odd number.
+    The kernel_size should be a positive odd number. Large kernels are
+    approximated (see the module docstring for the accuracy).
     """
-    blurred = cv2.GaussianBlur(image, (kernel_size, kernel_size), 0)
+    strategy = gaussian_blur_strategy(kernel_size)
+    if strategy == "direct":
+        blurred = cv2.GaussianBlur(image, (kernel_size, kernel_size), 0)
+    elif strategy == "box":
+        blurred = _box_gaussian(image, math.sqrt(gaussian_variance(kernel_size)))
+    else:
+        blurred = _pyramid_gaussian(image, kernel_size)
     return blurred
 
 
+# Smallest side of the blocks in which _median_by_bytes groups pixels by
+# prefix. Blocks grow with the kernel so the halo stays a fraction of them.
+MEDIAN_BLOCK = 128
+
+# Filtering one pixel of a prefix group in _median_by_bytes (mapping plus an
+# 8-bit cv2.medianBlur) costs about as much as this many window elements in
+# _median_by_sorting. Used to pick the cheaper of the two.
+MEDIAN_BYTE_COST = 20
+
+# Window elements _median_by_sorting holds in memory at once.
+MEDIAN_SORT_ELEMENTS = 1 << 23
+
+
+def _median_by_sorting(channel: np.ndarray, kernel_size: int) -> np.ndarray:
+    """
+    Exact median of a 2-D array by partially sorting every window, a few
+    rows at a time. Costs kernel_size**2 per pixel whatever the data.
+    """
+    radius = kernel_size // 2
+    height, width = channel.shape
+    padded = np.pad(channel, radius, mode="edge")
+    area = kernel_size * kernel_size
+    rows = max(1, MEDIAN_SORT_ELEMENTS // (width * area))
+    result = np.empty_like(channel)
+    for y in range(0, height, rows):
+        band = padded[y:y + rows + 2 * radius]
+        windows = np.lib.stride_tricks.sliding_window_view(band, (kernel_size, kernel_size)).reshape(-1, area)
+        result[y:y + rows] = np.partition(windows, area // 2, axis=1)[:, area // 2].reshape(-1, width)
+    return result
+
+
+def _median_by_bytes(
+    codes: np.ndarray, kernel_size: int, nbytes: int, max_work: Optional[float] = None
+) -> Optional[np.ndarray]:
+    """
+    Exact median of a 2-D array of unsigned integer codes that use nbytes
+    bytes, computed one byte at a time (most significant first) with
+    8-bit cv2.medianBlur, whose cost does not depend on the kernel size.
+
+    The median commutes with non-decreasing maps. So once the higher bytes
+    of the median are known at a pixel (its prefix), the next byte is the
+    8-bit median of the image mapped as: values with a smaller prefix -> 0,
+    a larger prefix -> 255, the same prefix -> their next byte. Within each
+    block of the output, pixels are grouped by prefix and every group is
+    filtered over its bounding box plus the window radius. Medians usually
+    vary slowly, so a block holds only a few prefixes; on noisy data with a
+    small kernel it can hold hundreds, and each one costs a pass over the
+    block. If the pixels to filter (times MEDIAN_BYTE_COST) would exceed
+    max_work, None is returned once the first byte is known.
+    """
+    radius = kernel_size // 2
+    block_size = max(MEDIAN_BLOCK, 4 * radius)
+    height, width = codes.shape
+    result = np.zeros(codes.shape, dtype=np.uint32)
+    for level in range(nbytes):
+        shift = 8 * (nbytes - 1 - level)
+        byte = ((codes >> shift) & 0xFF).astype(np.uint8)
+        if level == 0:
+            result |= cv2.medianBlur(byte, kernel_size).astype(np.uint32) << shift
+            continue
+
+        value_prefix = codes >> (shift + 8)
+        median_prefix = result >> (shift + 8)
+        prefixes = {
+            (by, bx): np.unique(median_prefix[by:by + block_size, bx:bx + block_size])
+            for by in range(0, height, block_size)
+            for bx in range(0, width, block_size)
+        }
+        if level == 1 and max_work is not None:
+            # Upper bound: every group spans its whole block plus the halo.
+            work = sum(
+                len(values) * (min(block_size, height - by) + 2 * radius) * (min(block_size, width - bx) + 2 * radius)
+                for (by, bx), values in prefixes.items()
+            )
+            if work * (nbytes - 1) * MEDIAN_BYTE_COST > max_work:
+                return None
+
+        median_byte = np.empty(codes.shape, dtype=np.uint8)
+        for (by, bx), values in prefixes.items():
+            block = median_prefix[by:by + block_size, bx:bx + block_size]
+            for prefix in values:
+                in_group = block == prefix
+                rows = np.flatnonzero(in_group.any(axis=1)) + by
+                cols = np.flatnonzero(in_group.any(axis=0)) + bx
+                y0, y1 = max(rows[0] - radius, 0), min(rows[-1] + radius + 1, height)
+                x0, x1 = max(cols[0] - radius, 0), min(cols[-1] + radius + 1, width)
+                window_prefix = value_prefix[y0:y1, x0:x1]
+                mapped = np.where(window_prefix > prefix, 255, byte[y0:y1, x0:x1]).astype(np.uint8)
+                mapped[window_prefix < prefix] = 0
+                filtered = cv2.medianBlur(mapped, kernel_size)
+                # Copy back only the group's pixels inside this block.
+                gy0, gx0 = rows[0], cols[0]
+                gy1, gx1 = rows[-1] + 1, cols[-1] + 1
+                group = in_group[gy0 - by:gy1 - by, gx0 - bx:gx1 - bx]
+                target = median_byte[gy0:gy1, gx0:gx1]
+                target[group] = filtered[gy0 - y0:gy1 - y0, gx0 - x0:gx1 - x0][group]
+        result |= median_byte.astype(np.uint32) << shift
+    return result
+
+
+def _median_channel(channel: np.ndarray, kernel_size: int) -> np.ndarray:
+    """
+    Exact median of one channel of any dtype. Values are replaced by their
+    rank among the distinct values (which keeps their order), so the number
+    of bytes to process depends on how many distinct values there are.
+    Where that would cost more than sorting every window (noisy data with a
+    small kernel), the windows are sorted instead.
+    """
+    if channel.dtype == np.uint16:
+        # A lookup table is much cheaper than sorting for 16-bit data.
+        present = np.bincount(channel.ravel(), minlength=1 << 16) > 0
+        values = np.flatnonzero(present).astype(np.uint16)
+        ranks = (np.cumsum(present) - 1).astype(np.uint32)[channel]
+    else:
+        values, inverse = np.unique(channel, return_inverse=True)
+        ranks = inverse.reshape(channel.shape).astype(np.uint32)
+
+    nbytes = max(1, (int(len(values) - 1).bit_length() + 7) // 8)
+    median_ranks = _median_by_bytes(ranks, kernel_size, nbytes, max_work=channel.size * kernel_size**2)
+    if median_ranks is None:
+        return _median_by_sorting(channel, kernel_size)
+    return values[median_ranks]
+
+
 def apply_median_blur(image: np.ndarray, kernel_size: int) -> np.ndarray:
     """
     Apply median blur. The kernel size must be an odd integer greater than 1.
+
+    8-bit images use cv2.medianBlur, which already runs in constant time
+    per pixel for any kernel size. OpenCV supports other depths only up to
+    a 5x5 kernel; larger kernels on 16-bit (or any other) images are
+    computed exactly, channel by channel, with _median_channel, at roughly
+    0.5 to 5 seconds per megapixel and channel depending on the data (the
+    slowest case is full-range noise with kernels around 31). Borders are
+    replicated, as in OpenCV. For large images see
+    processing.tiling.parallel_median_blur.
     """
-    blurred = cv2.medianBlur(image, kernel_size)
+    if image.dtype == np.uint8 or (kernel_size <= 5 and image.dtype in (np.uint16, np.float32)):
+        blurred = cv2.medianBlur(image, kernel_size)
+    elif image.ndim == 2:
+        blurred = _median_channel(image, kernel_size)
+    else:
+        channels = [_median_channel(image[:, :, index], kernel_size) for index in range(image.shape[2])]
+        blurred = np.stack(channels, axis=2)
     return blurred
 
 
@@ -31,3 +316,243 @@ def apply_average_blur(image: np.ndarray, kernel_size: int) -> np.ndarray:
     return blurred
 
 
+def _to_unit_float(image: np.ndarray) -> np.ndarray:
+    """
+    Float32 copy of an image with 8/16-bit values scaled to 0..1.
+    """
+    if image.dtype == np.uint8:
+        return image.astype(np.float32) / 255.0
+    if image.dtype == np.uint16:
+        return image.astype(np.float32) / 65535.0
+    return image.astype(np.float32)
+
+
+def _from_unit_float(result: np.ndarray, dtype: np.dtype) -> np.ndarray:
+    """
+    Convert a 0..1 float result back to the dtype of the input image.
+    """
+    if dtype == np.uint8:
+        return np.clip(np.rint(result * 255.0), 0, 255).astype(np.uint8)
+    if dtype == np.uint16:
+        return np.clip(np.rint(result * 65535.0), 0, 65535).astype(np.uint16)
+    return result.astype(dtype)
+
+
+def _box(image: np.ndarray, radius: int) -> np.ndarray:
+    # Normalized box filter; OpenCV computes it with running sums.
+    return cv2.boxFilter(image, -1, (2 * radius + 1, 2 * radius + 1))
+
+
+def _guided_gray(guide: np.ndarray, sources: List[np.ndarray], radius: int, eps: float) -> List[np.ndarray]:
+    # The guide statistics are shared by every source channel.
+    mean_i = _box(guide, radius)
+    var_i = _box(guide * guide, radius) - mean_i * mean_i + eps
+    results = []
+    for source in sources:
+        mean_p = _box(source, radius)
+        cov_ip = _box(guide * source, radius) - mean_i * mean_p
+        a = cov_ip / var_i
+        b = mean_p - a * mean_i
+        results.append(_box(a, radius) * guide + _box(b, radius))
+    return results
+
+
+def _guided_color(guide: np.ndarray, sources: List[np.ndarray], radius: int, eps: float) -> List[np.ndarray]:
+    """
+    Guided filter with a 3-channel guide: the local linear model uses all
+    three guide channels, which keeps edges that only show up in color.
+    The guide means and the inverse of its covariance are computed once
+    and shared by every source channel.
+    """
+    channels = cv2.split(guide)
+    means = [_box(channel, radius) for channel in channels]
+
+    # Covariance of the guide in each window, plus eps on the diagonal.
+    cov = {}
+    for i in range(3):
+        for j in range(i, 3):
+            cov[i, j] = _box(channels[i] * channels[j], radius) - means[i] * means[j]
+    for i in range(3):
+        cov[i, i] = cov[i, i] + eps
+
+    # Inverse of the symmetric 3x3 matrix via its cofactors, per pixel.
+    inv00 = cov[1, 1] * cov[2, 2] - cov[1, 2] * cov[1, 2]
+    inv01 = cov[0, 2] * cov[1, 2] - cov[0, 1] * cov[2, 2]
+    inv02 = cov[0, 1] * cov[1, 2] - cov[0, 2] * cov[1, 1]
+    inv11 = cov[0, 0] * cov[2, 2] - cov[0, 2] * cov[0, 2]
+    inv12 = cov[0, 2] * cov[0, 1] - cov[0, 0] * cov[1, 2]
+    inv22 = cov[0, 0] * cov[1, 1] - cov[0, 1] * cov[0, 1]
+    det = cov[0, 0] * inv00 + cov[0, 1] * inv01 + cov[0, 2] * inv02
+    inverse = [
+        [inv00 / det, inv01 / det, inv02 / det],
+        [inv01 / det, inv11 / det, inv12 / det],
+        [inv02 / det, inv12 / det, inv22 / det],
+    ]
+    del cov
+
+    results = []
+    for source in sources:
+        mean_p = _box(source, radius)
+        cov_ip = [_box(channel * source, radius) - mean * mean_p for channel, mean in zip(channels, means)]
+        a = [row[0] * cov_ip[0] + row[1] * cov_ip[1] + row[2] * cov_ip[2] for row in inverse]
+        b = mean_p - a[0] * means[0] - a[1] * means[1] - a[2] * means[2]
+        results.append(
+            _box(a[0], radius) * channels[0]
+            + _box(a[1], radius) * channels[1]
+            + _box(a[2], radius) * channels[2]
+            + _box(b, radius)
+        )
+    return results
+
+
+def apply_guided_filter(
+    image: np.ndarray,
+    radius: int,
+    eps: float,
+    guide: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Edge-preserving smoothing with the guided filter (He et al.).
+
+    Inside every (2 * radius + 1) window the output is modeled as a linear
+    function of the guide image, so edges of the guide are kept while flat
+    regions are smoothed. eps (on the 0..1 intensity scale, e.g. 0.01)
+    controls how strong an edge must be to survive. By default the image
+    guides itself; a 3-channel guide uses all of its color channels. Only
+    box filters are used, so the cost does not depend on the radius.
+    """
+    guide_float = _to_unit_float(image if guide is None else guide)
+    if guide_float.ndim == 3 and guide_float.shape[2] == 1:
+        guide_float = guide_float[:, :, 0]
+    source = _to_unit_float(image)
+    filter_channels = _guided_gray if guide_float.ndim == 2 else _guided_color
+
+    if source.ndim == 2:
+        result = filter_channels(guide_float, [source], radius, eps)[0]
+    else:
+        sources = cv2.split(source)
+        result = np.stack(filter_channels(guide_float, sources, radius, eps), axis=2)
+    return _from_unit_float(result, image.dtype)
+
+
+# Largest number of cells in a bilateral grid (each cell holds one float32
+# per channel plus a weight). Larger grids are sampled more coarsely in
+# space, which keeps the memory to about 64 MB for a color image.
+BILATERAL_MAX_CELLS = 1 << 22
+
+# The [1, 4, 6, 4, 1] / 16 kernel: close to a Gaussian with sigma 1.
+_BINOMIAL_WEIGHTS = np.array([1, 4, 6, 4, 1], dtype=np.float32) / 16
+
+
+def _grid_weights(sigma_cells: float) -> np.ndarray:
+    """
+    5-tap blur kernel for a Gaussian of sigma_cells grid cells (at most 1).
+    """
+    if sigma_cells >= 1:
+        return _BINOMIAL_WEIGHTS
+    weights = np.exp(-0.5 * (np.arange(-2, 3) / sigma_cells) ** 2).astype(np.float32)
+    return weights / weights.sum()
+
+
+def _blur_grid(grid: np.ndarray, spatial_weights: np.ndarray) -> None:
+    """
+    Blur a bilateral grid of shape (depth, height, width, channels) in
+    place: each intensity plane in space with OpenCV, then across the
+    planes with the binomial kernel. Only a few planes are copied at a time.
+    """
+    for plane in grid:
+        cv2.sepFilter2D(
+            plane, -1, spatial_weights, spatial_weights, dst=plane, borderType=cv2.BORDER_CONSTANT
+        )
+
+    # Keep the unblurred neighbors of each plane, since the planes before
+    # it are overwritten as we go.
+    depth = grid.shape[0]
+    window = [np.zeros_like(grid[0]) for _ in range(2)] + [grid[z].copy() for z in range(min(3, depth))]
+    for z in range(depth):
+        while len(window) < 5:
+            window.append(grid[z + 2].copy() if z + 2 < depth else np.zeros_like(grid[0]))
+        grid[z] = sum(weight * plane for weight, plane in zip(_BINOMIAL_WEIGHTS, window))
+        window.pop(0)
+
+
+def apply_bilateral_grid(
+    image: np.ndarray,
+    sigma_space: float,
+    sigma_color: float,
+    guide: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Fast approximation of the bilateral filter using a bilateral grid
+    (Chen, Paris and Durand).
+
+    Pixels are accumulated into a coarse 3-D grid (y / sigma_space,
+    x / sigma_space, intensity / sigma_color), the grid is blurred, and
+    every pixel reads its result back with trilinear interpolation. The
+    grid gets smaller as sigma_space grows, so large spatial sigmas are
+    not slower than small ones. sigma_color is in gray levels (0..255).
+
+    Small sigmas on large images would need a very large grid, so the grid
+    is limited to BILATERAL_MAX_CELLS cells: beyond that it is sampled more
+    coarsely in space (and blurred by less than one cell), which smooths a
+    little more than the requested sigma_space.
+
+    The range axis is the intensity (grayscale) of the guide, which is the
+    image itself by default; color images are filtered channel by channel
+    with the same weights.
+    """
+    height, width = image.shape[:2]
+    intensity = as_gray(image if guide is None else guide).astype(np.float32)
+    if (guide if guide is not None else image).dtype == np.uint16:
+        intensity *= 255.0 / 65535.0
+    values = image.astype(np.float32).reshape(height, width, -1)
+    channels = values.shape[2]
+
+    pad = 2
+    grid_d = int(255.0 / sigma_color) + 1 + 2 * pad
+    spacing = float(sigma_space)
+    cells = ((height - 1) / spacing + 1 + 2 * pad) * ((width - 1) / spacing + 1 + 2 * pad) * grid_d
+    if cells > BILATERAL_MAX_CELLS:
+        spacing *= math.sqrt(cells / BILATERAL_MAX_CELLS)
+    grid_h = int((height - 1) / spacing) + 1 + 2 * pad
+    grid_w = int((width - 1) / spacing) + 1 + 2 * pad
+
+    gy = np.arange(height, dtype=np.float32)[:, None] / spacing + pad
+    gx = np.arange(width, dtype=np.float32)[None, :] / spacing + pad
+    gz = intensity / sigma_color + pad
+
+    # Splat: each pixel adds its values (and a weight of 1) to the nearest cell.
+    cell = (
+        (np.rint(gz).astype(np.int64) * grid_h + np.rint(gy).astype(np.int64)) * grid_w
+        + np.rint(gx).astype(np.int64)
+    ).ravel()
+    size = grid_d * grid_h * grid_w
+    grid = np.empty((grid_d, grid_h, grid_w, channels + 1), dtype=np.float32)
+    for index in range(channels):
+        grid[..., index] = np.bincount(cell, weights=values[:, :, index].ravel(), minlength=size).reshape(
+            grid_d, grid_h, grid_w
+        )
+    grid[..., channels] = np.bincount(cell, minlength=size).reshape(grid_d, grid_h, grid_w)
+    del cell
+
+    _blur_grid(grid, _grid_weights(sigma_space / spacing))
+
+    # Slice: trilinear interpolation of the blurred grid at every pixel.
+    y0, x0, z0 = np.floor(gy).astype(np.int64), np.floor(gx).astype(np.int64), np.floor(gz).astype(np.int64)
+    fy, fx, fz = gy - y0, gx - x0, gz - z0
+    result = np.zeros((height, width, channels + 1), dtype=np.float32)
+    for dy in (0, 1):
+        wy = fy if dy else 1 - fy
+        for dx in (0, 1):
+            wx = fx if dx else 1 - fx
+            for dz in (0, 1):
+                wz = fz if dz else 1 - fz
+                weight = (wy * wx * wz)[:, :, None]
+                result += weight * grid[z0 + dz, y0 + dy, x0 + dx]
+
+    filtered = result[:, :, :channels] / np.maximum(result[:, :, channels:], 1e-6)
+    filtered = filtered.reshape(image.shape)
+    if np.issubdtype(image.dtype, np.integer):
+        info = np.iinfo(image.dtype)
+        filtered = np.clip(np.rint(filtered), info.min, info.max)
+    return filtered.astype(image.dtype)
@@ -1,52 +1,247 @@
 """
 Basic morphological operations: erosion, dilation, opening, and closing.
+
+The structuring element can be a rectangle ("rect"), an ellipse, a cross,
+or a horizontal or vertical line ("hline", "vline"), all kernel_size
+pixels across. Elements are built once and cached.
+
+Erosion is a minimum (dilation a maximum) over the pixels covered by the
+element, so it can be computed in cheaper pieces with exactly the same
+result as cv2.erode / cv2.dilate:
+
+- A rectangle is a vertical line followed by a horizontal line (two 1-D
+  passes). Long 1-D passes use the van Herk/Gil-Werman algorithm, which
+  needs about three comparisons per pixel whatever the length; short ones
+  use OpenCV, whose cost grows with the length but which is faster there.
+- An ellipse or a cross is a union of centered rectangles (a cross is a
+  horizontal and a vertical line), and the erosion by a union is the
+  minimum of the erosions by its parts. OpenCV would otherwise visit every
+  pixel of the element, which is slow for large ellipses (about 3x slower
+  at 101 pixels). Small elements are left to OpenCV.
+- Repeating an erosion by a rectangle or a line of odd size n times equals
+  one erosion by a rectangle or line of n * (kernel_size - 1) + 1 pixels,
+  so iterations are collapsed into one pass. This does not hold for
+  ellipses and crosses (a repeated cross grows into a diamond), which are
+  repeated as usual.
 """
 
+from functools import lru_cache
+from typing import Callable, Optional, Tuple
+
 import cv2
 import numpy as np
 
+MORPH_SHAPES = ("rect", "ellipse", "cross", "hline", "vline")
+
+# Shapes for which n iterations equal one pass with a larger element.
+COLLAPSIBLE_SHAPES = ("rect", "hline", "vline")
+
+# Ellipses and crosses at least this large are split into rectangles;
+# OpenCV is faster on smaller ones (measured on a 6 MP image).
+DECOMPOSE_MIN_SIZE = 31
+
+# 1-D passes at least this long use van Herk/Gil-Werman instead of OpenCV
+# (measured crossover on a 6 MP image).
+VHGW_MIN_LENGTH = 201
+
+
+@lru_cache(maxsize=64)
+def structuring_element(shape: str, kernel_size: int) -> np.ndarray:
+    """
+    Return the structuring element (a uint8 array of 0 and 1) for a shape
+    and size. Elements are cached, so they are returned read-only.
+    """
+    if kernel_size < 1:
+        raise ValueError("The kernel size must be at least 1")
+    if shape == "rect":
+        element = np.ones((kernel_size, kernel_size), np.uint8)
+    elif shape == "ellipse":
+        element = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (kernel_size, kernel_size))
+    elif shape == "cross":
+        element = cv2.getStructuringElement(cv2.MORPH_CROSS, (kernel_size, kernel_size))
+    elif shape == "hline":
+        element = np.ones((1, kernel_size), np.uint8)
+    elif shape == "vline":
+        element = np.ones((kernel_size, 1), np.uint8)
+    else:
+        raise ValueError(f"Unknown structuring element shape: {shape}")
+    element.setflags(write=False)
+    return element
+
+
+@lru_cache(maxsize=64)
+def _centered_rectangles(shape: str, kernel_size: int) -> Optional[Tuple[Tuple[int, int], ...]]:
+    """
+    Split the element into centered rectangles, as (height, width) pairs,
+    whose union is the element. Returns None if the element is not such a
+    union (e.g. an ellipse of even size, which is not centered).
+    """
+    element = structuring_element(shape, kernel_size).astype(bool)
+    height, width = element.shape
+    if height % 2 == 0 or width % 2 == 0:
+        return None
+    cy, cx = height // 2, width // 2
+
+    # Half-width of each row's run of pixels, measured from the center column.
+    half_widths = []
+    for row in element:
+        columns = np.flatnonzero(row)
+        if columns.size == 0:
+            half_widths.append(-1)
+            continue
+        left, right = columns[0], columns[-1]
+        if right - left + 1 != columns.size or cx - left != right - cx:
+            return None
+        half_widths.append(int(cx - left))
+
+    # A rectangle of half-width w reaches as far up and down as the rows
+    # that are at least w wide.
+    rectangles = []
+    for w in sorted(set(half_widths) - {-1}):
+        reach = max(abs(y - cy) for y, hw in enumerate(half_widths) if hw >= w)
+        rectangles.append((2 * reach + 1, 2 * w + 1))
+
+    covered = np.zeros_like(element)
+    for rect_height, rect_width in rectangles:
+        top, left = cy - rect_height // 2, cx - rect_width // 2
+        covered[top:top + rect_height, left:left + rect_width] = True
+    if not np.array_equal(covered, element):
+        return None
+    return tuple(rectangles)
+
+
+def _identity(dtype: np.dtype, reduce: Callable) -> float:
+    """
+    Value that never wins the minimum (or maximum): used for the border,
+    like OpenCV's default morphology border.
+    """
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        return info.max if reduce is np.minimum else info.min
+    return np.inf if reduce is np.minimum else -np.inf
+
 
-def _create_kernel(kernel_size: int) -> np.ndarray:
+def _van_herk_rows(image: np.ndarray, length: int, reduce: Callable) -> np.ndarray:
     """
-    Create a simple square structuring element for morphology operations.
+    Running minimum (or maximum) over windows of length rows, anchored at
+    length // 2 like OpenCV, with the van Herk/Gil-Werman algorithm.
+
+    The rows are split into blocks of length rows. Within each block a
+    forward and a backward running minimum are computed; every window
+    covers the end of one block and the start of the next, so its minimum
+    is the minimum of one backward and one forward value.
     """
-    kernel = np.ones((kernel_size, kernel_size), np.uint8)
-    return kernel
+    anchor = length // 2
+    rows = image.shape[0]
+    blocks = -(-(rows + length - 1) // length)
+    padded = np.empty((blocks * length,) + image.shape[1:], dtype=image.dtype)
+    border = _identity(image.dtype, reduce)
+    padded[:anchor] = border
+    padded[anchor:anchor + rows] = image
+    padded[anchor + rows:] = border
 
+    forward = padded.reshape((blocks, length) + image.shape[1:])
+    backward = forward.copy()
+    # Each step works on one row of every block at once.
+    for j in range(1, length):
+        reduce(forward[:, j - 1], forward[:, j], out=forward[:, j])
+        reduce(backward[:, length - j], backward[:, length - 1 - j], out=backward[:, length - 1 - j])
+    forward = forward.reshape(padded.shape)
+    backward = backward.reshape(padded.shape)
+    return reduce(backward[:rows], forward[length - 1:length - 1 + rows])
 
-def erode(image: np.ndarray, kernel_size: int, iterations: int) -> np.ndarray:
+
+def _line_pass(image: np.ndarray, length: int, vertical: bool, reduce: Callable) -> np.ndarray:
+    """
+    Erode (reduce=np.minimum) or dilate (np.maximum) with a line of length pixels.
+    """
+    if length == 1:
+        return image.copy()
+    if length < VHGW_MIN_LENGTH:
+        line = np.ones((length, 1) if vertical else (1, length), np.uint8)
+        operation = cv2.erode if reduce is np.minimum else cv2.dilate
+        return operation(image, line)
+    if vertical:
+        return _van_herk_rows(image, length, reduce)
+    # Transposing turns rows into columns, so the same row-wise pass applies.
+    return cv2.transpose(_van_herk_rows(cv2.transpose(image), length, reduce))
+
+
+def _rectangle_pass(image: np.ndarray, height: int, width: int, reduce: Callable) -> np.ndarray:
+    return _line_pass(_line_pass(image, height, True, reduce), width, False, reduce)
+
+
+def _union_pass(image: np.ndarray, rectangles: Tuple[Tuple[int, int], ...], reduce: Callable) -> np.ndarray:
+    """
+    Erode (or dilate) with the union of centered rectangles, sorted by width.
+    """
+    combined = None
+    rows = image
+    previous_width = 1
+    for height, width in rectangles:
+        # A line of width a followed by one of width b is a line of width
+        # a + b - 1, so each horizontal pass extends the previous one.
+        rows = _line_pass(rows, width - previous_width + 1, False, reduce)
+        previous_width = width
+        part = _line_pass(rows, height, True, reduce)
+        combined = part if combined is None else reduce(combined, part, out=combined)
+    return combined
+
+
+def _morph(image: np.ndarray, kernel_size: int, iterations: int, shape: str, reduce: Callable) -> np.ndarray:
+    """
+    Erode (reduce=np.minimum) or dilate (reduce=np.maximum) iterations times.
+    """
+    if iterations < 1:
+        # Like OpenCV with iterations=0: nothing to do.
+        return image.copy()
+    # Only odd sizes collapse: an even element is not centered on its
+    # anchor, and the offsets of repeated passes add up differently.
+    if shape in COLLAPSIBLE_SHAPES and iterations > 1 and kernel_size % 2 == 1:
+        kernel_size = iterations * (kernel_size - 1) + 1
+        iterations = 1
+    element = structuring_element(shape, kernel_size)
+    rectangles = _centered_rectangles(shape, kernel_size) if kernel_size >= DECOMPOSE_MIN_SIZE else None
+
+    # OpenCV drops a trailing channel axis of length 1, so work without it.
+    result = image.reshape(image.shape[:2]) if image.ndim == 3 and image.shape[2] == 1 else image
+    for _ in range(iterations):
+        if shape in COLLAPSIBLE_SHAPES:
+            result = _rectangle_pass(result, element.shape[0], element.shape[1], reduce)
+        elif rectangles is not None:
+            result = _union_pass(result, rectangles, reduce)
+        else:
+            operation = cv2.erode if reduce is np.minimum else cv2.dilate
+            result = operation(result, element)
+    return result.reshape(image.shape)
+
+
+def erode(image: np.ndarray, kernel_size: int, iterations: int, shape: str = "rect") -> np.ndarray:
     """
     Apply erosion to the image.
     """
-    kernel = _create_kernel(kernel_size)
-    result = cv2.erode(image, kernel, iterations=iterations)
-    return result
+    return _morph(image, kernel_size, iterations, shape, np.minimum)
 
 
-def dilate(image: np.ndarray, kernel_size: int, iterations: int) -> np.ndarray:
+def dilate(image: np.ndarray, kernel_size: int, iterations: int, shape: str = "rect") -> np.ndarray:
     """
     Apply dilation to the image.
     """
-    kernel = _create_kernel(kernel_size)
-    result = cv2.dilate(image, kernel, iterations=iterations)
-    return result
+    return _morph(image, kernel_size, iterations, shape, np.maximum)
 
 
-def opening(image: np.ndarray, kernel_size: int, iterations: int) -> np.ndarray:
+def opening(image: np.ndarray, kernel_size: int, iterations: int, shape: str = "rect") -> np.ndarray:
     """
-    Apply opening (erosion followed by dilation).
+    Apply opening (erosion followed by dilation). Like cv2.morphologyEx,
+    all erosions are applied before the dilations.
     """
-    kernel = _create_kernel(kernel_size)
-    result = cv2.morphologyEx(image, cv2.MORPH_OPEN, kernel, iterations=iterations)
-    return result
+    eroded = erode(image, kernel_size, iterations, shape)
+    return dilate(eroded, kernel_size, iterations, shape)
 
 
-def closing(image: np.ndarray, kernel_size: int, iterations: int) -> np.ndarray:
+def closing(image: np.ndarray, kernel_size: int, iterations: int, shape: str = "rect") -> np.ndarray:
     """
     Apply closing (dilation followed by erosion).
     """
-    kernel = _create_kernel(kernel_size)
-    result = cv2.morphologyEx(image, cv2.MORPH_CLOSE, kernel, iterations=iterations)
-    return result
-
-
+    dilated = dilate(image, kernel_size, iterations, shape)
+    return erode(dilated, kernel_size, iterations, shape)
@@ -0,0 +1,226 @@
+"""
+Recipes: chains of processing operations that run as one unit.
+
+A recipe is built from the functions in processing/ and their parameters,
+for example:
+
+    recipe = (
+        Recipe()
+        .add(to_grayscale)
+        .add(apply_gaussian_blur, kernel_size=5)
+        .add(canny_edges, threshold1=100, threshold2=200)
+        .add(closing, kernel_size=3, iterations=1)
+    )
+    result = recipe(image)
+
+Before running, the recipe is optimized:
+- grayscale conversions that cannot change anything are removed (for
+  example converting the output of an edge detector, which is already
+  single-channel);
+- adjacent pixel-wise steps on 8-bit images (invert, global threshold) are
+  merged into one lookup table and applied in place on intermediate
+  buffers that the recipe owns.
+
+All optimizations are exact: the result equals running the steps one by
+one. A recipe is a plain callable, so it can be passed to
+processing.batch.apply_to_batch or stream_batch, and it can be saved as
+JSON for headless jobs (see batch_cli.py).
+"""
+
+import importlib
+import inspect
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from processing.basic import invert_image, invert_lut, to_grayscale
+from processing.channels import as_gray, is_gray
+from processing.edges import canny_edges, laplacian_edges, sobel_edges
+from processing.thresholding import (
+    adaptive_gaussian_threshold,
+    adaptive_mean_threshold,
+    global_threshold,
+    global_threshold_lut,
+)
+
+# Operations whose result is always a single-channel image.
+GRAY_OUTPUT = {
+    to_grayscale,
+    sobel_edges,
+    laplacian_edges,
+    canny_edges,
+    global_threshold,
+    adaptive_mean_threshold,
+    adaptive_gaussian_threshold,
+}
+
+# Operations that convert their input to grayscale themselves.
+GRAY_INPUT = GRAY_OUTPUT
+
+# Pixel-wise operations on 8-bit images that can be expressed as a lookup
+# table. Each entry maps the function to (table factory, whether the table
+# applies to the grayscale version of the image).
+LUT_OPERATIONS = {
+    invert_image: (invert_lut, False),
+    global_threshold: (global_threshold_lut, True),
+}
+
+
+def operation_name(operation: Callable) -> str:
+    """
+    Short name of a processing function, e.g. "filtering.apply_gaussian_blur".
+    """
+    module = operation.__module__
+    if module.startswith("processing."):
+        module = module[len("processing."):]
+    return f"{module}.{operation.__name__}"
+
+
+def resolve_operation(name: str) -> Callable:
+    """
+    Turn a name like "filtering.apply_gaussian_blur" into the function
+    processing.filtering.apply_gaussian_blur.
+    """
+    module_name, _, function_name = name.rpartition(".")
+    if not module_name or function_name.startswith("_"):
+        raise ValueError(f"Operation must look like 'module.function', got: {name}")
+    module = importlib.import_module(f"processing.{module_name}")
+    operation = getattr(module, function_name, None)
+    # Only functions defined in the processing package, not names that a
+    # module happens to import (e.g. tiling.ThreadPoolExecutor).
+    if not callable(operation) or not getattr(operation, "__module__", "").startswith("processing."):
+        raise ValueError(f"Unknown operation: {name}")
+    return operation
+
+
+class Step:
+    """
+    One operation of a recipe together with its keyword parameters.
+    """
+
+    def __init__(self, operation: Callable, params: Optional[Dict[str, Any]] = None):
+        self.operation = operation
+        self.params = dict(params or {})
+        # Fail early (when the recipe is built) on misspelled parameters.
+        inspect.signature(operation).bind(None, **self.params)
+
+    @property
+    def name(self) -> str:
+        return operation_name(self.operation)
+
+    def __call__(self, image: np.ndarray) -> np.ndarray:
+        return self.operation(image, **self.params)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"op": self.name, "params": self.params}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Step":
+        return cls(resolve_operation(data["op"]), data.get("params", {}))
+
+    def __repr__(self) -> str:
+        params = ", ".join(f"{key}={value!r}" for key, value in self.params.items())
+        return f"{self.name}({params})"
+
+
+class Recipe:
+    """
+    An ordered chain of steps that is optimized and run as one unit.
+    """
+
+    def __init__(self, steps: Optional[List[Step]] = None):
+        self.steps: List[Step] = list(steps or [])
+
+    def add(self, operation: Callable, **params) -> "Recipe":
+        """
+        Append a step and return the recipe, so calls can be chained.
+        """
+        self.steps.append(Step(operation, params))
+        return self
+
+    def __len__(self) -> int:
+        return len(self.steps)
+
+    def __repr__(self) -> str:
+        return "Recipe(" + " -> ".join(repr(step) for step in self.steps) + ")"
+
+    def optimized_steps(self) -> List[Step]:
+        """
+        The steps with grayscale conversions that cannot change the image
+        removed: a conversion of an image that is already single-channel,
+        and a conversion right before a step that converts by itself.
+        """
+        steps: List[Step] = []
+        for index, step in enumerate(self.steps):
+            if step.operation is to_grayscale:
+                previous = steps[-1].operation if steps else None
+                following = self.steps[index + 1].operation if index + 1 < len(self.steps) else None
+                if previous in GRAY_OUTPUT or following in GRAY_INPUT:
+                    continue
+            steps.append(step)
+        return steps
+
+    def run_with_timings(self, image: np.ndarray) -> Tuple[np.ndarray, List[Tuple[str, float]]]:
+        """
+        Run the recipe and return (result, [(step name, seconds), ...]).
+        Merged steps are reported under one combined name.
+        """
+        timings: List[Tuple[str, float]] = []
+        current = image
+        pending_lut: Optional[np.ndarray] = None
+        pending_names: List[str] = []
+        pending_seconds = 0.0
+
+        def owns(array: np.ndarray) -> bool:
+            # Intermediates created by this run may be overwritten in place.
+            return array.flags.writeable and not np.may_share_memory(array, image)
+
+        def flush() -> None:
+            nonlocal current, pending_lut, pending_names, pending_seconds
+            if pending_lut is None:
+                return
+            start = time.perf_counter()
+            target = current if owns(current) else None
+            current = cv2.LUT(current, pending_lut, dst=target)
+            elapsed = pending_seconds + time.perf_counter() - start
+            label = " + ".join(pending_names)
+            timings.append((f"{label} (fused)" if len(pending_names) > 1 else label, elapsed))
+            pending_lut, pending_names, pending_seconds = None, [], 0.0
+
+        for step in self.optimized_steps():
+            lut_entry = LUT_OPERATIONS.get(step.operation)
+            if lut_entry is not None and current.dtype == np.uint8:
+                table_factory, on_gray = lut_entry
+                start = time.perf_counter()
+                if on_gray and not is_gray(current):
+                    flush()
+                    current = as_gray(current)
+                table = table_factory(**step.params)
+                # Applying pending_lut and then table equals one lookup in table[pending_lut].
+                pending_lut = table if pending_lut is None else table[pending_lut]
+                pending_names.append(step.name)
+                pending_seconds += time.perf_counter() - start
+                continue
+
+            flush()
+            start = time.perf_counter()
+            current = step(current)
+            timings.append((step.name, time.perf_counter() - start))
+
+        flush()
+        return current, timings
+
+    def run(self, image: np.ndarray) -> np.ndarray:
+        result, _ = self.run_with_timings(image)
+        return result
+
+    __call__ = run
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"steps": [step.to_dict() for step in self.steps]}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Recipe":
+        return cls([Step.from_dict(item) for item in data.get("steps", [])])
@@ -0,0 +1,61 @@
+"""
+Low-resolution proxies for interactive previews.
+
+Running a filter on a 40 MP image every time a slider moves is slow. For
+previews we instead work on a smaller level of the image pyramid: the
+image is halved with cv2.pyrDown until its longer side fits in
+PROXY_MAX_SIDE pixels. Neighborhood sizes (kernel size, block size) are
+divided by the same factor, so the preview looks like a downscaled
+version of the full-resolution result. Full-resolution processing only
+happens when the user applies the operation.
+"""
+
+from typing import Tuple
+
+import cv2
+import numpy as np
+
+# Longer side (in pixels) of the proxy image.
+PROXY_MAX_SIDE = 1024
+
+
+def proxy_levels(shape: Tuple[int, ...], max_side: int = PROXY_MAX_SIDE) -> int:
+    """
+    Number of pyramid levels (halvings) needed for an image of this shape.
+    """
+    height, width = shape[:2]
+    levels = 0
+    while max(height, width) > max_side:
+        height, width = (height + 1) // 2, (width + 1) // 2
+        levels += 1
+    return levels
+
+
+def proxy_factor(shape: Tuple[int, ...], max_side: int = PROXY_MAX_SIDE) -> int:
+    """
+    How many full-resolution pixels one proxy pixel covers along each side.
+    """
+    return 2 ** proxy_levels(shape, max_side)
+
+
+def build_proxy(image: np.ndarray, max_side: int = PROXY_MAX_SIDE) -> np.ndarray:
+    """
+    Return the pyramid level of the image used for previews.
+    Images that are already small enough are returned as is.
+    """
+    proxy = image
+    for _ in range(proxy_levels(image.shape, max_side)):
+        # pyrDown smooths before dropping pixels, so the proxy does not alias.
+        proxy = cv2.pyrDown(proxy)
+    return proxy
+
+
+def scale_kernel_size(kernel_size: int, factor: int, minimum: int = 1) -> int:
+    """
+    Odd kernel size on the proxy that covers the same area as kernel_size
+    on the full-resolution image. minimum must be odd.
+    """
+    scaled = int(round(kernel_size / factor))
+    if scaled % 2 == 0:
+        scaled += 1
+    return max(scaled, minimum)
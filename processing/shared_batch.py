@@ -0,0 +1,240 @@
+"""
+Process-pool batch engine that moves images through shared memory.
+
+Thread pools do not help operations that hold the GIL (pure NumPy or
+Python-level code), and sending multi-megapixel arrays to worker processes
+through pipes costs more than the work itself. Here the images of a chunk
+are packed into one shared memory block and the workers only receive small
+descriptors (shape, dtype, offset). Each worker writes its result into a
+second shared block, in the slot reserved for that image.
+
+The worker processes are started once, warmed up, and reused across
+batches. The operation must be picklable: use a module-level function or
+functools.partial instead of a lambda.
+"""
+
+import multiprocessing
+import sys
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+# Upper bound for the size of one shared input block. Larger batches are
+# split into several chunks so that thousands of images never need one
+# giant allocation.
+CHUNK_BYTES = 256 * 1024 * 1024
+
+# (shape, dtype string, byte offset inside the shared block)
+Descriptor = Tuple[Tuple[int, ...], str, int]
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """
+    Attach to an existing shared memory block without taking ownership of it.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
+
+
+def _warm_up() -> None:
+    """
+    Worker initializer: keep OpenCV single-threaded inside each process
+    (the pool already provides the parallelism) and touch the code paths
+    once so the first real task does not pay for lazy initialization.
+    """
+    cv2.setNumThreads(1)
+    sample = np.zeros((8, 8, 3), np.uint8)
+    cv2.cvtColor(sample, cv2.COLOR_RGB2GRAY)
+    cv2.GaussianBlur(sample, (3, 3), 0)
+
+
+def _process_slot(
+    operation: Callable[[np.ndarray], np.ndarray],
+    input_name: str,
+    output_name: str,
+    descriptor: Descriptor,
+):
+    """
+    Run the operation on one image inside a worker process.
+
+    Returns ("shared", shape, dtype) when the result was written into the
+    output block, ("inline", array) when it is larger than the reserved slot,
+    or ("error", exception) when the operation failed.
+    """
+    shape, dtype, offset = descriptor
+    input_block = _attach(input_name)
+    output_block = _attach(output_name)
+    try:
+        image = np.ndarray(shape, dtype=dtype, buffer=input_block.buf, offset=offset)
+        image.flags.writeable = False
+        try:
+            result = np.ascontiguousarray(operation(image))
+        except Exception as exc:
+            return ("error", exc)
+        finally:
+            del image
+
+        slot_size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        if result.nbytes > slot_size:
+            return ("inline", result)
+
+        target = np.ndarray(result.shape, dtype=result.dtype, buffer=output_block.buf, offset=offset)
+        target[...] = result
+        del target
+        return ("shared", result.shape, result.dtype.str)
+    finally:
+        input_block.close()
+        output_block.close()
+
+
+def _split_into_chunks(images: List[np.ndarray]) -> List[List[int]]:
+    """
+    Group image indices into chunks whose total size stays below CHUNK_BYTES.
+    """
+    chunks: List[List[int]] = []
+    current: List[int] = []
+    current_bytes = 0
+    for index, image in enumerate(images):
+        if current and current_bytes + image.nbytes > CHUNK_BYTES:
+            chunks.append(current)
+            current, current_bytes = [], 0
+        current.append(index)
+        current_bytes += image.nbytes
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class SharedMemoryPool:
+    """
+    A reusable pool of warmed-up worker processes for batch operations.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Sessions share the pool, so only one of them may start the workers.
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_warm_up,
+                )
+            return self._executor
+
+    def map(
+        self,
+        images: List[np.ndarray],
+        operation: Callable[[np.ndarray], np.ndarray],
+        errors: Optional[Dict[int, Exception]] = None,
+    ) -> List[Optional[np.ndarray]]:
+        """
+        Apply the operation to every image and return results in order.
+        Failed images are returned as None and reported through errors.
+        """
+        results: List[Optional[np.ndarray]] = [None] * len(images)
+        for chunk in _split_into_chunks(images):
+            self._map_chunk(images, chunk, operation, results, errors)
+        return results
+
+    def _map_chunk(self, images, chunk, operation, results, errors) -> None:
+        offsets = []
+        total = 0
+        for index in chunk:
+            offsets.append(total)
+            # Keep every slot 64-byte aligned for SIMD-friendly access.
+            total += (images[index].nbytes + 63) // 64 * 64
+
+        input_block = shared_memory.SharedMemory(create=True, size=max(total, 1))
+        output_block = shared_memory.SharedMemory(create=True, size=max(total, 1))
+        try:
+            descriptors: List[Descriptor] = []
+            for index, offset in zip(chunk, offsets):
+                image = np.ascontiguousarray(images[index])
+                view = np.ndarray(image.shape, dtype=image.dtype, buffer=input_block.buf, offset=offset)
+                view[...] = image
+                del view
+                descriptors.append((image.shape, image.dtype.str, offset))
+
+            executor = self._get_executor()
+            futures: List[Union[Future, Exception]] = []
+            for descriptor in descriptors:
+                try:
+                    futures.append(
+                        executor.submit(_process_slot, operation, input_block.name, output_block.name, descriptor)
+                    )
+                except BrokenProcessPool as exc:
+                    # A worker of an earlier task died; report it per image.
+                    futures.append(exc)
+
+            broken = False
+            for index, offset, future in zip(chunk, offsets, futures):
+                try:
+                    if isinstance(future, Exception):
+                        raise future
+                    outcome = future.result()
+                except BrokenProcessPool as exc:
+                    broken = True
+                    outcome = ("error", exc)
+                except Exception as exc:
+                    outcome = ("error", exc)
+
+                if outcome[0] == "shared":
+                    _, shape, dtype = outcome
+                    view = np.ndarray(shape, dtype=dtype, buffer=output_block.buf, offset=offset)
+                    results[index] = view.copy()
+                    del view
+                elif outcome[0] == "inline":
+                    results[index] = outcome[1]
+                elif errors is not None:
+                    errors[index] = outcome[1]
+
+            if broken:
+                # A broken executor rejects all further work, so start
+                # fresh workers for the next batch.
+                self._discard_executor()
+        finally:
+            input_block.close()
+            input_block.unlink()
+            output_block.close()
+            output_block.unlink()
+
+    def _discard_executor(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def shutdown(self) -> None:
+        """
+        Stop the worker processes. The pool starts them again on next use.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+
+_shared_pools: Dict[Optional[int], SharedMemoryPool] = {}
+_shared_pools_lock = threading.Lock()
+
+
+def get_shared_pool(max_workers: Optional[int] = None) -> SharedMemoryPool:
+    """
+    Return the process-wide pool for the given worker count, creating it
+    on first use so that later batches reuse the same warm workers.
+    """
+    with _shared_pools_lock:
+        if max_workers not in _shared_pools:
+            _shared_pools[max_workers] = SharedMemoryPool(max_workers)
+        return _shared_pools[max_workers]
@@ -5,22 +5,25 @@ Thresholding operations: global and adaptive thresholding.
 import cv2
 import numpy as np
 
+from processing.channels import as_gray
+
 
 def global_threshold(image: np.ndarray, thresh_value: int, max_value: int = 255) -> np.ndarray:
     """
     Apply simple global binary thresholding on the grayscale version of the image.
+    The result is a single-channel image.
     """
-    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    gray = as_gray(image)
     _, thresh = cv2.threshold(gray, thresh_value, max_value, cv2.THRESH_BINARY)
-    thresh_rgb = cv2.cvtColor(thresh, cv2.COLOR_GRAY2RGB)
-    return thresh_rgb
+    return thresh
 
 
 def adaptive_mean_threshold(image: np.ndarray, block_size: int, c: int) -> np.ndarray:
     """
     Apply adaptive mean thresholding on the grayscale version of the image.
+    The result is a single-channel image.
     """
-    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    gray = as_gray(image)
     thresh = cv2.adaptiveThreshold(
         gray,
         255,
@@ -29,15 +32,15 @@ def adaptive_mean_threshold(image: np.ndarray, block_size: int, c: int) -> np.nd
         block_size,
         c,
     )
-    thresh_rgb = cv2.cvtColor(thresh, cv2.COLOR_GRAY2RGB)
-    return thresh_rgb
+    return thresh
 
 
 def adaptive_gaussian_threshold(image: np.ndarray, block_size: int, c: int) -> np.ndarray:
     """
     Apply adaptive Gaussian thresholding on the grayscale version of the image.
+    The result is a single-channel image.
     """
-    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    gray = as_gray(image)
     thresh = cv2.adaptiveThreshold(
         gray,
         255,
@@ -46,7 +49,26 @@ def adaptive_gaussian_threshold(image: np.ndarray, block_size: int, c: int) -> n
         block_size,
         c,
     )
-    thresh_rgb = cv2.cvtColor(thresh, cv2.COLOR_GRAY2RGB)
-    return thresh_rgb
+    return thresh
+
+
+def global_threshold_batch(images: np.ndarray, thresh_value: int, max_value: int = 255) -> np.ndarray:
+    """
+    Batched version of global_threshold for a stack of same-shaped images
+    with shape (N, H, W, 3) or (N, H, W). All images are converted and
+    thresholded in one OpenCV call on a tall (N * H, W[, 3]) view.
+    """
+    n, h, w = images.shape[:3]
+    tall = np.ascontiguousarray(images).reshape((n * h,) + images.shape[2:])
+    gray = as_gray(tall)
+    _, thresh = cv2.threshold(gray, thresh_value, max_value, cv2.THRESH_BINARY)
+    return thresh.reshape(n, h, w)
 
 
+def global_threshold_lut(thresh_value: int, max_value: int = 255) -> np.ndarray:
+    """
+    Lookup table equivalent of global_threshold for an 8-bit grayscale image.
+    """
+    levels = np.arange(256)
+    high = np.clip(np.round(max_value), 0, 255)
+    return np.where(levels > thresh_value, high, 0).astype(np.uint8)
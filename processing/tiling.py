@@ -0,0 +1,204 @@
+"""
+Tiled (out-of-core) execution of neighborhood operations.
+
+Whole-slide and satellite images can be much larger than the available
+memory. Such an image is kept on disk as a .npy file and opened as a
+memory map, for example with np.load(path, mmap_mode="r"), and is then
+processed tile by tile:
+
+    image = np.load("slide.npy", mmap_mode="r")
+    result = run_tiled(image, apply_gaussian_blur, kernel_size=15, output_path="blurred.npy")
+
+Each tile is read together with a halo: a border of extra pixels as wide
+as the reach of the operation (half the kernel size for a blur, more for
+repeated morphology). The operation sees exactly the pixels it would see
+on the whole image, so the core of every tile, and therefore the
+assembled output, is bit-identical to processing the whole image at once.
+Tiles are processed in parallel by a thread pool (OpenCV releases the GIL)
+and written straight into the output memory map, so only a few tiles are
+in memory at any time.
+
+Operations that are not local, like Canny (its hysteresis step can follow
+an edge across the whole image), cannot be tiled this way.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple, Union
+
+import numpy as np
+
+from processing.basic import invert_image, to_grayscale
+from processing.batch import default_worker_count
+from processing.edges import laplacian_edges, sobel_edges
+from processing.filtering import (
+    apply_average_blur,
+    apply_gaussian_blur,
+    apply_median_blur,
+    gaussian_blur_reach,
+    gaussian_blur_strategy,
+)
+from processing.morphology import closing, dilate, erode, opening
+from processing.pipeline import Recipe
+from processing.thresholding import (
+    adaptive_gaussian_threshold,
+    adaptive_mean_threshold,
+    global_threshold,
+)
+
+DEFAULT_TILE_SIZE = 1024
+
+
+def _gaussian_halo(kernel_size: int) -> int:
+    # The pyramid strategy resamples the image, so its result depends on
+    # where the tile starts.
+    if gaussian_blur_strategy(kernel_size) == "pyramid":
+        raise ValueError(f"Gaussian blur with kernel size {kernel_size} cannot be run on tiles")
+    return gaussian_blur_reach(kernel_size)
+
+
+# How far (in pixels) each supported operation looks around a pixel, as a
+# function of its parameters. Pixel-wise operations have a reach of 0.
+TILE_HALOS: Dict[Callable, Callable[..., int]] = {
+    to_grayscale: lambda: 0,
+    invert_image: lambda: 0,
+    global_threshold: lambda thresh_value, max_value=255: 0,
+    apply_gaussian_blur: _gaussian_halo,
+    apply_median_blur: lambda kernel_size: kernel_size // 2,
+    apply_average_blur: lambda kernel_size: kernel_size // 2,
+    # Every structuring element shape fits in a kernel_size square.
+    # Fewer than one iteration leaves the image unchanged.
+    erode: lambda kernel_size, iterations, shape="rect": (kernel_size // 2) * max(iterations, 0),
+    dilate: lambda kernel_size, iterations, shape="rect": (kernel_size // 2) * max(iterations, 0),
+    # Opening and closing are an erosion and a dilation, each repeated.
+    opening: lambda kernel_size, iterations, shape="rect": 2 * (kernel_size // 2) * max(iterations, 0),
+    closing: lambda kernel_size, iterations, shape="rect": 2 * (kernel_size // 2) * max(iterations, 0),
+    # 3x3 apertures.
+    sobel_edges: lambda: 1,
+    laplacian_edges: lambda: 1,
+    adaptive_mean_threshold: lambda block_size, c: block_size // 2,
+    adaptive_gaussian_threshold: lambda block_size, c: block_size // 2,
+}
+
+
+def tile_halo(operation: Union[Callable, Recipe], **params) -> int:
+    """
+    Halo width needed to tile the operation with these parameters. The halo
+    of a recipe is the sum of the halos of its steps.
+
+    Raises ValueError for operations that cannot be tiled.
+    """
+    if isinstance(operation, Recipe):
+        return sum(tile_halo(step.operation, **step.params) for step in operation.steps)
+    halo = TILE_HALOS.get(operation)
+    if halo is None:
+        raise ValueError(f"{getattr(operation, '__name__', operation)} cannot be run on tiles")
+    try:
+        return halo(**params)
+    except TypeError as exc:
+        # e.g. precomputed whole-image gradients passed to sobel_edges
+        raise ValueError(f"Unsupported parameters for tiled execution: {exc}") from exc
+
+
+def tile_grid(shape: Tuple[int, ...], tile_size: int):
+    """
+    Yield (y0, y1, x0, x1) for the tiles that cover an image of this shape.
+    """
+    height, width = shape[:2]
+    for y0 in range(0, height, tile_size):
+        for x0 in range(0, width, tile_size):
+            yield y0, min(y0 + tile_size, height), x0, min(x0 + tile_size, width)
+
+
+def _process_tile(
+    operation: Callable,
+    image: np.ndarray,
+    tile: Tuple[int, int, int, int],
+    halo: int,
+    params: dict,
+) -> np.ndarray:
+    """
+    Run the operation on one tile plus its halo and return the core part.
+    """
+    y0, y1, x0, x1 = tile
+    height, width = image.shape[:2]
+    top, left = max(y0 - halo, 0), max(x0 - halo, 0)
+    bottom, right = min(y1 + halo, height), min(x1 + halo, width)
+    # Copying reads the tile from the memory map into RAM.
+    padded = np.ascontiguousarray(image[top:bottom, left:right])
+    result = operation(padded, **params)
+    if result.shape[:2] != padded.shape[:2]:
+        raise ValueError("Tiled operations must keep the image size")
+    return result[y0 - top:y1 - top, x0 - left:x1 - left]
+
+
+def run_tiled(
+    image: np.ndarray,
+    operation: Union[Callable, Recipe],
+    tile_size: int = DEFAULT_TILE_SIZE,
+    output_path: Optional[str] = None,
+    max_workers: Optional[int] = None,
+    **params,
+) -> np.ndarray:
+    """
+    Apply operation(image, **params) tile by tile.
+
+    Args:
+        image: the input, typically a read-only memory map of a .npy file.
+        operation: a function listed in TILE_HALOS, or a Recipe made of them.
+        tile_size: side length of the tiles (without the halo).
+        output_path: if given, the result is written to this .npy file and
+            returned as a memory map of it; otherwise it is kept in memory.
+        max_workers: number of tiles processed at the same time
+            (defaults to the CPU count).
+
+    Returns:
+        The same array as operation(image, **params) would return.
+
+    Raises ValueError for an empty image or a tile size below 1.
+    """
+    if image.shape[0] == 0 or image.shape[1] == 0:
+        raise ValueError("Cannot run an operation on tiles of an empty image")
+    if tile_size < 1:
+        raise ValueError("The tile size must be at least 1")
+    halo = tile_halo(operation, **params)
+    tiles = list(tile_grid(image.shape, tile_size))
+
+    # The first tile tells us the dtype and channel layout of the output.
+    first = _process_tile(operation, image, tiles[0], halo, params)
+    shape = image.shape[:2] + first.shape[2:]
+    if output_path is not None:
+        output = np.lib.format.open_memmap(output_path, mode="w+", dtype=first.dtype, shape=shape)
+    else:
+        output = np.empty(shape, dtype=first.dtype)
+    y0, y1, x0, x1 = tiles[0]
+    output[y0:y1, x0:x1] = first
+
+    def work(tile: Tuple[int, int, int, int]) -> None:
+        ty0, ty1, tx0, tx1 = tile
+        # Tiles do not overlap in the output, so threads never write to the same pixels.
+        output[ty0:ty1, tx0:tx1] = _process_tile(operation, image, tile, halo, params)
+
+    workers = max_workers or default_worker_count()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # list() re-raises the first exception from a worker, if any.
+        list(executor.map(work, tiles[1:]))
+
+    if isinstance(output, np.memmap):
+        output.flush()
+    return output
+
+
+def parallel_median_blur(
+    image: np.ndarray,
+    kernel_size: int,
+    tile_size: int = DEFAULT_TILE_SIZE,
+    max_workers: Optional[int] = None,
+) -> np.ndarray:
+    """
+    Median blur computed on tiles in parallel. The result is identical to
+    apply_median_blur(image, kernel_size); large-window clean-up of salt
+    and pepper noise on big scans uses all cores this way.
+    """
+    return run_tiled(
+        image, apply_median_blur, tile_size=tile_size, max_workers=max_workers, kernel_size=kernel_size
+    )
@@ -0,0 +1,33 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# The app is run from the repository root (streamlit run Home.py), so the
+# processing and utils packages are imported from there.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+
+@pytest.fixture
+def random_image(rng):
+    """
+    Factory for random test images: random_image(shape, dtype, high).
+    Integer images cover [0, high) (by default the whole dtype range);
+    float images are in 0..1.
+    """
+
+    def make(shape, dtype=np.uint8, high=None):
+        dtype = np.dtype(dtype)
+        if np.issubdtype(dtype, np.floating):
+            return rng.random(shape).astype(dtype)
+        if high is None:
+            high = np.iinfo(dtype).max + 1
+        return rng.integers(0, high, size=shape).astype(dtype)
+
+    return make
@@ -0,0 +1,101 @@
+"""
+Batch helpers: stacked results own their memory, and the streaming
+pipeline keeps upload order, reports errors per image and never holds
+more than a bounded number of images.
+"""
+
+import io
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from processing.basic import invert_image
+from processing.batch import apply_to_batch, stream_batch
+
+
+def test_stacked_results_do_not_share_the_stack(random_image):
+    images = [random_image((6, 7, 3)) for _ in range(5)]
+    results = apply_to_batch(images, invert_image, max_workers=1)
+    for image, result in zip(images, results):
+        assert np.array_equal(result, invert_image(image))
+        # A view would keep the whole stack alive and report only its own size.
+        assert result.base is None
+
+
+def _upload(image, name):
+    ok, encoded = cv2.imencode(".png", image)
+    assert ok
+    upload = io.BytesIO(encoded.tobytes())
+    upload.name = name
+    return upload
+
+
+def _uploads(random_image, count):
+    return [_upload(random_image((8, 10, 3)), f"image_{index}.png") for index in range(count)]
+
+
+def _slow_invert(image):
+    # Finish out of order: later images are often done first.
+    time.sleep(float(image[0, 0, 0]) / 255 * 0.01)
+    return invert_image(image)
+
+
+def test_results_keep_upload_order(random_image):
+    uploads = _uploads(random_image, 20)
+    originals = [cv2.imdecode(np.frombuffer(upload.getvalue(), np.uint8), cv2.IMREAD_COLOR) for upload in uploads]
+    items = list(stream_batch(uploads, _slow_invert, max_workers=4))
+    assert [item.index for item in items] == list(range(20))
+    for item, original in zip(items, originals):
+        assert item.error is None
+        assert item.name == f"image_{item.index}.png"
+        assert np.array_equal(item.processed, 255 - cv2.cvtColor(original, cv2.COLOR_BGR2RGB))
+        assert item.encoded.startswith(b"\x89PNG")
+
+
+def test_errors_are_reported_per_image(random_image):
+    uploads = _uploads(random_image, 4)
+    broken = io.BytesIO(b"not an image")
+    broken.name = "broken.png"
+    uploads.insert(1, broken)
+
+    def fail_on_small(image):
+        if image.shape[0] < 8:
+            raise ValueError("too small")
+        return image
+
+    uploads.append(_upload(random_image((4, 4, 3)), "small.png"))
+    items = list(stream_batch(uploads, fail_on_small, max_workers=2))
+    assert [item.name for item in items if item.error is not None] == ["broken.png", "small.png"]
+    assert isinstance(items[-1].error, ValueError)
+    assert all(item.encoded is not None for item in items if item.error is None)
+
+
+def _counting(uploads, consumed):
+    for upload in uploads:
+        consumed.append(upload.name)
+        yield upload
+
+
+def test_queues_are_bounded(random_image):
+    consumed = []
+    stream = stream_batch(_counting(_uploads(random_image, 60), consumed), invert_image, queue_size=2, max_workers=2)
+    next(stream)
+    time.sleep(0.5)
+    # Three queues of two items, one item held by each stage and one by
+    # the caller.
+    assert len(consumed) <= 3 * 2 + 4
+    stream.close()
+
+
+def test_close_stops_the_pipeline(random_image):
+    before = threading.active_count()
+    consumed = []
+    stream = stream_batch(_counting(_uploads(random_image, 60), consumed), invert_image, queue_size=2, max_workers=2)
+    next(stream)
+    stream.close()
+    read = len(consumed)
+    time.sleep(0.3)
+    assert len(consumed) == read < 60
+    assert threading.active_count() == before
@@ -0,0 +1,120 @@
+"""
+The headless batch runner: resuming from the manifest and exit codes.
+"""
+
+import json
+import os
+
+import cv2
+import pytest
+
+import batch_cli
+from batch_cli import MANIFEST_NAME, main
+
+
+@pytest.fixture
+def folders(tmp_path, random_image):
+    input_dir, output_dir = tmp_path / "in", tmp_path / "out"
+    (input_dir / "sub").mkdir(parents=True)
+    for name in ("a.png", "a.jpg", "sub/b.png"):
+        cv2.imwrite(str(input_dir / name), random_image((12, 16, 3)))
+    return str(input_dir), str(output_dir)
+
+
+def _run(folders, *args):
+    return main(list(folders) + ["--workers", "2"] + list(args))
+
+
+def _pending(capsys):
+    # "N images found, M already done, K to process"
+    line = capsys.readouterr().out.splitlines()[0]
+    return int(line.split(", ")[2].split()[0])
+
+
+def _manifest(folders):
+    with open(os.path.join(folders[1], MANIFEST_NAME), encoding="utf-8") as handle:
+        return [json.loads(line) for line in handle]
+
+
+def test_resume_skips_finished_files(folders, capsys):
+    assert _run(folders, "--op", "filtering.apply_gaussian_blur", "--param", "kernel_size=5") == 0
+    assert _pending(capsys) == 3
+    # a.jpg and a.png do not overwrite each other.
+    assert sorted(entry["output"] for entry in _manifest(folders)) == [
+        "a.jpg.png",
+        "a.png.png",
+        os.path.join("sub", "b.png.png"),
+    ]
+    assert _run(folders, "--op", "filtering.apply_gaussian_blur", "--param", "kernel_size=5") == 0
+    assert _pending(capsys) == 0
+
+
+def test_changed_signature_reprocesses(folders, capsys):
+    assert _run(folders, "--op", "filtering.apply_gaussian_blur", "--param", "kernel_size=5") == 0
+    capsys.readouterr()
+    assert _run(folders, "--op", "filtering.apply_gaussian_blur", "--param", "kernel_size=7") == 0
+    assert _pending(capsys) == 3
+    assert _run(folders, "--op", "filtering.apply_gaussian_blur", "--param", "kernel_size=7", "--format", "jpg") == 0
+    assert _pending(capsys) == 3
+
+
+def test_tuple_params_resume(folders, capsys):
+    # The manifest stores tuples as lists; they must still match.
+    args = ["--op", "enhancement.sharpen_image", "--param", "kernel=((0, -1, 0), (-1, 5, -1), (0, -1, 0))"]
+    assert _run(folders, *args) == 0
+    capsys.readouterr()
+    assert _run(folders, *args) == 0
+    assert _pending(capsys) == 0
+
+
+def test_broken_file_fails_the_run(folders, capsys):
+    with open(os.path.join(folders[0], "broken.png"), "wb") as handle:
+        handle.write(b"not an image")
+    assert _run(folders, "--op", "basic.invert_image") == 1
+    assert "failed: broken.png" in capsys.readouterr().err
+    assert len(_manifest(folders)) == 3
+
+
+def test_partial_last_line(folders, capsys):
+    assert _run(folders, "--op", "basic.invert_image") == 0
+    manifest_path = os.path.join(folders[1], MANIFEST_NAME)
+    with open(manifest_path, encoding="utf-8") as handle:
+        lines = handle.read().splitlines()
+    # Simulate a crash while the last entry was being written, plus lines
+    # that are valid JSON but not entries.
+    with open(manifest_path, "w", encoding="utf-8") as handle:
+        handle.write("\n".join(lines[:-1] + ["[1, 2]", '{"op": "basic.invert_image"}', lines[-1][:10]]))
+    capsys.readouterr()
+
+    assert _run(folders, "--op", "basic.invert_image") == 0
+    assert _pending(capsys) == 1
+    assert _run(folders, "--op", "basic.invert_image") == 0
+    assert _pending(capsys) == 0
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ["--op", "filtering.no_such_filter"],
+        ["--op", "no_such_module.invert_image"],
+        ["--op", "filtering._box"],
+        # Callables imported into a processing module, not defined there.
+        ["--op", "tiling.ThreadPoolExecutor"],
+        ["--op", "basic.cv2.imwrite"],
+        ["--op", "filtering.apply_gaussian_blur", "--param", "kernel_size"],
+        ["--op", "filtering.apply_gaussian_blur", "--param", "radius=5"],
+        # Not representable in the JSON manifest.
+        ["--op", "filtering.apply_gaussian_blur", "--param", "kernel_size=1j"],
+        ["--op", "filtering.apply_gaussian_blur", "--param", "kernel_size=(b'5',)"],
+    ],
+)
+def test_bad_operation_exits_with_2(folders, capsys, args):
+    assert _run(folders, *args) == 2
+    assert capsys.readouterr().err.startswith("error:")
+    assert not os.path.exists(folders[1])
+
+
+def test_parse_params():
+    assert batch_cli.parse_params(["k=5", "name=abc", "size=(3, 4)"]) == {"k": 5, "name": "abc", "size": (3, 4)}
+    with pytest.raises(ValueError):
+        batch_cli.parse_params(["value=1j"])
@@ -0,0 +1,132 @@
+"""
+Result caches: the in-memory LRU bounded by bytes, cache keys that follow
+code changes, and the disk cache's eviction.
+"""
+
+import os
+import time
+
+import numpy as np
+import pytest
+
+import processing.cache as cache
+from processing.basic import invert_image
+from processing.cache import ResultCache, operation_key, run_cached
+from utils.image_io import EVICT_TO_FRACTION, STALE_TMP_SECONDS, DiskArrayCache
+
+
+def _array(value, nbytes=100):
+    return np.full(nbytes, value, dtype=np.uint8)
+
+
+def test_lru_eviction_by_bytes():
+    results = ResultCache(max_bytes=300)
+    for key in "abc":
+        results.put(key, _array(1))
+    assert results.get("a") is not None  # "b" is now the oldest
+    results.put("d", _array(2))
+    assert results.get("b") is None
+    assert all(results.get(key) is not None for key in "acd")
+    assert results.stats()["bytes"] == 300
+
+    # Larger than the whole cache: not stored, nothing evicted.
+    results.put("huge", _array(3, nbytes=301))
+    assert results.get("huge") is None
+    assert results.stats()["entries"] == 3
+
+
+def test_hit_and_miss_counters():
+    results = ResultCache(max_bytes=1000)
+    results.put("a", _array(1))
+    results.get("a")
+    results.get("a")
+    results.get("missing")
+    stats = results.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 1)
+
+
+@pytest.fixture
+def fresh_cache(monkeypatch):
+    monkeypatch.delenv("DIP_DISK_CACHE_DIR", raising=False)
+    monkeypatch.setattr(cache, "_result_cache", ResultCache())
+    return cache._result_cache
+
+
+def test_run_cached_reuses_results(fresh_cache, random_image):
+    image = random_image((20, 30, 3))
+    first = run_cached(invert_image, image)
+    second = run_cached(invert_image, image.copy())
+    assert second is first
+    assert not first.flags.writeable
+    assert image.flags.writeable
+    stats = fresh_cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def _define(source):
+    # Functions that look like they live in the processing package.
+    namespace = {"__name__": "processing.example"}
+    exec(source, namespace)
+    return namespace["operation"]
+
+
+OPERATION = """
+SCALE = {scale}
+
+def helper(image):
+    return image + {offset}
+
+def operation(image):
+    return helper(image) * SCALE
+"""
+
+
+def test_key_follows_code_changes():
+    image = np.zeros((2, 2), np.uint8)
+
+    def key(**values):
+        return operation_key(_define(OPERATION.format(**values)), image, (), {})
+
+    original = key(scale=2, offset=1)
+    assert key(scale=2, offset=1) == original
+    # A changed helper or module constant gives a new key, so results
+    # cached on disk by the old code are not reused.
+    assert key(scale=2, offset=5) != original
+    assert key(scale=3, offset=1) != original
+
+
+def _file_size(directory):
+    return sum(entry.stat().st_size for entry in os.scandir(directory) if entry.name.endswith(".npy"))
+
+
+def test_disk_cache_evicts_oldest_down_to_fraction(tmp_path):
+    probe = DiskArrayCache(str(tmp_path / "probe"))
+    probe.put("x", _array(0, 1000))
+    file_size = _file_size(probe.directory)
+
+    disk = DiskArrayCache(str(tmp_path / "cache"), max_bytes=5 * file_size)
+    for index in range(5):
+        disk.put(f"key{index}", _array(index, 1000))
+        # Distinct modification times make the LRU order deterministic.
+        os.utime(disk._path(f"key{index}"), (index + 1, index + 1))
+    assert disk.get("key0") is not None  # refreshes key0
+
+    disk.put("key5", _array(5, 1000))
+    total = _file_size(disk.directory)
+    assert total <= EVICT_TO_FRACTION * disk.max_bytes
+    survivors = [index for index in range(6) if disk.get(f"key{index}") is not None]
+    # Six files are over the cap of five; 90% of the cap leaves room for four.
+    assert survivors == [0, 3, 4, 5]
+    assert np.array_equal(disk.get("key5"), _array(5, 1000))
+    assert disk._total_bytes == total
+
+
+def test_disk_cache_removes_stale_temp_files(tmp_path):
+    stale, fresh = tmp_path / "stale.tmp", tmp_path / "fresh.tmp"
+    stale.write_bytes(b"partial")
+    fresh.write_bytes(b"partial")
+    old = time.time() - STALE_TMP_SECONDS - 10
+    os.utime(stale, (old, old))
+    DiskArrayCache(str(tmp_path))
+    assert not stale.exists()
+    assert fresh.exists()
@@ -0,0 +1,54 @@
+"""
+Every convolution strategy must match cv2.filter2D.
+"""
+
+import cv2
+import numpy as np
+import pytest
+
+from processing.convolution import convolve, parse_kernel, separable_factors
+
+STRATEGIES = ["direct", "separable", "fft"]
+
+
+def _kernels(rng):
+    gaussian = cv2.getGaussianKernel(21, 4)
+    return {
+        "gaussian": (gaussian @ gaussian.T).astype(np.float32),
+        "rank2": (rng.random((9, 1)) @ rng.random((1, 9)) + rng.random((9, 1)) @ rng.random((1, 9))).astype(
+            np.float32
+        ),
+        "dense": (rng.random((15, 15)) - 0.5).astype(np.float32),
+        "wide": (rng.random((3, 25)) / 75).astype(np.float32),
+    }
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES + ["auto"])
+@pytest.mark.parametrize("name", ["gaussian", "rank2", "dense", "wide"])
+def test_float_matches_filter2d(rng, random_image, strategy, name):
+    kernel = _kernels(rng)[name]
+    image = random_image((73, 97, 3), np.float32)
+    expected = cv2.filter2D(image, -1, kernel)
+    np.testing.assert_allclose(convolve(image, kernel, strategy), expected, atol=1e-4)
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+def test_uint8_within_one_level(rng, random_image, strategy):
+    kernel = _kernels(rng)["gaussian"]
+    image = random_image((73, 97))
+    result = convolve(image, kernel, strategy)
+    assert result.dtype == np.uint8
+    difference = np.abs(result.astype(int) - cv2.filter2D(image, -1, kernel).astype(int))
+    assert difference.max() <= 1
+
+
+def test_separable_rank():
+    kernel = parse_kernel("1 2 1\n2 4 2\n1 2 1")
+    assert len(separable_factors(kernel)) == 1
+
+
+def test_invalid_kernel():
+    with pytest.raises(ValueError):
+        parse_kernel("1 2\n3")
+    with pytest.raises(ValueError):
+        convolve(np.zeros((5, 5), np.uint8), [[1.0]], "unknown")
@@ -0,0 +1,135 @@
+"""
+Large Gaussian blurs must stay within the documented distance of
+cv2.GaussianBlur, the large-window median must be exact for every depth
+and whichever path computes it, and the edge-preserving filters must stay
+consistent when they cut corners.
+"""
+
+import cv2
+import numpy as np
+import pytest
+
+import processing.filtering as filtering
+from processing.filtering import (
+    apply_bilateral_grid,
+    apply_gaussian_blur,
+    apply_guided_filter,
+    apply_median_blur,
+    gaussian_blur_strategy,
+)
+
+# An odd size, so the pyramid cannot halve it evenly.
+BLUR_SHAPE = (241, 323)
+
+
+def _natural_image(rng, shape):
+    # Smooth noise at a few scales with flat shapes of random gray on top.
+    image = np.zeros(shape, np.float32)
+    for scale in (4, 16, 64):
+        coarse = rng.random((shape[0] // scale + 2, shape[1] // scale + 2)).astype(np.float32)
+        image += cv2.resize(coarse, (shape[1], shape[0]), interpolation=cv2.INTER_CUBIC) * 80
+    for _ in range(20):
+        x, y = int(rng.integers(0, shape[1])), int(rng.integers(0, shape[0]))
+        gray = float(rng.uniform(0, 255))
+        if rng.random() < 0.5:
+            cv2.circle(image, (x, y), int(rng.integers(5, 60)), gray, -1)
+        else:
+            cv2.rectangle(image, (x, y), (x + int(rng.integers(5, 100)), y + int(rng.integers(5, 100))), gray, -1)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+@pytest.mark.parametrize(
+    "strategy, kernel_size",
+    [("direct", 31), ("box", 33), ("box", 99), ("box", 157), ("pyramid", 159), ("pyramid", 321), ("pyramid", 401)],
+)
+@pytest.mark.parametrize("content", ["natural", "steps"])
+def test_gaussian_blur_accuracy(rng, strategy, kernel_size, content):
+    if content == "natural":
+        image = _natural_image(rng, BLUR_SHAPE)
+    else:
+        cells = rng.integers(0, 2, (BLUR_SHAPE[0] // 40 + 1, BLUR_SHAPE[1] // 40 + 1)).astype(np.uint8)
+        image = np.kron(cells, np.full((40, 40), 255, np.uint8))[: BLUR_SHAPE[0], : BLUR_SHAPE[1]]
+    assert gaussian_blur_strategy(kernel_size) == strategy
+    expected = cv2.GaussianBlur(image, (kernel_size, kernel_size), 0)
+    difference = np.abs(apply_gaussian_blur(image, kernel_size).astype(int) - expected)
+    if strategy == "direct":
+        assert difference.max() == 0
+    # The bounds documented in processing.filtering.
+    assert difference.max() <= 10
+    assert difference.mean() < 1.5
+
+
+def _reference_median(channel, kernel_size):
+    radius = kernel_size // 2
+    padded = np.pad(channel, radius, mode="edge")
+    windows = np.lib.stride_tricks.sliding_window_view(padded, (kernel_size, kernel_size))
+    return np.median(windows.reshape(channel.shape + (-1,)), axis=-1).astype(channel.dtype)
+
+
+@pytest.fixture(params=["bytes", "sorting"])
+def median_path(request, monkeypatch):
+    # A zero cost always keeps the byte-wise path; an infinite one always sorts.
+    monkeypatch.setattr(filtering, "MEDIAN_BYTE_COST", 0 if request.param == "bytes" else float("inf"))
+    return request.param
+
+
+@pytest.mark.parametrize("kernel_size", [7, 31, 101])
+def test_uint16_with_8_bit_values_matches_opencv(random_image, kernel_size):
+    image = random_image((120, 150, 3))
+    result = apply_median_blur(image.astype(np.uint16), kernel_size)
+    assert result.dtype == np.uint16
+    assert np.array_equal(result, cv2.medianBlur(image, kernel_size))
+
+
+@pytest.mark.parametrize("dtype", [np.uint16, np.int32, np.float32])
+def test_matches_reference(random_image, median_path, dtype):
+    # Many distinct values, so several bytes are processed.
+    image = random_image((40, 50), high=60000).astype(dtype)
+    assert np.array_equal(apply_median_blur(image, 9), _reference_median(image, 9))
+
+
+@pytest.mark.parametrize("kernel_size", [7, 15])
+def test_full_range_uint16_matches_np_median(random_image, median_path, kernel_size):
+    image = random_image((45, 60), np.uint16)
+    assert np.array_equal(apply_median_blur(image, kernel_size), _reference_median(image, kernel_size))
+
+
+def test_smooth_uint16(random_image, median_path):
+    # Smooth data gives few prefixes per block.
+    ramp = np.add.outer(np.arange(90) * 300, np.arange(110) * 200).astype(np.uint16)
+    noisy = ramp + random_image(ramp.shape, np.uint16, high=50)
+    assert np.array_equal(apply_median_blur(noisy, 15), _reference_median(noisy, 15))
+
+
+def test_noisy_data_is_sorted(random_image, monkeypatch):
+    # Scattered prefixes would make the byte-wise path filter every block
+    # hundreds of times; the estimate must send them to sorting instead.
+    calls = []
+    sort = filtering._median_by_sorting
+    monkeypatch.setattr(filtering, "_median_by_sorting", lambda *args: calls.append(args) or sort(*args))
+    image = random_image((200, 200), np.uint16)
+    apply_median_blur(image, 7)
+    assert len(calls) == 1
+    # Large windows over smooth data stay byte-wise.
+    smooth = np.add.outer(np.arange(200) * 150, np.arange(200) * 100).astype(np.uint16)
+    apply_median_blur(smooth, 51)
+    assert len(calls) == 1
+
+
+def test_guided_filter_shares_the_guide_statistics(random_image):
+    # Filtering the channels together must match filtering them one by one.
+    image = random_image((60, 80, 3))
+    together = apply_guided_filter(image, 4, 0.01)
+    for index in range(3):
+        alone = apply_guided_filter(image[:, :, index], 4, 0.01, guide=image)
+        assert np.abs(together[:, :, index].astype(int) - alone).max() <= 1
+
+
+def test_bilateral_grid_is_limited(random_image, monkeypatch):
+    image = random_image((200, 300))
+    exact = apply_bilateral_grid(image, 2, 5)
+    monkeypatch.setattr(filtering, "BILATERAL_MAX_CELLS", 50000)
+    coarse = apply_bilateral_grid(image, 2, 5)
+    assert coarse.shape == image.shape and coarse.dtype == image.dtype
+    # Sampling more coarsely only smooths a little more.
+    assert np.abs(coarse.astype(int) - exact).mean() < 10
@@ -0,0 +1,65 @@
+"""
+Decoding uploads: OpenCV must give the same pixels as Pillow for the
+formats it handles, and the formats left to Pillow decode to known values.
+"""
+
+import io
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+from utils.image_io import _decode_with_pil, load_image_from_upload
+
+
+def _encode(array, extension):
+    ok, encoded = cv2.imencode(extension, array)
+    assert ok
+    return encoded.tobytes()
+
+
+def _load(data):
+    image = load_image_from_upload(io.BytesIO(data))
+    assert image is not None
+    return image
+
+
+@pytest.mark.parametrize("extension", [".png", ".jpg", ".bmp"])
+@pytest.mark.parametrize("channels", [1, 3])
+def test_opencv_matches_pillow(random_image, extension, channels):
+    shape = (40, 50) if channels == 1 else (40, 50, 3)
+    data = _encode(random_image(shape), extension)
+    assert np.array_equal(_load(data), _decode_with_pil(data, 1))
+
+
+def test_16_bit_gray_png_is_clipped():
+    ramp = np.array([[0, 1, 100, 255, 256, 1000, 40000, 65535]], dtype=np.uint16)
+    image = _load(_encode(ramp, ".png"))
+    expected = np.repeat(np.minimum(ramp, 255).astype(np.uint8)[:, :, None], 3, axis=2)
+    assert image.dtype == np.uint8
+    assert np.array_equal(image, expected)
+
+
+def test_16_bit_color_png_keeps_the_high_byte():
+    ramp = np.array([[0, 255, 256, 1000, 40000, 65535]], dtype=np.uint16)
+    rgb = np.dstack([ramp, ramp // 2, ramp[:, ::-1]])
+    image = _load(_encode(rgb[:, :, ::-1], ".png"))
+    assert np.array_equal(image, (rgb >> 8).astype(np.uint8))
+
+
+@pytest.mark.parametrize(
+    "cmyk, rgb",
+    [
+        ((0, 255, 255, 0), (255, 0, 0)),
+        ((255, 0, 0, 0), (0, 255, 255)),
+        ((0, 0, 0, 128), (127, 127, 127)),
+        ((0, 0, 0, 0), (255, 255, 255)),
+    ],
+)
+def test_cmyk_jpeg_colors(cmyk, rgb):
+    encoded = io.BytesIO()
+    Image.new("CMYK", (16, 16), cmyk).save(encoded, "JPEG", quality=95)
+    image = _load(encoded.getvalue())
+    assert image.shape == (16, 16, 3)
+    assert np.abs(image.astype(int) - rgb).max() <= 2
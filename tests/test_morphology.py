@@ -0,0 +1,72 @@
+"""
+The morphology fast paths must match cv2.erode / cv2.dilate / cv2.morphologyEx.
+"""
+
+import cv2
+import numpy as np
+import pytest
+
+import processing.morphology as morphology
+from processing.morphology import MORPH_SHAPES, closing, dilate, erode, opening, structuring_element
+
+OPENCV = {
+    erode: lambda image, element, iterations: cv2.erode(image, element, iterations=iterations),
+    dilate: lambda image, element, iterations: cv2.dilate(image, element, iterations=iterations),
+    opening: lambda image, element, iterations: cv2.morphologyEx(
+        image, cv2.MORPH_OPEN, element, iterations=iterations
+    ),
+    closing: lambda image, element, iterations: cv2.morphologyEx(
+        image, cv2.MORPH_CLOSE, element, iterations=iterations
+    ),
+}
+
+
+@pytest.fixture
+def fast_paths(monkeypatch):
+    # Use the decomposition and van Herk/Gil-Werman on small elements too.
+    monkeypatch.setattr(morphology, "DECOMPOSE_MIN_SIZE", 3)
+    monkeypatch.setattr(morphology, "VHGW_MIN_LENGTH", 3)
+
+
+SHAPE = (67, 91, 3)
+
+
+@pytest.mark.parametrize("operation", list(OPENCV))
+@pytest.mark.parametrize("shape", MORPH_SHAPES)
+@pytest.mark.parametrize("kernel_size", [1, 3, 4, 7, 31])
+@pytest.mark.parametrize("iterations", [0, 1, 2, 3])
+def test_matches_opencv(random_image, fast_paths, operation, shape, kernel_size, iterations):
+    image = random_image(SHAPE)
+    expected = OPENCV[operation](image, structuring_element(shape, kernel_size), iterations)
+    assert np.array_equal(operation(image, kernel_size, iterations, shape), expected)
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint16, np.float32])
+@pytest.mark.parametrize("shape", MORPH_SHAPES)
+def test_dtypes(random_image, fast_paths, dtype, shape):
+    image = random_image(SHAPE, dtype)
+    for operation in (erode, dilate):
+        expected = OPENCV[operation](image, structuring_element(shape, 9), 2)
+        assert np.array_equal(operation(image, 9, 2, shape), expected)
+
+
+def test_default_thresholds(random_image):
+    # A long line and a large ellipse with the real thresholds.
+    image = random_image(SHAPE)
+    for shape, kernel_size in (("hline", 301), ("vline", 211), ("ellipse", 41)):
+        expected = cv2.dilate(image, structuring_element(shape, kernel_size))
+        assert np.array_equal(dilate(image, kernel_size, 1, shape), expected)
+
+
+def test_single_channel_axis(random_image, fast_paths):
+    image = random_image(SHAPE)[:, :, :1]
+    result = erode(image, 5, 1)
+    assert result.shape == image.shape
+    assert np.array_equal(result[:, :, 0], cv2.erode(image, structuring_element("rect", 5)))
+
+
+def test_iterations_zero_returns_a_copy(random_image):
+    image = random_image(SHAPE)
+    result = erode(image, 5, 0)
+    assert np.array_equal(result, image)
+    assert not np.shares_memory(result, image)
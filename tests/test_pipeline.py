@@ -0,0 +1,99 @@
+"""
+Recipes: the optimized run gives the same pixels as running the steps one
+by one, never writes into its input, and survives a JSON round trip.
+"""
+
+import json
+
+import numpy as np
+import pytest
+
+from processing.basic import invert_image, to_grayscale
+from processing.edges import canny_edges
+from processing.filtering import apply_gaussian_blur
+from processing.morphology import closing
+from processing.pipeline import Recipe, Step
+from processing.thresholding import global_threshold
+
+RECIPES = {
+    "fused luts": [(invert_image, {}), (invert_image, {}), (global_threshold, {"thresh_value": 100})],
+    "lut around a filter": [
+        (invert_image, {}),
+        (apply_gaussian_blur, {"kernel_size": 5}),
+        (invert_image, {}),
+        (global_threshold, {"thresh_value": 60, "max_value": 200}),
+    ],
+    "redundant grayscale": [
+        (to_grayscale, {}),
+        (canny_edges, {"threshold1": 50, "threshold2": 150}),
+        (to_grayscale, {}),
+        (closing, {"kernel_size": 3, "iterations": 1}),
+    ],
+    "grayscale then lut": [(to_grayscale, {}), (invert_image, {}), (global_threshold, {"thresh_value": 127})],
+}
+
+
+def _step_by_step(steps, image):
+    for operation, params in steps:
+        image = operation(image, **params)
+    return image
+
+
+def _recipe(steps):
+    recipe = Recipe()
+    for operation, params in steps:
+        recipe.add(operation, **params)
+    return recipe
+
+
+@pytest.mark.parametrize("name", list(RECIPES))
+@pytest.mark.parametrize("shape", [(30, 40, 3), (30, 40)])
+def test_same_pixels_as_step_by_step(random_image, name, shape):
+    image = random_image(shape)
+    steps = RECIPES[name]
+    expected = _step_by_step(steps, image)
+    result = _recipe(steps).run(image)
+    assert result.shape == expected.shape
+    assert np.array_equal(result, expected)
+
+
+def test_16_bit_images_are_not_fused(random_image):
+    image = random_image((30, 40), np.uint16)
+    steps = [(invert_image, {}), (invert_image, {})]
+    assert np.array_equal(_recipe(steps).run(image), image)
+
+
+def test_redundant_conversions_are_removed():
+    recipe = _recipe(RECIPES["redundant grayscale"])
+    assert [step.operation for step in recipe.optimized_steps()] == [canny_edges, closing]
+
+
+@pytest.mark.parametrize("name", list(RECIPES))
+@pytest.mark.parametrize("writeable", [True, False])
+def test_input_is_not_modified(random_image, name, writeable):
+    image = random_image((30, 40))
+    image.flags.writeable = writeable
+    before = image.copy()
+    _recipe(RECIPES[name]).run(image)
+    assert np.array_equal(image, before)
+
+
+def test_timings_name_fused_steps(random_image):
+    _, timings = _recipe(RECIPES["fused luts"]).run_with_timings(random_image((30, 40)))
+    assert [name for name, _ in timings] == [
+        "basic.invert_image + basic.invert_image + thresholding.global_threshold (fused)"
+    ]
+
+
+def test_dict_round_trip(random_image):
+    recipe = _recipe(RECIPES["lut around a filter"] + RECIPES["redundant grayscale"])
+    data = json.loads(json.dumps(recipe.to_dict()))
+    restored = Recipe.from_dict(data)
+    assert restored.to_dict() == recipe.to_dict()
+    image = random_image((30, 40, 3))
+    assert np.array_equal(restored.run(image), recipe.run(image))
+
+
+def test_unknown_parameters_fail_early():
+    with pytest.raises(TypeError):
+        Step(apply_gaussian_blur, {"radius": 3})
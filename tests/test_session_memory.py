@@ -0,0 +1,128 @@
+"""
+Per-session memory accounting: spilling idle sessions, reporting only
+memory that was really released, and falling back to the result cache.
+"""
+
+import os
+import threading
+
+import numpy as np
+import pytest
+
+import utils.session_memory as session_memory
+from processing.cache import ResultCache
+from utils.session_memory import SessionMemoryRegistry, SpillableImage
+
+
+@pytest.fixture
+def result_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(session_memory, "SPILL_DIR", str(tmp_path / "spill"))
+    monkeypatch.setattr(session_memory, "_spill_dir", None)
+    cache = ResultCache()
+    monkeypatch.setattr(session_memory, "get_result_cache", lambda: cache)
+    return cache
+
+
+def _holder(nbytes, value=1):
+    return SpillableImage(np.full(nbytes, value, dtype=np.uint8))
+
+
+def test_spill_and_reload(result_cache):
+    registry = SessionMemoryRegistry(budget_bytes=1500)
+    idle = _holder(1000, value=7)
+    registry.set_image("idle", "original_image", idle)
+    registry.set_image("current", "original_image", _holder(1000))
+
+    assert registry.enforce_budget("current") == 1000
+    assert idle.spilled
+    assert registry.total_bytes() == 1000
+    assert len(os.listdir(session_memory.spill_dir())) == 1
+
+    image = idle.get()
+    assert np.array_equal(image, np.full(1000, 7, np.uint8))
+    assert not image.flags.writeable
+    assert os.listdir(session_memory.spill_dir()) == []
+
+
+def test_current_session_is_never_spilled(result_cache):
+    registry = SessionMemoryRegistry(budget_bytes=100)
+    current = _holder(1000)
+    registry.set_image("current", "original_image", current)
+    assert registry.enforce_budget("current") == 0
+    assert not current.spilled
+
+
+def test_only_released_memory_is_reported(result_cache):
+    registry = SessionMemoryRegistry(budget_bytes=100)
+    kept = np.zeros(1000, np.uint8)
+    # A read-only view, as stored by the state manager, of an array that
+    # the caller still holds.
+    view = kept.view()
+    view.flags.writeable = False
+    holder = SpillableImage(view)
+    del view
+    registry.set_image("idle", "original_image", holder)
+    registry.set_image("other", "processed_image", _holder(500))
+
+    assert registry.enforce_budget("current") == 500
+    assert holder.spilled
+
+
+def test_spilled_images_leave_the_result_cache(result_cache):
+    registry = SessionMemoryRegistry(budget_bytes=100)
+    holder = _holder(1000)
+    result_cache.put("key", holder.peek())
+    registry.set_image("idle", "processed_image", holder)
+
+    # Counted once although the session and the cache share it.
+    assert registry.total_bytes() == 1000
+    assert registry.enforce_budget("current") == 1000
+    assert result_cache.stats()["entries"] == 0
+
+
+def test_result_cache_is_evicted_when_spilling_is_not_enough(result_cache):
+    registry = SessionMemoryRegistry(budget_bytes=2500)
+    for index in range(4):
+        result_cache.put(f"key{index}", np.zeros(1000, np.uint8))
+    assert registry.enforce_budget("current") == 2000
+    assert result_cache.get("key0") is None and result_cache.get("key1") is None
+    assert result_cache.get("key3") is not None
+
+
+def test_other_sessions_are_not_blocked_while_spilling(result_cache, monkeypatch):
+    registry = SessionMemoryRegistry(budget_bytes=100)
+    registry.set_image("idle", "original_image", _holder(1000))
+    started, release = threading.Event(), threading.Event()
+    save = np.save
+
+    def slow_save(*args, **kwargs):
+        started.set()
+        release.wait(5)
+        save(*args, **kwargs)
+
+    monkeypatch.setattr(session_memory.np, "save", slow_save)
+    spiller = threading.Thread(target=registry.enforce_budget, args=("current",))
+    spiller.start()
+    try:
+        assert started.wait(5)
+        toucher = threading.Thread(target=registry.touch, args=("other",))
+        toucher.start()
+        toucher.join(1)
+        assert not toucher.is_alive()
+    finally:
+        release.set()
+        spiller.join()
+
+
+def test_stale_spill_directories_are_removed(result_cache):
+    os.makedirs(session_memory.SPILL_DIR)
+    # Process ids are far below this on every common system.
+    stale = os.path.join(session_memory.SPILL_DIR, "999999999-old")
+    running = os.path.join(session_memory.SPILL_DIR, f"{os.getppid()}-running")
+    os.makedirs(stale)
+    os.makedirs(running)
+
+    directory = session_memory.spill_dir()
+    assert os.path.basename(directory).startswith(f"{os.getpid()}-")
+    assert not os.path.exists(stale)
+    assert os.path.exists(running)
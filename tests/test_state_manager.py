@@ -0,0 +1,106 @@
+"""
+Session state helpers, run against a plain dict instead of a live
+Streamlit session.
+"""
+
+import types
+
+import numpy as np
+import pytest
+
+import utils.state_manager as state_manager
+from processing.basic import invert_image
+from utils.session_memory import SessionMemoryRegistry
+
+
+@pytest.fixture
+def session(monkeypatch):
+    monkeypatch.setattr(state_manager, "st", types.SimpleNamespace(session_state={}))
+    monkeypatch.setattr(state_manager, "get_registry", lambda: registry)
+    monkeypatch.delenv("DIP_IMAGE_STORE_DIR", raising=False)
+    registry = SessionMemoryRegistry(1 << 40)
+    state_manager.init_state()
+    return state_manager.st.session_state
+
+
+def test_original_is_shared_read_only_without_freezing_the_caller(session, random_image):
+    image = random_image((20, 30, 3))
+    state_manager.set_original_image(image)
+
+    stored = state_manager.get_original_image()
+    assert state_manager.get_processed_image() is stored
+    assert np.shares_memory(stored, image)
+    assert not stored.flags.writeable
+    # The caller's own array is still writable.
+    image[0, 0] = 0
+
+
+def test_reset_shares_the_original(session, random_image):
+    state_manager.set_original_image(random_image((20, 30, 3)))
+    state_manager.set_processed_image(invert_image(state_manager.get_working_image()))
+    state_manager.reset_to_original()
+    assert state_manager.get_processed_image() is state_manager.get_original_image()
+
+
+def _process(count, random_image):
+    results = []
+    for _ in range(count):
+        result = random_image((20, 30, 3))
+        state_manager.set_processed_image(result)
+        results.append(result)
+    return results
+
+
+def test_undo_and_redo(session, random_image):
+    original = random_image((20, 30, 3))
+    state_manager.set_original_image(original)
+    first, second = _process(2, random_image)
+
+    state_manager.undo()
+    assert np.array_equal(state_manager.get_processed_image(), first)
+    state_manager.undo()
+    assert state_manager.get_processed_image() is state_manager.get_original_image()
+    assert not state_manager.can_undo()
+
+    state_manager.redo()
+    assert np.array_equal(state_manager.get_processed_image(), first)
+    state_manager.redo()
+    assert np.array_equal(state_manager.get_processed_image(), second)
+    assert not state_manager.can_redo()
+
+
+def _snapshot_bytes(random_image):
+    # Random pixels do not compress, so every snapshot has about this size.
+    return state_manager._compress_snapshot(random_image((20, 30, 3)))["nbytes"]
+
+
+def test_history_budget_drops_oldest_undo_steps(session, random_image, monkeypatch):
+    budget = int(2.5 * _snapshot_bytes(random_image))
+    monkeypatch.setattr(state_manager, "HISTORY_BUDGET_BYTES", budget)
+    state_manager.set_original_image(random_image((20, 30, 3)))
+    results = _process(6, random_image)
+
+    assert state_manager.get_history_bytes() <= budget
+    undone = 0
+    while state_manager.can_undo():
+        state_manager.undo()
+        undone += 1
+        assert np.array_equal(state_manager.get_processed_image(), results[-1 - undone])
+    assert undone == 2
+
+
+def test_history_budget_also_trims_redo(session, random_image, monkeypatch):
+    state_manager.set_original_image(random_image((20, 30, 3)))
+    results = _process(4, random_image)
+    for _ in range(4):
+        state_manager.undo()
+
+    # Only the redo history is left, and it alone is over the new budget.
+    budget = int(1.5 * _snapshot_bytes(random_image))
+    monkeypatch.setattr(state_manager, "HISTORY_BUDGET_BYTES", budget)
+    state_manager.redo()
+    assert np.array_equal(state_manager.get_processed_image(), results[0])
+    assert state_manager.get_history_bytes() <= budget
+    # The redo step right after the current image is kept.
+    state_manager.redo()
+    assert np.array_equal(state_manager.get_processed_image(), results[1])
@@ -0,0 +1,71 @@
+"""
+Tiled execution must give exactly the same result as the whole image.
+"""
+
+import numpy as np
+import pytest
+
+from processing.filtering import apply_average_blur, apply_gaussian_blur, apply_median_blur
+from processing.morphology import MORPH_SHAPES, closing, dilate, erode, opening
+from processing.tiling import parallel_median_blur, run_tiled, tile_halo
+
+# Odd sizes so that the last row and column of tiles are partial.
+SHAPE = (157, 203)
+COLOR = SHAPE + (3,)
+
+
+@pytest.mark.parametrize("kernel_size", [5, 41, 101])
+def test_gaussian_blur(random_image, kernel_size):
+    image = random_image(COLOR)
+    tiled = run_tiled(image, apply_gaussian_blur, tile_size=48, kernel_size=kernel_size)
+    assert np.array_equal(tiled, apply_gaussian_blur(image, kernel_size))
+
+
+def test_average_blur(random_image):
+    image = random_image(COLOR)
+    tiled = run_tiled(image, apply_average_blur, tile_size=48, kernel_size=15)
+    assert np.array_equal(tiled, apply_average_blur(image, 15))
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint16])
+@pytest.mark.parametrize("kernel_size", [3, 21])
+def test_median_blur(random_image, dtype, kernel_size):
+    image = random_image(COLOR, dtype)
+    tiled = parallel_median_blur(image, kernel_size, tile_size=48)
+    assert np.array_equal(tiled, apply_median_blur(image, kernel_size))
+
+
+@pytest.mark.parametrize("operation", [erode, dilate, opening, closing])
+@pytest.mark.parametrize("shape", MORPH_SHAPES)
+@pytest.mark.parametrize("iterations", [0, 1, 3])
+def test_morphology(random_image, operation, shape, iterations):
+    image = random_image(SHAPE)
+    params = dict(kernel_size=5, iterations=iterations, shape=shape)
+    tiled = run_tiled(image, operation, tile_size=40, **params)
+    assert np.array_equal(tiled, operation(image, **params))
+
+
+def test_morphology_large_element(random_image):
+    # Large enough to use the decomposed and van Herk paths.
+    image = random_image(COLOR)
+    params = dict(kernel_size=41, iterations=2, shape="ellipse")
+    tiled = run_tiled(image, erode, tile_size=64, **params)
+    assert np.array_equal(tiled, erode(image, **params))
+
+
+def test_output_path(random_image, tmp_path):
+    image = random_image(COLOR)
+    output_path = str(tmp_path / "blurred.npy")
+    tiled = run_tiled(image, apply_average_blur, tile_size=64, output_path=output_path, kernel_size=7)
+    assert np.array_equal(np.load(output_path), apply_average_blur(image, 7))
+    assert np.array_equal(tiled, apply_average_blur(image, 7))
+
+
+def test_empty_image():
+    with pytest.raises(ValueError):
+        run_tiled(np.zeros((0, 10), np.uint8), apply_average_blur, kernel_size=3)
+
+
+def test_pyramid_gaussian_cannot_be_tiled():
+    with pytest.raises(ValueError):
+        tile_halo(apply_gaussian_blur, kernel_size=1001)
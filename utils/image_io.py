@@ -1,26 +1,124 @@
+import hashlib
 import io
-from typing import Optional
+import os
+import tempfile
+import threading
+import time
+from typing import List, Optional, Tuple
 
 import cv2
 import numpy as np
 from PIL import Image
 
 
-def load_image_from_upload(uploaded_file) -> Optional[np.ndarray]:
+# OpenCV read flags for each supported reduce_factor. The reduced modes
+# let libjpeg scale the DCT blocks while decoding, so a JPEG decoded at 1/8
+# scale costs a fraction of a full decode. EXIF orientation is ignored to
+# match what Pillow returns.
+_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def _jpeg_components(data: bytes) -> Optional[int]:
+    """
+    Number of color components in a JPEG (1 gray, 3 YCbCr, 4 CMYK/YCCK),
+    read from its start-of-frame marker, or None if it cannot be found.
+    """
+    position = 2
+    while position + 4 <= len(data):
+        if data[position] != 0xFF:
+            return None
+        marker = data[position + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker.
+            position += 1
+            continue
+        length = int.from_bytes(data[position + 2:position + 4], "big")
+        # SOF0-SOF15, except DHT (C4), JPG (C8) and DAC (CC).
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            return data[position + 9] if position + 9 < len(data) else None
+        position += 2 + length
+    return None
+
+
+def _opencv_decodes_like_pil(data: bytes) -> bool:
+    """
+    True for images where OpenCV returns the same pixels as Pillow: 8-bit
+    PNG, YCbCr or gray JPEG, WebP and BMP. Others go to Pillow, e.g. TIFF
+    with alpha, 16-bit PNG (OpenCV scales it to 8 bits, Pillow clips it)
+    and CMYK JPEG (the two convert CMYK to RGB differently).
+    """
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        # The bit depth is the first byte after the IHDR width and height.
+        return len(data) > 24 and data[24] <= 8
+    if data.startswith(b"\xff\xd8\xff"):
+        return _jpeg_components(data) in (1, 3)
+    return data.startswith(b"BM") or (data[:4] == b"RIFF" and data[8:12] == b"WEBP")
+
+
+def _decode_with_opencv(data: bytes, reduce_factor: int) -> Optional[np.ndarray]:
+    if not _opencv_decodes_like_pil(data):
+        return None
+    # frombuffer wraps the bytes without copying them.
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    try:
+        image = cv2.imdecode(buffer, _DECODE_FLAGS[reduce_factor] | cv2.IMREAD_IGNORE_ORIENTATION)
+    except cv2.error:
+        return None
+    if image is None:
+        return None
+    # Swap BGR to RGB in place instead of allocating a second frame.
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
+
+
+def _decode_with_pil(data: bytes, reduce_factor: int) -> np.ndarray:
+    with Image.open(io.BytesIO(data)) as pil_image:
+        if reduce_factor > 1:
+            width, height = pil_image.size
+            target = (-(-width // reduce_factor), -(-height // reduce_factor))
+            # For JPEG, draft() picks the DCT scale; other formats ignore it.
+            pil_image.draft("RGB", target)
+            pil_image = pil_image.convert("RGB")
+            if pil_image.size != target:
+                pil_image = pil_image.resize(target, Image.Resampling.BOX)
+        else:
+            pil_image = pil_image.convert("RGB")
+        return np.array(pil_image)
+
+
+def load_image_from_upload(uploaded_file, reduce_factor: int = 1) -> Optional[np.ndarray]:
     """
     Read an uploaded file from Streamlit's file_uploader and convert it
     to an OpenCV-compatible image (NumPy array in RGB format).
 
+    The bytes are decoded directly by OpenCV, which is faster than going
+    through Pillow and avoids extra full-frame copies. Pillow is used as a
+    fallback for formats that OpenCV cannot read, and for images that
+    OpenCV would decode to different pixels (see _opencv_decodes_like_pil).
+
+    Args:
+        uploaded_file: file-like object with a read() method.
+        reduce_factor: 1, 2, 4 or 8. Larger values decode the image at
+            1/reduce_factor of its size, which is much faster for JPEGs
+            and is meant for previews and thumbnails.
+
     Returns:
         image (np.ndarray) in RGB format or None if something goes wrong.
     """
+    if reduce_factor not in _DECODE_FLAGS:
+        raise ValueError(f"reduce_factor must be one of {sorted(_DECODE_FLAGS)}, got {reduce_factor}")
     if uploaded_file is None:
         return None
 
     try:
         image_bytes = uploaded_file.read()
-        pil_image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-        image = np.array(pil_image)
+        image = _decode_with_opencv(image_bytes, reduce_factor)
+        if image is None:
+            image = _decode_with_pil(image_bytes, reduce_factor)
         return image
     except Exception:
         return None
@@ -29,18 +127,302 @@ def load_image_from_upload(uploaded_file) -> Optional[np.ndarray]:
 def cv2_to_pil(image: np.ndarray) -> Image.Image:
     """
     Convert a NumPy RGB image into a Pillow Image for download or display.
+    Single-channel (H, W) images become grayscale ("L") Pillow images.
     """
     return Image.fromarray(image)
 
 
-def pil_to_bytes(pil_image: Image.Image, format: str = "PNG") -> bytes:
+# Download formats: Pillow format name -> (file extension, MIME type).
+DOWNLOAD_FORMATS = {
+    "PNG": ("png", "image/png"),
+    "JPEG": ("jpg", "image/jpeg"),
+    "WEBP": ("webp", "image/webp"),
+}
+
+
+def pil_to_bytes(
+    pil_image: Image.Image,
+    format: str = "PNG",
+    quality: Optional[int] = None,
+    compress_level: Optional[int] = None,
+    lossless: bool = False,
+) -> bytes:
     """
     Convert a Pillow Image into raw bytes so it can be used
     with Streamlit's download_button.
+
+    Args:
+        format: Pillow format name (PNG, JPEG, WEBP, ...).
+        quality: JPEG/WebP quality (1-100); Pillow's default when None.
+        compress_level: PNG compression level (0 = fastest, 9 = smallest).
+        lossless: store WebP without loss (quality then controls effort).
     """
+    options = {}
+    kind = format.upper()
+    if kind == "PNG" and compress_level is not None:
+        options["compress_level"] = compress_level
+    if kind in ("JPEG", "WEBP") and quality is not None:
+        options["quality"] = quality
+    if kind == "WEBP" and lossless:
+        options["lossless"] = True
+
     buffer = io.BytesIO()
-    pil_image.save(buffer, format=format)
-    buffer.seek(0)
-    return buffer.read()
+    pil_image.save(buffer, format=format, **options)
+    return buffer.getvalue()
+
+
+def encode_image(image: np.ndarray, format: str = "PNG", **options) -> bytes:
+    """
+    Encode a NumPy image in the given format; see pil_to_bytes for options.
+    """
+    return pil_to_bytes(cv2_to_pil(image), format=format, **options)
+
+
+# Width (in pixels) of the renditions shown in the page columns. Two columns
+# of a wide layout are well below this even on high-density screens.
+PREVIEW_WIDTH = 960
+PREVIEW_QUALITY = 85
+
 
+def make_preview(image: np.ndarray, width: int = PREVIEW_WIDTH, quality: int = PREVIEW_QUALITY) -> bytes:
+    """
+    Encode a small JPEG rendition of an image for display with st.image.
+
+    The image is downscaled to at most width pixels (INTER_AREA averages
+    the pixels that are dropped), so Streamlit ships a few hundred
+    kilobytes instead of re-encoding the full-resolution array. The image
+    itself is not modified; processing and downloads keep using it.
+    """
+    if image.ndim == 3 and image.shape[2] == 4:
+        image = image[:, :, :3]
+    if image.dtype != np.uint8:
+        # Stretch other depths (e.g. 16-bit, float or bool) to 0..255 for display.
+        image = cv2.normalize(image.astype(np.float32), None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+    height, current_width = image.shape[:2]
+    if current_width > width:
+        new_height = max(1, round(height * width / current_width))
+        image = cv2.resize(image, (width, new_height), interpolation=cv2.INTER_AREA)
+    return encode_image(np.ascontiguousarray(image), format="JPEG", quality=quality)
+
+
+# The disk cache is optional: it is enabled by pointing this environment
+# variable at a directory (which may be shared by several server processes).
+DISK_CACHE_DIR_ENV = "DIP_DISK_CACHE_DIR"
+DISK_CACHE_BYTES_ENV = "DIP_DISK_CACHE_BYTES"
+DEFAULT_DISK_CACHE_BYTES = 2 * 1024 * 1024 * 1024
+
+# When the cache is full, evict down to this fraction of the cap.
+EVICT_TO_FRACTION = 0.9
+
+# Temporary files older than this were left by a writer that crashed.
+STALE_TMP_SECONDS = 60 * 60
+
+
+class DiskArrayCache:
+    """
+    Content-addressed cache of NumPy arrays stored as .npy files.
 
+    Arrays are returned as read-only memory maps, so a hit costs almost
+    nothing until the pixels are actually used. The total size is capped and
+    the least recently used files are evicted first (a hit refreshes the
+    file's modification time).
+
+    Several processes may use the same directory: files are written under a
+    temporary name and renamed into place atomically, and eviction tolerates
+    files that another process already removed.
+
+    The total size is tracked as files are added; the directory is only
+    scanned when the cache is opened and when the tracked total exceeds the
+    cap. Eviction then goes down to EVICT_TO_FRACTION of the cap, so scans
+    stay rare. Scans also remove temporary files left by crashed writers.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_DISK_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._total_bytes = sum(size for _, size, _ in self._scan())
+
+    def _path(self, key: str) -> str:
+        name = hashlib.blake2b(key.encode(), digest_size=20).hexdigest()
+        return os.path.join(self.directory, f"{name}.npy")
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """
+        Return the cached array for key as a read-only memory map, or None.
+        """
+        path = self._path(key)
+        try:
+            array = np.load(path, mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            # Only the eviction order suffers (e.g. on a read-only mount).
+            pass
+        return array
+
+    def put(self, key: str, array: np.ndarray) -> None:
+        """
+        Store an array under key and evict old entries beyond the size cap.
+        """
+        if array.nbytes > self.max_bytes:
+            return
+        path = self._path(key)
+        handle = tempfile.NamedTemporaryFile(dir=self.directory, suffix=".tmp", delete=False)
+        try:
+            with handle:
+                np.save(handle, np.ascontiguousarray(array))
+            size = os.path.getsize(handle.name)
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            os.replace(handle.name, path)
+        except OSError:
+            if os.path.exists(handle.name):
+                os.remove(handle.name)
+            return
+        with self._lock:
+            self._total_bytes += size - replaced
+            over = self._total_bytes > self.max_bytes
+        if over:
+            self._evict()
+
+    def _scan(self) -> List[Tuple[float, int, str]]:
+        """
+        Return (mtime, size, path) for every cached file, and remove
+        temporary files that no writer has touched for a long time.
+        """
+        now = time.time()
+        entries = []
+        for entry in os.scandir(self.directory):
+            try:
+                info = entry.stat()
+                if entry.name.endswith(".npy"):
+                    entries.append((info.st_mtime, info.st_size, entry.path))
+                elif entry.name.endswith(".tmp") and now - info.st_mtime > STALE_TMP_SECONDS:
+                    os.remove(entry.path)
+            except OSError:
+                # Removed by another process in the meantime.
+                continue
+        return entries
+
+    def _evict(self) -> None:
+        entries = self._scan()
+        # Other processes may have added or removed files, so start from
+        # the real total.
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * EVICT_TO_FRACTION)
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # Already removed by another process, or still in use.
+                pass
+            total -= size
+        with self._lock:
+            self._total_bytes = total
+
+
+_disk_cache: Optional[DiskArrayCache] = None
+
+
+def get_disk_cache() -> Optional[DiskArrayCache]:
+    """
+    Return the shared disk cache, or None when it is not configured.
+    """
+    global _disk_cache
+    directory = os.environ.get(DISK_CACHE_DIR_ENV)
+    if not directory:
+        return None
+    if _disk_cache is None or _disk_cache.directory != directory:
+        max_bytes = int(os.environ.get(DISK_CACHE_BYTES_ENV, DEFAULT_DISK_CACHE_BYTES))
+        _disk_cache = DiskArrayCache(directory, max_bytes)
+    return _disk_cache
+
+
+# Optional memory-mapped image store. When this environment variable points
+# at a directory, uploads are decoded once into raw .npy files there, and
+# large originals and results are kept as read-only memory maps of those
+# files instead of private in-heap arrays. The OS page cache decides what
+# stays in RAM, and sessions that open the same file share its pages.
+IMAGE_STORE_DIR_ENV = "DIP_IMAGE_STORE_DIR"
+IMAGE_STORE_BYTES_ENV = "DIP_IMAGE_STORE_BYTES"
+DEFAULT_IMAGE_STORE_BYTES = 8 * 1024 * 1024 * 1024
+
+# Arrays smaller than this stay in memory; mapping them is not worth a file.
+MEMMAP_MIN_BYTES = 4 * 1024 * 1024
+
+_image_store: Optional[DiskArrayCache] = None
+
+
+def get_image_store() -> Optional[DiskArrayCache]:
+    """
+    Return the memory-mapped image store, or None when it is not configured.
+
+    Files are content-addressed, so the same upload or result is written
+    only once. Evicting a file that a session still maps is safe on POSIX
+    systems: the mapping stays valid until it is released.
+    """
+    global _image_store
+    directory = os.environ.get(IMAGE_STORE_DIR_ENV)
+    if not directory:
+        return None
+    if _image_store is None or _image_store.directory != directory:
+        max_bytes = int(os.environ.get(IMAGE_STORE_BYTES_ENV, DEFAULT_IMAGE_STORE_BYTES))
+        _image_store = DiskArrayCache(directory, max_bytes)
+    return _image_store
+
+
+def load_image_to_store(uploaded_file) -> Optional[np.ndarray]:
+    """
+    Like load_image_from_upload, but when the image store is configured the
+    upload is decoded only once (keyed by a hash of its bytes) and returned
+    as a read-only memory map of the stored array.
+    """
+    store = get_image_store()
+    if store is None or uploaded_file is None:
+        return load_image_from_upload(uploaded_file)
+
+    data = uploaded_file.read()
+    key = "upload:" + hashlib.blake2b(data, digest_size=20).hexdigest()
+    image = store.get(key)
+    if image is not None:
+        return image
+
+    image = load_image_from_upload(io.BytesIO(data))
+    if image is None:
+        return None
+    store.put(key, image)
+    stored = store.get(key)
+    return stored if stored is not None else image
+
+
+def to_memmap(image: np.ndarray, key: Optional[str] = None) -> np.ndarray:
+    """
+    Return a read-only memory map of the image from the image store.
+
+    The image itself is returned when the store is not configured, when it
+    is already a memory map, or when it is small. key identifies the
+    content (e.g. processing.cache.image_digest); it is computed from the
+    pixels when not given.
+    """
+    store = get_image_store()
+    if store is None or isinstance(image, np.memmap) or image.nbytes < MEMMAP_MIN_BYTES:
+        return image
+    if key is None:
+        hasher = hashlib.blake2b(digest_size=20)
+        hasher.update(f"{image.shape}|{image.dtype.str}|".encode())
+        hasher.update(memoryview(np.ascontiguousarray(image)).cast("B"))
+        key = hasher.hexdigest()
+    key = "array:" + key
+    stored = store.get(key)
+    if stored is None:
+        store.put(key, image)
+        stored = store.get(key)
+    return stored if stored is not None else image
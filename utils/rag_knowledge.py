@@ -3,17 +3,17 @@ KNOWLEDGE_BASE = {
     "upload": "### Home Page (Main Entry Point)\n- **Purpose**: Image upload and global comparison view\n- **Features**:\n  - Upload images (PNG, JPG, JPEG, WEBP formats)\n  - View original vs processed image side-by-side\n  - Reset to original image\n  - Download processed image as PNG\n- **Workflow**: Users must upload an image here first before accessing processing pages",
     "download": "### Home Page (Main Entry Point)\n- **Purpose**: Image upload and global comparison view\n- **Features**:\n  - Upload images (PNG, JPG, JPEG, WEBP formats)\n  - View original vs processed image side-by-side\n  - Reset to original image\n  - Download processed image as PNG\n- **Workflow**: Users must upload an image here first before accessing processing pages",
     
-    "basic": "### Page 1: Basic Operations\n- **Purpose**: Pixel-level transformations\n- **Operations**:\n  1. **Convert to Grayscale**: Converts RGB image to grayscale (displayed as RGB for comparison)\n  2. **Invert Colors (Negative)**: Creates a negative image by inverting all pixel values (255 - pixel)\n- **No parameters required** - simple one-click operations",
-    "grayscale": "### Page 1: Basic Operations\n- **Purpose**: Pixel-level transformations\n- **Operations**:\n  1. **Convert to Grayscale**: Converts RGB image to grayscale (displayed as RGB for comparison)\n  2. **Invert Colors (Negative)**: Creates a negative image by inverting all pixel values (255 - pixel)\n- **No parameters required** - simple one-click operations",
-    "invert": "### Page 1: Basic Operations\n- **Purpose**: Pixel-level transformations\n- **Operations**:\n  1. **Convert to Grayscale**: Converts RGB image to grayscale (displayed as RGB for comparison)\n  2. **Invert Colors (Negative)**: Creates a negative image by inverting all pixel values (255 - pixel)\n- **No parameters required** - simple one-click operations",
-    "negative": "### Page 1: Basic Operations\n- **Purpose**: Pixel-level transformations\n- **Operations**:\n  1. **Convert to Grayscale**: Converts RGB image to grayscale (displayed as RGB for comparison)\n  2. **Invert Colors (Negative)**: Creates a negative image by inverting all pixel values (255 - pixel)\n- **No parameters required** - simple one-click operations",
+    "basic": "### Page 1: Basic Operations\n- **Purpose**: Pixel-level transformations\n- **Operations**:\n  1. **Convert to Grayscale**: Converts RGB image to a single-channel grayscale image\n  2. **Invert Colors (Negative)**: Creates a negative image by inverting all pixel values (255 - pixel)\n- **No parameters required** - simple one-click operations",
+    "grayscale": "### Page 1: Basic Operations\n- **Purpose**: Pixel-level transformations\n- **Operations**:\n  1. **Convert to Grayscale**: Converts RGB image to a single-channel grayscale image\n  2. **Invert Colors (Negative)**: Creates a negative image by inverting all pixel values (255 - pixel)\n- **No parameters required** - simple one-click operations",
+    "invert": "### Page 1: Basic Operations\n- **Purpose**: Pixel-level transformations\n- **Operations**:\n  1. **Convert to Grayscale**: Converts RGB image to a single-channel grayscale image\n  2. **Invert Colors (Negative)**: Creates a negative image by inverting all pixel values (255 - pixel)\n- **No parameters required** - simple one-click operations",
+    "negative": "### Page 1: Basic Operations\n- **Purpose**: Pixel-level transformations\n- **Operations**:\n  1. **Convert to Grayscale**: Converts RGB image to a single-channel grayscale image\n  2. **Invert Colors (Negative)**: Creates a negative image by inverting all pixel values (255 - pixel)\n- **No parameters required** - simple one-click operations",
     
-    "filter": "### Page 2: Filtering (Smoothing and Noise Reduction)\n- **Purpose**: Apply blur filters to reduce noise and smooth images\n- **Kernel Size Parameter**: Slider (1-21, odd numbers only, default: 5)\n- **Operations**:\n  1. **Gaussian Blur**: Uses Gaussian distribution for smooth blurring\n  2. **Median Blur**: Effective for salt-and-pepper noise (requires kernel size ≥ 3)\n  3. **Average Blur**: Simple box filter averaging\n- **Note**: Kernel size must be odd for proper operation",
-    "blur": "### Page 2: Filtering (Smoothing and Noise Reduction)\n- **Purpose**: Apply blur filters to reduce noise and smooth images\n- **Kernel Size Parameter**: Slider (1-21, odd numbers only, default: 5)\n- **Operations**:\n  1. **Gaussian Blur**: Uses Gaussian distribution for smooth blurring\n  2. **Median Blur**: Effective for salt-and-pepper noise (requires kernel size ≥ 3)\n  3. **Average Blur**: Simple box filter averaging\n- **Note**: Kernel size must be odd for proper operation",
-    "gaussian": "### Page 2: Filtering (Smoothing and Noise Reduction)\n- **Purpose**: Apply blur filters to reduce noise and smooth images\n- **Kernel Size Parameter**: Slider (1-21, odd numbers only, default: 5)\n- **Operations**:\n  1. **Gaussian Blur**: Uses Gaussian distribution for smooth blurring\n  2. **Median Blur**: Effective for salt-and-pepper noise (requires kernel size ≥ 3)\n  3. **Average Blur**: Simple box filter averaging\n- **Note**: Kernel size must be odd for proper operation",
-    "median": "### Page 2: Filtering (Smoothing and Noise Reduction)\n- **Purpose**: Apply blur filters to reduce noise and smooth images\n- **Kernel Size Parameter**: Slider (1-21, odd numbers only, default: 5)\n- **Operations**:\n  1. **Gaussian Blur**: Uses Gaussian distribution for smooth blurring\n  2. **Median Blur**: Effective for salt-and-pepper noise (requires kernel size ≥ 3)\n  3. **Average Blur**: Simple box filter averaging\n- **Note**: Kernel size must be odd for proper operation",
-    "smooth": "### Page 2: Filtering (Smoothing and Noise Reduction)\n- **Purpose**: Apply blur filters to reduce noise and smooth images\n- **Kernel Size Parameter**: Slider (1-21, odd numbers only, default: 5)\n- **Operations**:\n  1. **Gaussian Blur**: Uses Gaussian distribution for smooth blurring\n  2. **Median Blur**: Effective for salt-and-pepper noise (requires kernel size ≥ 3)\n  3. **Average Blur**: Simple box filter averaging\n- **Note**: Kernel size must be odd for proper operation",
-    "noise": "### Page 2: Filtering (Smoothing and Noise Reduction)\n- **Purpose**: Apply blur filters to reduce noise and smooth images\n- **Kernel Size Parameter**: Slider (1-21, odd numbers only, default: 5)\n- **Operations**:\n  1. **Gaussian Blur**: Uses Gaussian distribution for smooth blurring\n  2. **Median Blur**: Effective for salt-and-pepper noise (requires kernel size ≥ 3)\n  3. **Average Blur**: Simple box filter averaging\n- **Note**: Kernel size must be odd for proper operation",
+    "filter": "### Page 2: Filtering (Smoothing and Noise Reduction)\n- **Purpose**: Apply blur filters to reduce noise and smooth images\n- **Kernel Size Parameter**: Slider (1-401, odd numbers only, default: 5; large Gaussian kernels use a fast approximation)\n- **Operations**:\n  1. **Gaussian Blur**: Uses Gaussian distribution for smooth blurring\n  2. **Median Blur**: Effective for salt-and-pepper noise (requires kernel size ≥ 3)\n  3. **Average Blur**: Simple box filter averaging\n- **Note**: Kernel size must be odd for proper operation",
+    "blur": "### Page 2: Filtering (Smoothing and Noise Reduction)\n- **Purpose**: Apply blur filters to reduce noise and smooth images\n- **Kernel Size Parameter**: Slider (1-401, odd numbers only, default: 5; large Gaussian kernels use a fast approximation)\n- **Operations**:\n  1. **Gaussian Blur**: Uses Gaussian distribution for smooth blurring\n  2. **Median Blur**: Effective for salt-and-pepper noise (requires kernel size ≥ 3)\n  3. **Average Blur**: Simple box filter averaging\n- **Note**: Kernel size must be odd for proper operation",
+    "gaussian": "### Page 2: Filtering (Smoothing and Noise Reduction)\n- **Purpose**: Apply blur filters to reduce noise and smooth images\n- **Kernel Size Parameter**: Slider (1-401, odd numbers only, default: 5; large Gaussian kernels use a fast approximation)\n- **Operations**:\n  1. **Gaussian Blur**: Uses Gaussian distribution for smooth blurring\n  2. **Median Blur**: Effective for salt-and-pepper noise (requires kernel size ≥ 3)\n  3. **Average Blur**: Simple box filter averaging\n- **Note**: Kernel size must be odd for proper operation",
+    "median": "### Page 2: Filtering (Smoothing and Noise Reduction)\n- **Purpose**: Apply blur filters to reduce noise and smooth images\n- **Kernel Size Parameter**: Slider (1-401, odd numbers only, default: 5; large Gaussian kernels use a fast approximation)\n- **Operations**:\n  1. **Gaussian Blur**: Uses Gaussian distribution for smooth blurring\n  2. **Median Blur**: Effective for salt-and-pepper noise (requires kernel size ≥ 3)\n  3. **Average Blur**: Simple box filter averaging\n- **Note**: Kernel size must be odd for proper operation",
+    "smooth": "### Page 2: Filtering (Smoothing and Noise Reduction)\n- **Purpose**: Apply blur filters to reduce noise and smooth images\n- **Kernel Size Parameter**: Slider (1-401, odd numbers only, default: 5; large Gaussian kernels use a fast approximation)\n- **Operations**:\n  1. **Gaussian Blur**: Uses Gaussian distribution for smooth blurring\n  2. **Median Blur**: Effective for salt-and-pepper noise (requires kernel size ≥ 3)\n  3. **Average Blur**: Simple box filter averaging\n- **Note**: Kernel size must be odd for proper operation",
+    "noise": "### Page 2: Filtering (Smoothing and Noise Reduction)\n- **Purpose**: Apply blur filters to reduce noise and smooth images\n- **Kernel Size Parameter**: Slider (1-401, odd numbers only, default: 5; large Gaussian kernels use a fast approximation)\n- **Operations**:\n  1. **Gaussian Blur**: Uses Gaussian distribution for smooth blurring\n  2. **Median Blur**: Effective for salt-and-pepper noise (requires kernel size ≥ 3)\n  3. **Average Blur**: Simple box filter averaging\n- **Note**: Kernel size must be odd for proper operation",
     
     "edge": "### Page 3: Edge Detection\n- **Purpose**: Detect edges and boundaries in images\n- **Canny Parameters**:\n  - Threshold1: Slider (0-255, default: 100)\n  - Threshold2: Slider (0-255, default: 200)\n- **Operations**:\n  1. **Sobel**: Detects edges using gradient in X and Y directions\n  2. **Laplacian**: Second-order derivative edge detection\n  3. **Canny**: Advanced edge detector with two thresholds for better control\n- **Note**: Sobel and Laplacian have no parameters; Canny uses the threshold sliders",
     "sobel": "### Page 3: Edge Detection\n- **Purpose**: Detect edges and boundaries in images\n- **Canny Parameters**:\n  - Threshold1: Slider (0-255, default: 100)\n  - Threshold2: Slider (0-255, default: 200)\n- **Operations**:\n  1. **Sobel**: Detects edges using gradient in X and Y directions\n  2. **Laplacian**: Second-order derivative edge detection\n  3. **Canny**: Advanced edge detector with two thresholds for better control\n- **Note**: Sobel and Laplacian have no parameters; Canny uses the threshold sliders",
@@ -24,11 +24,11 @@ KNOWLEDGE_BASE = {
     "binary": "### Page 4: Thresholding\n- **Purpose**: Convert images to binary (black/white) based on intensity thresholds\n- **Global Threshold Parameter**: Slider (0-255, default: 127)\n- **Adaptive Threshold Parameters**:\n  - Block Size: Slider (3-51, odd numbers, default: 11)\n  - C Value: Slider (-20 to 20, default: 2) - subtracted from mean\n- **Operations**:\n  1. **Global Threshold**: Single threshold value for entire image\n  2. **Adaptive Mean**: Calculates threshold locally using mean of neighborhood\n  3. **Adaptive Gaussian**: Calculates threshold locally using Gaussian-weighted sum\n- **Use Cases**: Global works well for uniform lighting; Adaptive works better for varying illumination",
     "adaptive": "### Page 4: Thresholding\n- **Purpose**: Convert images to binary (black/white) based on intensity thresholds\n- **Global Threshold Parameter**: Slider (0-255, default: 127)\n- **Adaptive Threshold Parameters**:\n  - Block Size: Slider (3-51, odd numbers, default: 11)\n  - C Value: Slider (-20 to 20, default: 2) - subtracted from mean\n- **Operations**:\n  1. **Global Threshold**: Single threshold value for entire image\n  2. **Adaptive Mean**: Calculates threshold locally using mean of neighborhood\n  3. **Adaptive Gaussian**: Calculates threshold locally using Gaussian-weighted sum\n- **Use Cases**: Global works well for uniform lighting; Adaptive works better for varying illumination",
     
-    "morphology": "### Page 5: Morphological Operations\n- **Purpose**: Shape-based image processing operations\n- **Parameters**:\n  - Kernel Size: Slider (1-21, odd numbers, default: 3)\n  - Iterations: Slider (1-5, default: 1)\n- **Operations**:\n  1. **Erosion**: Shrinks objects, removes small noise\n  2. **Dilation**: Expands objects, fills holes\n  3. **Opening**: Erosion followed by dilation (removes noise, preserves shape)\n  4. **Closing**: Dilation followed by erosion (fills gaps, preserves shape)\n- **Use Cases**: Useful for binary images, noise removal, shape analysis",
-    "erosion": "### Page 5: Morphological Operations\n- **Purpose**: Shape-based image processing operations\n- **Parameters**:\n  - Kernel Size: Slider (1-21, odd numbers, default: 3)\n  - Iterations: Slider (1-5, default: 1)\n- **Operations**:\n  1. **Erosion**: Shrinks objects, removes small noise\n  2. **Dilation**: Expands objects, fills holes\n  3. **Opening**: Erosion followed by dilation (removes noise, preserves shape)\n  4. **Closing**: Dilation followed by erosion (fills gaps, preserves shape)\n- **Use Cases**: Useful for binary images, noise removal, shape analysis",
-    "dilation": "### Page 5: Morphological Operations\n- **Purpose**: Shape-based image processing operations\n- **Parameters**:\n  - Kernel Size: Slider (1-21, odd numbers, default: 3)\n  - Iterations: Slider (1-5, default: 1)\n- **Operations**:\n  1. **Erosion**: Shrinks objects, removes small noise\n  2. **Dilation**: Expands objects, fills holes\n  3. **Opening**: Erosion followed by dilation (removes noise, preserves shape)\n  4. **Closing**: Dilation followed by erosion (fills gaps, preserves shape)\n- **Use Cases**: Useful for binary images, noise removal, shape analysis",
-    "opening": "### Page 5: Morphological Operations\n- **Purpose**: Shape-based image processing operations\n- **Parameters**:\n  - Kernel Size: Slider (1-21, odd numbers, default: 3)\n  - Iterations: Slider (1-5, default: 1)\n- **Operations**:\n  1. **Erosion**: Shrinks objects, removes small noise\n  2. **Dilation**: Expands objects, fills holes\n  3. **Opening**: Erosion followed by dilation (removes noise, preserves shape)\n  4. **Closing**: Dilation followed by erosion (fills gaps, preserves shape)\n- **Use Cases**: Useful for binary images, noise removal, shape analysis",
-    "closing": "### Page 5: Morphological Operations\n- **Purpose**: Shape-based image processing operations\n- **Parameters**:\n  - Kernel Size: Slider (1-21, odd numbers, default: 3)\n  - Iterations: Slider (1-5, default: 1)\n- **Operations**:\n  1. **Erosion**: Shrinks objects, removes small noise\n  2. **Dilation**: Expands objects, fills holes\n  3. **Opening**: Erosion followed by dilation (removes noise, preserves shape)\n  4. **Closing**: Dilation followed by erosion (fills gaps, preserves shape)\n- **Use Cases**: Useful for binary images, noise removal, shape analysis",
+    "morphology": "### Page 5: Morphological Operations\n- **Purpose**: Shape-based image processing operations\n- **Parameters**:\n  - Kernel Shape: Rectangle, Ellipse, Cross, Horizontal line or Vertical line (default: Rectangle)\n  - Kernel Size: Slider (1-151, odd numbers, default: 3)\n  - Iterations: Slider (1-5, default: 1)\n- **Operations**:\n  1. **Erosion**: Shrinks objects, removes small noise\n  2. **Dilation**: Expands objects, fills holes\n  3. **Opening**: Erosion followed by dilation (removes noise, preserves shape)\n  4. **Closing**: Dilation followed by erosion (fills gaps, preserves shape)\n- **Use Cases**: Useful for binary images, noise removal, shape analysis",
+    "erosion": "### Page 5: Morphological Operations\n- **Purpose**: Shape-based image processing operations\n- **Parameters**:\n  - Kernel Shape: Rectangle, Ellipse, Cross, Horizontal line or Vertical line (default: Rectangle)\n  - Kernel Size: Slider (1-151, odd numbers, default: 3)\n  - Iterations: Slider (1-5, default: 1)\n- **Operations**:\n  1. **Erosion**: Shrinks objects, removes small noise\n  2. **Dilation**: Expands objects, fills holes\n  3. **Opening**: Erosion followed by dilation (removes noise, preserves shape)\n  4. **Closing**: Dilation followed by erosion (fills gaps, preserves shape)\n- **Use Cases**: Useful for binary images, noise removal, shape analysis",
+    "dilation": "### Page 5: Morphological Operations\n- **Purpose**: Shape-based image processing operations\n- **Parameters**:\n  - Kernel Shape: Rectangle, Ellipse, Cross, Horizontal line or Vertical line (default: Rectangle)\n  - Kernel Size: Slider (1-151, odd numbers, default: 3)\n  - Iterations: Slider (1-5, default: 1)\n- **Operations**:\n  1. **Erosion**: Shrinks objects, removes small noise\n  2. **Dilation**: Expands objects, fills holes\n  3. **Opening**: Erosion followed by dilation (removes noise, preserves shape)\n  4. **Closing**: Dilation followed by erosion (fills gaps, preserves shape)\n- **Use Cases**: Useful for binary images, noise removal, shape analysis",
+    "opening": "### Page 5: Morphological Operations\n- **Purpose**: Shape-based image processing operations\n- **Parameters**:\n  - Kernel Shape: Rectangle, Ellipse, Cross, Horizontal line or Vertical line (default: Rectangle)\n  - Kernel Size: Slider (1-151, odd numbers, default: 3)\n  - Iterations: Slider (1-5, default: 1)\n- **Operations**:\n  1. **Erosion**: Shrinks objects, removes small noise\n  2. **Dilation**: Expands objects, fills holes\n  3. **Opening**: Erosion followed by dilation (removes noise, preserves shape)\n  4. **Closing**: Dilation followed by erosion (fills gaps, preserves shape)\n- **Use Cases**: Useful for binary images, noise removal, shape analysis",
+    "closing": "### Page 5: Morphological Operations\n- **Purpose**: Shape-based image processing operations\n- **Parameters**:\n  - Kernel Shape: Rectangle, Ellipse, Cross, Horizontal line or Vertical line (default: Rectangle)\n  - Kernel Size: Slider (1-151, odd numbers, default: 3)\n  - Iterations: Slider (1-5, default: 1)\n- **Operations**:\n  1. **Erosion**: Shrinks objects, removes small noise\n  2. **Dilation**: Expands objects, fills holes\n  3. **Opening**: Erosion followed by dilation (removes noise, preserves shape)\n  4. **Closing**: Dilation followed by erosion (fills gaps, preserves shape)\n- **Use Cases**: Useful for binary images, noise removal, shape analysis",
     
     "enhancement": "### Page 6: Image Enhancement\n- **Purpose**: Improve image quality and contrast\n- **Operations**:\n  1. **Histogram Equalization**: Improves global contrast by redistributing pixel intensities (applied in YCrCb color space)\n  2. **Show Histogram**: Displays RGB channel histograms for analysis\n  3. **Sharpening**: Enhances edges using a 3x3 sharpening kernel\n- **No parameters required** - direct operations",
     "enhance": "### Page 6: Image Enhancement\n- **Purpose**: Improve image quality and contrast\n- **Operations**:\n  1. **Histogram Equalization**: Improves global contrast by redistributing pixel intensities (applied in YCrCb color space)\n  2. **Show Histogram**: Displays RGB channel histograms for analysis\n  3. **Sharpening**: Enhances edges using a 3x3 sharpening kernel\n- **No parameters required** - direct operations",
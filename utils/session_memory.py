@@ -0,0 +1,398 @@
+"""
+Per-session memory accounting for the images kept in session_state.
+
+Every Streamlit session registers its images here. The registry tracks how
+many bytes each session holds and enforces a global budget for the whole
+server process: when the budget is exceeded, the images of the sessions
+that have been idle the longest are spilled to disk. A spilled image is
+loaded back lazily the next time its session asks for it.
+
+Each session also has a scratch dict for data that can be recomputed
+(derived planes, preview renditions, encoded downloads). The scratch data
+of a spilled session is dropped, since derived planes keep a reference to
+the image. The process-wide result cache (processing.cache) counts toward
+the budget as well: its entries for spilled images are removed, and its
+oldest entries are evicted if spilling sessions is not enough.
+
+Only memory that was really released is reported as freed: an array
+still used elsewhere (e.g. by another session) stays alive and does not
+count.
+
+Spill files are written to a directory of their own per server process,
+which is removed when the process exits. Directories left behind by
+processes that were killed are removed by the next process that spills.
+
+Images that are memory maps of files in the image store (see
+utils.image_io.to_memmap) are not counted: their pages belong to the OS
+page cache, which can drop them at any time and shares them between
+sessions. They are never spilled either, since they are already on disk.
+"""
+
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from processing.cache import get_result_cache
+
+MEMORY_BUDGET_ENV = "DIP_MEMORY_BUDGET_BYTES"
+DEFAULT_MEMORY_BUDGET = 2 * 1024 * 1024 * 1024
+SPILL_DIR = os.path.join(tempfile.gettempdir(), "dip_spill")
+
+_spill_dir: Optional[str] = None
+_spill_dir_lock = threading.Lock()
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # e.g. owned by another user: it exists.
+        return True
+    return True
+
+
+def _remove_stale_spills() -> None:
+    """
+    Remove spill directories of server processes that no longer run.
+    """
+    for entry in os.scandir(SPILL_DIR):
+        owner = entry.name.split("-", 1)[0]
+        if entry.is_dir() and owner.isdigit() and not _process_alive(int(owner)):
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def spill_dir() -> str:
+    """
+    Directory for the spill files of this process, created on first use
+    and removed when the process exits.
+    """
+    global _spill_dir
+    with _spill_dir_lock:
+        if _spill_dir is None or not os.path.isdir(_spill_dir):
+            os.makedirs(SPILL_DIR, exist_ok=True)
+            _remove_stale_spills()
+            _spill_dir = tempfile.mkdtemp(prefix=f"{os.getpid()}-", dir=SPILL_DIR)
+            atexit.register(shutil.rmtree, _spill_dir, True)
+        return _spill_dir
+
+
+class SpillableImage:
+    """
+    Holder for one session image that can be moved to disk while its
+    session is idle and transparently loaded back when it is used again.
+    """
+
+    def __init__(self, image: np.ndarray):
+        self._image: Optional[np.ndarray] = image
+        self._path: Optional[str] = None
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Bytes currently held in memory (0 while spilled or memory-mapped).
+        """
+        image = self._image
+        return 0 if image is None or isinstance(image, np.memmap) else image.nbytes
+
+    @property
+    def spilled(self) -> bool:
+        return self._image is None
+
+    def peek(self) -> Optional[np.ndarray]:
+        """
+        Return the in-memory image without loading it, or None if spilled.
+        """
+        return self._image
+
+    def get(self) -> np.ndarray:
+        """
+        Return the image, loading it back from disk if it was spilled.
+        """
+        with self._lock:
+            if self._image is None:
+                image = np.load(self._path)
+                image.flags.writeable = False
+                self._image = image
+                self._remove_file()
+            return self._image
+
+    def spill(self) -> Optional[np.ndarray]:
+        """
+        Write the image to disk and drop this holder's reference to it.
+        Returns the array that was spilled (or None), so the caller can
+        remove other references and check whether the memory was released.
+        """
+        with self._lock:
+            image = self._image
+            if image is None or isinstance(image, np.memmap):
+                return None
+            path = os.path.join(spill_dir(), f"{uuid.uuid4().hex}.npy")
+            np.save(path, image)
+            self._path = path
+            self._image = None
+            return image
+
+    def _remove_file(self) -> None:
+        if self._path is not None:
+            try:
+                os.remove(self._path)
+            except OSError:
+                pass
+            self._path = None
+
+    def __del__(self):
+        self._remove_file()
+
+
+def _value_bytes(value) -> int:
+    """
+    Approximate memory held by a scratch value.
+    """
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(_value_bytes(item) for item in value.values())
+    nbytes = getattr(value, "nbytes", 0)
+    return nbytes if isinstance(nbytes, int) else 0
+
+
+class SessionScratch(dict):
+    """
+    Per-session data that can be recomputed at any time. It is dropped
+    when the session is spilled.
+    """
+
+    def nbytes(self) -> int:
+        return sum(_value_bytes(value) for value in list(self.values()))
+
+
+class _SessionRecord:
+    def __init__(self):
+        self.last_seen = time.monotonic()
+        self.images: Dict[str, SpillableImage] = {}
+        self.scratch = SessionScratch()
+        self.extra_bytes = 0
+
+    def holders(self) -> List[SpillableImage]:
+        # Several keys may share one holder (e.g. original and processed).
+        return list({id(holder): holder for holder in self.images.values()}.values())
+
+    def image_bytes(self) -> int:
+        return sum(holder.nbytes for holder in self.holders())
+
+    def total_bytes(self) -> int:
+        return self.image_bytes() + self.scratch.nbytes() + self.extra_bytes
+
+
+class SessionMemoryRegistry:
+    """
+    Process-wide view of the memory held by every session.
+    """
+
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self._sessions: Dict[str, _SessionRecord] = {}
+        self._lock = threading.Lock()
+
+    def _record(self, session_id: str) -> _SessionRecord:
+        if session_id not in self._sessions:
+            self._sessions[session_id] = _SessionRecord()
+        return self._sessions[session_id]
+
+    def touch(self, session_id: str) -> None:
+        """
+        Mark the session as active right now.
+        """
+        with self._lock:
+            self._record(session_id).last_seen = time.monotonic()
+
+    def set_image(self, session_id: str, name: str, holder: Optional[SpillableImage]) -> None:
+        with self._lock:
+            record = self._record(session_id)
+            record.last_seen = time.monotonic()
+            if holder is None:
+                record.images.pop(name, None)
+            else:
+                record.images[name] = holder
+
+    def set_extra_bytes(self, session_id: str, nbytes: int) -> None:
+        """
+        Account for non-image data of a session (history, chat messages).
+        """
+        with self._lock:
+            self._record(session_id).extra_bytes = nbytes
+
+    def scratch(self, session_id: str) -> SessionScratch:
+        """
+        Return the scratch dict of the session (see SessionScratch).
+        """
+        with self._lock:
+            return self._record(session_id).scratch
+
+    def _total_locked(self) -> int:
+        """
+        Bytes held by all sessions plus the result cache. Arrays held by
+        a session and by the cache at the same time are counted once.
+        """
+        counted = set()
+        total = 0
+        for record in self._sessions.values():
+            for holder in record.holders():
+                image = holder.peek()
+                if image is not None and holder.nbytes:
+                    counted.add(id(image))
+                    total += image.nbytes
+            total += record.scratch.nbytes() + record.extra_bytes
+        for result in get_result_cache().arrays():
+            if id(result) not in counted and not isinstance(result, np.memmap):
+                counted.add(id(result))
+                total += result.nbytes
+        return total
+
+    def session_bytes(self, session_id: str) -> int:
+        with self._lock:
+            record = self._sessions.get(session_id)
+            return 0 if record is None else record.total_bytes()
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self._total_locked()
+
+    def forget_inactive(self) -> None:
+        """
+        Drop sessions that Streamlit no longer knows about (closed tabs).
+        """
+        try:
+            from streamlit.runtime import Runtime, exists
+
+            if not exists():
+                return
+            runtime = Runtime.instance()
+            with self._lock:
+                for session_id in list(self._sessions):
+                    if session_id != _LOCAL_SESSION and not runtime.is_active_session(session_id):
+                        del self._sessions[session_id]
+        except Exception:
+            # Accounting must never break the app if the runtime API changes.
+            return
+
+    def enforce_budget(self, current_session: str) -> int:
+        """
+        Spill the images of the least recently active sessions until the
+        process is back under budget, then evict the oldest result cache
+        entries if that was not enough. The current session is never
+        spilled. Returns the number of bytes actually released.
+
+        The sessions to spill are chosen under the lock, but the images are
+        written to disk after releasing it, so other sessions are not kept
+        waiting on the disk.
+        """
+        self.forget_inactive()
+        cache = get_result_cache()
+        with self._lock:
+            total = self._total_locked()
+            if total <= self.budget_bytes:
+                return 0
+            idle = sorted(
+                (record.last_seen, session_id, record)
+                for session_id, record in self._sessions.items()
+                if session_id != current_session
+            )
+            victims = []
+            expected = 0
+            for last_seen, _, record in idle:
+                if total - expected <= self.budget_bytes:
+                    break
+                victims.append((last_seen, record, record.holders()))
+                expected += record.total_bytes() - record.extra_bytes
+
+        freed = 0
+        for last_seen, record, holders in victims:
+            if record.last_seen != last_seen:
+                # The session became active again in the meantime.
+                continue
+            spilled = [image for image in (holder.spill() for holder in holders) if image is not None]
+            freed += record.scratch.nbytes()
+            record.scratch.clear()
+            # The result cache may still reference the spilled arrays.
+            cache.discard(spilled)
+            freed += _released_bytes(spilled)
+
+        while total - freed > self.budget_bytes:
+            evicted = [cache.evict_oldest()]
+            if evicted[0] is None:
+                break
+            freed += _released_bytes(evicted)
+        return freed
+
+    def report(self, session_id: Optional[str] = None) -> dict:
+        """
+        Summary of current usage for display.
+        """
+        with self._lock:
+            records = list(self._sessions.values())
+            current = self._sessions.get(session_id) if session_id is not None else None
+            return {
+                "sessions": len(records),
+                "spilled_sessions": sum(
+                    1 for record in records if any(holder.spilled for holder in record.images.values())
+                ),
+                "total_bytes": self._total_locked(),
+                "budget_bytes": self.budget_bytes,
+                "session_bytes": 0 if current is None else current.total_bytes(),
+            }
+
+
+def _buffer_owner(array: np.ndarray) -> np.ndarray:
+    """
+    The array that owns the memory of a view (stored images are read-only
+    views, see utils.state_manager._freeze).
+    """
+    while isinstance(array.base, np.ndarray):
+        array = array.base
+    return array
+
+
+def _released_bytes(arrays: List[np.ndarray]) -> int:
+    """
+    Drop the given references and return the bytes of the arrays that
+    were really freed, i.e. whose memory nothing else keeps alive.
+    """
+    refs = [(weakref.ref(_buffer_owner(array)), array.nbytes) for array in arrays]
+    arrays.clear()
+    return sum(nbytes for ref, nbytes in refs if ref() is None)
+
+
+# Used when code runs outside a Streamlit script (e.g. in a plain script).
+_LOCAL_SESSION = "local"
+
+_registry = SessionMemoryRegistry(int(os.environ.get(MEMORY_BUDGET_ENV, DEFAULT_MEMORY_BUDGET)))
+
+
+def get_registry() -> SessionMemoryRegistry:
+    return _registry
+
+
+def current_session_id() -> str:
+    """
+    Id of the Streamlit session running the current script.
+    """
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+        ctx = get_script_run_ctx(suppress_warning=True)
+    except Exception:
+        ctx = None
+    return ctx.session_id if ctx is not None else _LOCAL_SESSION
+
@@ -1,8 +1,25 @@
-from typing import Optional
+import zlib
+from collections import OrderedDict
+from typing import Optional, Tuple
 
+import cv2
 import numpy as np
 import streamlit as st
 
+from processing.cache import image_digest
+from processing.channels import DerivedPlanes
+from processing.pipeline import Recipe, Step
+from processing.proxy import proxy_factor
+from utils.image_io import MEMMAP_MIN_BYTES, encode_image, get_image_store, make_preview, to_memmap
+from utils.session_memory import SpillableImage, current_session_id, get_registry
+
+# Maximum number of compressed bytes kept in the undo/redo history of one
+# session. The oldest undo steps are dropped first when it is exceeded.
+HISTORY_BUDGET_BYTES = 64 * 1024 * 1024
+
+# Number of display renditions kept per session (see get_preview).
+PREVIEW_CACHE_ENTRIES = 6
+
 
 def init_state() -> None:
     """
@@ -13,45 +30,391 @@ def init_state() -> None:
         st.session_state["original_image"] = None
     if "processed_image" not in st.session_state:
         st.session_state["processed_image"] = None
+    if "undo_stack" not in st.session_state:
+        st.session_state["undo_stack"] = []
+    if "redo_stack" not in st.session_state:
+        st.session_state["redo_stack"] = []
+    if "recorded_steps" not in st.session_state:
+        st.session_state["recorded_steps"] = []
+    if "processed_version" not in st.session_state:
+        st.session_state["processed_version"] = 0
+    get_registry().touch(current_session_id())
+
+
+def _scratch() -> dict:
+    """
+    Recomputable data of this session (derived planes, preview renditions,
+    the encoded download). It lives in the memory registry rather than in
+    session_state so that it can be dropped when the session is spilled.
+    """
+    return get_registry().scratch(current_session_id())
+
+
+def _freeze(image: np.ndarray) -> np.ndarray:
+    """
+    Return a read-only view of an image so that it can be shared safely
+    instead of copied. Only the view is read-only: the caller's own array
+    stays writable. Processing functions always return new arrays, so
+    nothing needs to write into a stored image. Arrays that are already
+    read-only are returned as they are.
+    """
+    if not image.flags.writeable:
+        return image
+    view = image.view()
+    view.flags.writeable = False
+    return view
+
+
+def _store_image(key: str, image: Optional[np.ndarray]) -> None:
+    """
+    Store an image in session_state inside a SpillableImage holder and
+    register it for memory accounting. If the same array is already held
+    under another key, the holder is shared so the buffer is counted (and
+    spilled) only once.
+    """
+    holder = None
+    if image is not None:
+        image = _map_large(image)
+        for other_key in ("original_image", "processed_image"):
+            existing = st.session_state.get(other_key)
+            if isinstance(existing, SpillableImage) and existing.peek() is image:
+                holder = existing
+                break
+        if holder is None:
+            holder = SpillableImage(_freeze(image))
+
+    st.session_state[key] = holder
+    # Derived planes and encoded downloads belong to the previous image.
+    scratch = _scratch()
+    scratch.pop("derived_planes", None)
+    if key == "processed_image":
+        st.session_state["processed_version"] = st.session_state.get("processed_version", 0) + 1
+        scratch.pop("encoded_download", None)
+    session_id = current_session_id()
+    registry = get_registry()
+    registry.set_image(session_id, key, holder)
+    registry.enforce_budget(session_id)
+
+
+def _map_large(image: np.ndarray) -> np.ndarray:
+    """
+    Move a large image into the memory-mapped image store, if one is
+    configured (see utils.image_io.get_image_store).
+    """
+    if isinstance(image, np.memmap) or image.nbytes < MEMMAP_MIN_BYTES or get_image_store() is None:
+        return image
+    return to_memmap(image, key=image_digest(image))
+
+
+def _load_image(key: str) -> Optional[np.ndarray]:
+    """
+    Return the image stored under key, loading it back from disk if the
+    session was idle long enough to have it spilled.
+    """
+    holder = st.session_state.get(key)
+    if holder is None:
+        return None
+    return holder.get()
+
+
+def _update_accounting() -> None:
+    """
+    Report the non-image memory of this session that is not scratch data
+    (history and messages). Scratch data is measured by the registry.
+    """
+    message_bytes = sum(len(msg.get("content") or "") for msg in st.session_state.get("messages", []))
+    get_registry().set_extra_bytes(current_session_id(), get_history_bytes() + message_bytes)
 
 
-def set_original_image(image: np.ndarray) -> None:
+def get_memory_report() -> dict:
+    """
+    Memory usage of this session and of the whole server process.
+    """
+    return get_registry().report(current_session_id())
+
+
+def set_original_image(image: np.ndarray, upload_id: Optional[str] = None) -> None:
     """
     Store the original image and reset the processed image to the original.
+    Both keys share the same read-only buffer; a new array only appears when
+    an operation produces one. upload_id identifies the uploaded file the
+    image came from (see is_current_upload).
     """
-    st.session_state["original_image"] = image
-    st.session_state["processed_image"] = image.copy()
+    st.session_state["upload_id"] = upload_id
+    st.session_state["undo_stack"] = []
+    st.session_state["redo_stack"] = []
+    st.session_state["recorded_steps"] = []
+    _update_accounting()
+    # Map and freeze once, so that both keys share the same array.
+    image = _freeze(_map_large(image))
+    _store_image("original_image", image)
+    _store_image("processed_image", image)
+
+
+def is_current_upload(upload_id: str) -> bool:
+    """
+    True if the stored original image was loaded from this upload, so the
+    page can skip decoding it again (and keep the processing history).
+    """
+    return get_original_image() is not None and st.session_state.get("upload_id") == upload_id
 
 
 def get_original_image() -> Optional[np.ndarray]:
     """
     Convenience accessor for the original image.
     """
-    return st.session_state.get("original_image")
+    return _load_image("original_image")
 
 
 def get_processed_image() -> Optional[np.ndarray]:
     """
     Convenience accessor for the current processed image.
     """
-    return st.session_state.get("processed_image")
+    return _load_image("processed_image")
+
+
+def get_working_image() -> Optional[np.ndarray]:
+    """
+    The image the next operation should be applied to: the latest
+    processed result, or the original if nothing was processed yet.
+    """
+    processed = get_processed_image()
+    return processed if processed is not None else get_original_image()
+
 
+def get_preview(image: np.ndarray) -> bytes:
+    """
+    Return a downscaled JPEG rendition of an image for st.image.
 
-def set_processed_image(image: np.ndarray) -> None:
+    Renditions are cached per image content, so reruns that show the same
+    original or result do not resize and encode it again. Only the few
+    most recently shown renditions are kept.
+    """
+    key = image_digest(image)
+    cache = _scratch().setdefault("preview_cache", OrderedDict())
+    if key in cache:
+        cache.move_to_end(key)
+        return cache[key]
+    data = make_preview(image)
+    cache[key] = data
+    while len(cache) > PREVIEW_CACHE_ENTRIES:
+        cache.popitem(last=False)
+    return data
+
+
+def get_derived_plane(name: str) -> Optional[np.ndarray]:
+    """
+    Return a derived representation ("gray", "ycrcb", "sobel_x", "sobel_y")
+    of the working image. Planes are computed on first use and reused until
+    the working image changes, so trying several operations on the same
+    image pays for each conversion only once.
+    """
+    image = get_working_image()
+    if image is None:
+        return None
+    scratch = _scratch()
+    planes = scratch.get("derived_planes")
+    if planes is None or planes.image is not image:
+        planes = DerivedPlanes(image)
+        scratch["derived_planes"] = planes
+    plane = planes.get(name)
+    return plane
+
+
+def get_preview_image(gray: bool = False) -> Tuple[Optional[np.ndarray], int]:
+    """
+    Return (proxy, factor): a downscaled version of the working image for
+    live previews, and how many times smaller it is along each side.
+    Operations applied to the proxy should scale their kernel sizes by
+    factor (see processing.proxy.scale_kernel_size).
+    """
+    image = get_working_image()
+    if image is None:
+        return None, 1
+    proxy = get_derived_plane("proxy_gray" if gray else "proxy")
+    return proxy, proxy_factor(image.shape)
+
+
+def set_processed_image(image: np.ndarray, step: Optional[Step] = None) -> None:
     """
     Update the processed image in session_state.
+    The previous result is saved in the undo history.
+
+    step describes the operation (and parameters) that produced the image
+    from the previous one. It is appended to the recorded chain, which can
+    be replayed on other images (see get_recorded_recipe).
     """
-    st.session_state["processed_image"] = image
+    if image is get_processed_image():
+        return
+    _replace_processed(image, st.session_state.get("recorded_steps", []) + [step])
+
+
+def _replace_processed(image: np.ndarray, steps: list) -> None:
+    _push_history("undo_stack")
+    st.session_state["redo_stack"] = []
+    st.session_state["recorded_steps"] = steps
+    _update_accounting()
+    _store_image("processed_image", image)
 
 
 def reset_to_original() -> None:
     """
     Reset the processed image back to the original one.
     Does nothing if there is no original image.
+    The original is read-only, so it is shared rather than copied.
     """
     original = get_original_image()
-    if original is not None:
-        st.session_state["processed_image"] = original.copy()
+    if original is not None and original is not get_processed_image():
+        _replace_processed(original, [])
+
+
+def _download_key(format: str, options: dict) -> tuple:
+    return (st.session_state.get("processed_version", 0), format, tuple(sorted(options.items())))
+
+
+def get_cached_download(format: str = "PNG", **options) -> Optional[bytes]:
+    """
+    Return the processed image already encoded with these settings, or
+    None if it has not been prepared since the image last changed.
+    """
+    download = _scratch().get("encoded_download")
+    if download is not None and download["key"] == _download_key(format, options):
+        return download["data"]
+    return None
+
+
+def prepare_download(format: str = "PNG", **options) -> Optional[bytes]:
+    """
+    Encode the processed image for download (see utils.image_io.pil_to_bytes
+    for the options). The bytes are kept until the processed image or the
+    settings change, so reruns do not encode the same result again.
+    """
+    data = get_cached_download(format, **options)
+    if data is not None:
+        return data
+    processed = get_processed_image()
+    if processed is None:
+        return None
+    data = encode_image(processed, format=format, **options)
+    _scratch()["encoded_download"] = {"key": _download_key(format, options), "data": data}
+    return data
+
+
+def get_recorded_steps() -> list:
+    """
+    The steps that lead from the original image to the processed one.
+    Entries are None for results stored without a step.
+    """
+    return list(st.session_state.get("recorded_steps", []))
+
+
+def get_recorded_recipe() -> Optional[Recipe]:
+    """
+    The recorded chain as a Recipe, or None if nothing was recorded or
+    some result was stored without its step (so it cannot be replayed).
+    """
+    steps = get_recorded_steps()
+    if not steps or any(step is None for step in steps):
+        return None
+    return Recipe(steps)
+
+
+def _compress_snapshot(image: np.ndarray) -> dict:
+    """
+    Compress an image for the history. The original image is stored as a
+    marker only, since it is always kept in session_state anyway. 8/16-bit
+    images use fast PNG compression, anything else falls back to zlib.
+    """
+    if image is get_original_image():
+        return {"kind": "original", "nbytes": 0}
+
+    png_layout = image.ndim == 2 or (image.ndim == 3 and image.shape[2] in (3, 4))
+    if image.dtype in (np.uint8, np.uint16) and png_layout:
+        # PNG round-trips the channels unchanged, so no RGB/BGR swap is needed.
+        ok, encoded = cv2.imencode(".png", image, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+        if ok:
+            data = encoded.tobytes()
+            return {"kind": "png", "data": data, "nbytes": len(data)}
+
+    data = zlib.compress(np.ascontiguousarray(image).tobytes(), 1)
+    return {"kind": "zlib", "data": data, "nbytes": len(data), "shape": image.shape, "dtype": image.dtype.str}
+
+
+def _restore_snapshot(snapshot: dict) -> np.ndarray:
+    if snapshot["kind"] == "original":
+        return get_original_image()
+    if snapshot["kind"] == "png":
+        buffer = np.frombuffer(snapshot["data"], np.uint8)
+        return _freeze(cv2.imdecode(buffer, cv2.IMREAD_UNCHANGED))
+    flat = np.frombuffer(zlib.decompress(snapshot["data"]), dtype=snapshot["dtype"])
+    return _freeze(flat.reshape(snapshot["shape"]).copy())
+
+
+def get_history_bytes() -> int:
+    """
+    Number of compressed bytes currently held by the undo/redo history.
+    """
+    stacks = st.session_state.get("undo_stack", []) + st.session_state.get("redo_stack", [])
+    return sum(snapshot["nbytes"] for snapshot in stacks)
+
+
+def _push_history(stack_name: str) -> None:
+    """
+    Save the current processed image on the given history stack and drop
+    history steps while it exceeds its budget: the oldest undo steps
+    first, then the redo steps furthest from the current image.
+    """
+    current = get_processed_image()
+    if current is None:
+        return
+    snapshot = _compress_snapshot(current)
+    snapshot["steps"] = get_recorded_steps()
+    st.session_state.setdefault(stack_name, []).append(snapshot)
+
+    undo_stack = st.session_state.setdefault("undo_stack", [])
+    redo_stack = st.session_state.setdefault("redo_stack", [])
+    while get_history_bytes() > HISTORY_BUDGET_BYTES:
+        if undo_stack:
+            undo_stack.pop(0)
+        elif redo_stack:
+            redo_stack.pop(0)
+        else:
+            break
+
+
+def can_undo() -> bool:
+    return bool(st.session_state.get("undo_stack"))
+
+
+def can_redo() -> bool:
+    return bool(st.session_state.get("redo_stack"))
+
+
+def undo() -> None:
+    """
+    Go back one step in the processing chain. Does nothing if there is no
+    earlier step.
+    """
+    if not can_undo():
+        return
+    snapshot = st.session_state["undo_stack"].pop()
+    _push_history("redo_stack")
+    st.session_state["recorded_steps"] = snapshot["steps"]
+    _update_accounting()
+    _store_image("processed_image", _restore_snapshot(snapshot))
+
+
+def redo() -> None:
+    """
+    Re-apply the last undone step. Does nothing if nothing was undone.
+    """
+    if not can_redo():
+        return
+    snapshot = st.session_state["redo_stack"].pop()
+    _push_history("undo_stack")
+    st.session_state["recorded_steps"] = snapshot["steps"]
+    _update_accounting()
+    _store_image("processed_image", _restore_snapshot(snapshot))
 
 
 def get_messages() -> list[dict]:
@@ -65,4 +428,5 @@ def set_messages(messages: list[dict]) -> None:
     """
     Update the messages in session_state.
     """
-    st.session_state["messages"] = messages
\ No newline at end of file
+    st.session_state["messages"] = messages
+    _update_accounting()
\ No newline at end of file